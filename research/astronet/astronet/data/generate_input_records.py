@@ -78,9 +78,11 @@ from __future__ import division
 from __future__ import print_function
 
 import argparse
+import collections
 import multiprocessing
 import os
 import sys
+import time
 
 import numpy as np
 import pandas as pd
@@ -126,10 +128,34 @@ parser.add_argument(
     default=5,
     help="Number of subprocesses for processing the TCEs in parallel.")
 
+parser.add_argument(
+    "--spline_cache_dir",
+    type=str,
+    default=None,
+    help="Optional directory in which to cache the spline-normalized light "
+    "curve of each Kepler target star. TCEs on the same star reuse the cached "
+    "light curve instead of refitting the spline, including across runs.")
+
+parser.add_argument(
+    "--overwrite_existing_shards",
+    action="store_true",
+    help="Whether to process again the file shards that already exist in "
+    "output_dir. By default they are skipped, so that an interrupted run can "
+    "be resumed.")
+
+parser.add_argument(
+    "--log_every_n",
+    type=int,
+    default=100,
+    help="Log progress and throughput every this many processed TCEs.")
+
 # Name and values of the column in the input CSV file to use as training labels.
 _LABEL_COLUMN = "av_training_set"
 _ALLOWED_LABELS = {"PC", "AFP", "NTP"}
 
+# Stages of the processing of the TCEs whose times are logged.
+_STAGES = ("light_curve", "views", "serialize", "write")
+
 
 def _set_float_feature(ex, name, value):
   """Sets the value of a float feature in a tensorflow.train.Example proto."""
@@ -149,21 +175,36 @@ def _set_int64_feature(ex, name, value):
   ex.features.feature[name].int64_list.value.extend([int(v) for v in value])
 
 
-def _process_tce(tce):
-  """Processes the light curve for a Kepler TCE and returns an Example proto.
+def _read_light_curve(kepid):
+  """Reads and normalizes the light curve of a Kepler target star.
 
   Args:
-    tce: Row of the input TCE table.
+    kepid: Kepler ID of the target star.
 
   Returns:
-    A tensorflow.train.Example proto containing TCE features.
+    time: 1D NumPy array; the time values of the light curve.
+    flux: 1D NumPy array; the normalized flux values of the light curve.
 
   Raises:
     IOError: If the light curve files for this Kepler ID cannot be found.
   """
-  # Read and process the light curve.
-  time, flux = preprocess.read_and_process_light_curve(tce.kepid,
-                                                       FLAGS.kepler_data_dir)
+  if FLAGS.spline_cache_dir:
+    return preprocess.read_and_process_light_curve_cached(
+        kepid, FLAGS.kepler_data_dir, FLAGS.spline_cache_dir)
+  return preprocess.read_and_process_light_curve(kepid, FLAGS.kepler_data_dir)
+
+
+def _process_tce(tce, time, flux):
+  """Processes the light curve for a Kepler TCE and returns an Example proto.
+
+  Args:
+    tce: Row of the input TCE table.
+    time: 1D NumPy array; the time values of the light curve of the star.
+    flux: 1D NumPy array; the normalized flux values of the light curve.
+
+  Returns:
+    A tensorflow.train.Example proto containing TCE features.
+  """
   time, flux = preprocess.phase_fold_and_sort_light_curve(
       time, flux, tce.tce_period, tce.tce_time0bk)
 
@@ -192,33 +233,184 @@ def _process_tce(tce):
   return ex
 
 
-def _process_file_shard(tce_table, file_name):
-  """Processes a single file shard.
+def _process_star_task(task):
+  """Processes all the TCEs of a Kepler target star in a worker process.
+
+  The light curve of the star is read and normalized once, and reused for each
+  of its TCEs.
 
   Args:
-    tce_table: A Pandas DateFrame containing the TCEs in the shard.
-    file_name: The output TFRecord file.
+    task: Tuple (kepid, tces), where tces is a list of tuples
+        (shard_index, tce_index, tce): tce is a row of the input TCE table, at
+        position tce_index of the output file shard shard_index.
+
+  Returns:
+    Tuple (results, stage_times). results is a list of tuples
+    (shard_index, tce_index, serialized), where serialized is the serialized
+    Example proto for the TCE, or None if no Example was produced. stage_times
+    is a dict from stage name to the seconds spent in the stage.
+
+  Raises:
+    IOError: If the light curve files for this Kepler ID cannot be found.
   """
-  process_name = multiprocessing.current_process().name
-  shard_name = os.path.basename(file_name)
-  shard_size = len(tce_table)
-  tf.logging.info("%s: Processing %d items in shard %s", process_name,
-                  shard_size, shard_name)
+  kepid, tces = task
+  stage_times = collections.Counter()
+  start_time = time.time()
+  light_curve = _read_light_curve(kepid)
+  stage_times["light_curve"] += time.time() - start_time
+
+  results = []
+  for shard_index, tce_index, tce in tces:
+    start_time = time.time()
+    example = _process_tce(tce, *light_curve)
+    stage_times["views"] += time.time() - start_time
 
-  with tf.python_io.TFRecordWriter(file_name) as writer:
-    num_processed = 0
-    for _, tce in tce_table.iterrows():
-      example = _process_tce(tce)
-      if example is not None:
-        writer.write(example.SerializeToString())
+    start_time = time.time()
+    serialized = example.SerializeToString() if example is not None else None
+    stage_times["serialize"] += time.time() - start_time
+    results.append((shard_index, tce_index, serialized))
+  return results, stage_times
 
-      num_processed += 1
-      if not num_processed % 10:
-        tf.logging.info("%s: Processed %d/%d items in shard %s", process_name,
-                        num_processed, shard_size, shard_name)
 
-  tf.logging.info("%s: Wrote %d items in shard %s", process_name, shard_size,
-                  shard_name)
+def _write_file_shard(file_name, serialized_examples):
+  """Writes the Example protos of a file shard.
+
+  The shard is written to a temporary file which is then renamed, so that a
+  file named file_name is always complete.
+
+  Args:
+    file_name: Output file name.
+    serialized_examples: List of serialized Example protos, or None for TCEs
+        without an Example.
+  """
+  tmp_file_name = file_name + ".tmp"
+  num_written = 0
+  with tf.python_io.TFRecordWriter(tmp_file_name) as writer:
+    for serialized in serialized_examples:
+      if serialized is not None:
+        writer.write(serialized)
+        num_written += 1
+  tf.gfile.Rename(tmp_file_name, file_name, overwrite=True)
+  tf.logging.info("Wrote %d items in shard %s", num_written,
+                  os.path.basename(file_name))
+
+
+def _format_stage_times(stage_times):
+  return ", ".join("%s %.1f" % (stage, stage_times[stage])
+                   for stage in _STAGES if stage in stage_times)
+
+
+def _group_tces_by_star(file_shards):
+  """Groups the TCEs of all file shards by Kepler ID into star tasks.
+
+  The TCEs of each star form a single task, so that its light curve is only
+  read and normalized once, even if they belong to different shards. The tasks
+  are ordered shard by shard: each star comes with the first shard it has a
+  TCE in, and within a shard the stars with the most TCEs come first. The
+  shards are then completed, written and freed one after the other, instead
+  of all at the end of the run.
+
+  Args:
+    file_shards: List of (tce_table_shard, file_name).
+
+  Returns:
+    List of tasks (kepid, tces) for _process_star_task(), where tces is a list
+    of tuples (shard_index, tce_index, tce).
+  """
+  star_tces = collections.OrderedDict()
+  star_shard = {}
+  for shard_index, (tce_table, _) in enumerate(file_shards):
+    for tce_index, (_, tce) in enumerate(tce_table.iterrows()):
+      star_tces.setdefault(tce.kepid, []).append((shard_index, tce_index, tce))
+      star_shard.setdefault(tce.kepid, shard_index)
+  # sorted() is stable, so stars with as many TCEs keep the table order.
+  return sorted(star_tces.items(),
+                key=lambda task: (star_shard[task[0]], -len(task[1])))
+
+
+def _pending_file_shards(file_shards, overwrite_existing_shards):
+  """Returns the file shards to process.
+
+  Shards are only written once all their TCEs are processed, so the shards
+  that already exist are complete, and are skipped unless
+  overwrite_existing_shards is set.
+
+  Args:
+    file_shards: List of (tce_table_shard, file_name).
+    overwrite_existing_shards: Whether to process existing shards again.
+
+  Returns:
+    The list of (tce_table_shard, file_name) to process.
+  """
+  if overwrite_existing_shards:
+    return file_shards
+  existing_shards = [
+      file_name for _, file_name in file_shards if tf.gfile.Exists(file_name)
+  ]
+  if existing_shards:
+    tf.logging.info("Skipping %d existing file shards: %s",
+                    len(existing_shards),
+                    ", ".join(os.path.basename(f) for f in existing_shards))
+  return [(tce_table, file_name) for tce_table, file_name in file_shards
+          if file_name not in existing_shards]
+
+
+def _process_file_shards(file_shards, num_processes):
+  """Processes TCEs from all file shards in a pool of worker processes.
+
+  The TCEs are processed star by star, in the order of _group_tces_by_star().
+  The Example protos are written by this process, in the same order as the
+  TCEs in each shard, as soon as all the TCEs of the shard are processed.
+
+  Args:
+    file_shards: List of (tce_table_shard, file_name).
+    num_processes: Number of worker processes.
+  """
+  tasks = _group_tces_by_star(file_shards)
+  num_tces = sum(len(tce_table) for tce_table, _ in file_shards)
+  tf.logging.info("Grouped %d TCEs by %d Kepler IDs", num_tces, len(tasks))
+
+  shard_examples = [[None] * len(tce_table) for tce_table, _ in file_shards]
+  num_remaining = [len(tce_table) for tce_table, _ in file_shards]
+  stage_times = collections.Counter()
+  for shard_index, (_, file_name) in enumerate(file_shards):
+    if not num_remaining[shard_index]:
+      _write_file_shard(file_name, [])
+
+  pool = multiprocessing.Pool(processes=num_processes)
+  start_time = time.time()
+  num_processed = 0
+  try:
+    # imap_unordered() re-raises any exception raised by the worker processes
+    # here.
+    for results, star_stage_times in pool.imap_unordered(
+        _process_star_task, tasks):
+      stage_times.update(star_stage_times)
+      for shard_index, tce_index, serialized in results:
+        shard_examples[shard_index][tce_index] = serialized
+        num_remaining[shard_index] -= 1
+        if not num_remaining[shard_index]:
+          write_start_time = time.time()
+          _write_file_shard(file_shards[shard_index][1],
+                            shard_examples[shard_index])
+          shard_examples[shard_index] = None
+          stage_times["write"] += time.time() - write_start_time
+
+      previous_num_processed = num_processed
+      num_processed += len(results)
+      if (num_processed // FLAGS.log_every_n !=
+          previous_num_processed // FLAGS.log_every_n or
+          num_processed == num_tces):
+        elapsed = time.time() - start_time
+        rate = num_processed / elapsed
+        tf.logging.info(
+            "Processed %d/%d TCEs in %.1f seconds (%.2f TCEs/sec, "
+            "%.1f minutes remaining)", num_processed, num_tces, elapsed, rate,
+            (num_tces - num_processed) / rate / 60)
+        tf.logging.info("Seconds per stage, summed over processes: %s",
+                        _format_stage_times(stage_times))
+  finally:
+    pool.terminate()
 
 
 def main(argv):
@@ -275,22 +467,18 @@ def main(argv):
                                               "test-00000-of-00001")))
   num_file_shards = len(file_shards)
 
-  # Launch subprocesses for the file shards.
-  num_processes = min(num_file_shards, FLAGS.num_worker_processes)
-  tf.logging.info("Launching %d subprocesses for %d total file shards",
-                  num_processes, num_file_shards)
-
-  pool = multiprocessing.Pool(processes=num_processes)
-  async_results = [
-      pool.apply_async(_process_file_shard, file_shard)
-      for file_shard in file_shards
-  ]
-  pool.close()
-
-  # Instead of pool.join(), we call async_result.get() to ensure any exceptions
-  # raised by the worker processes are also raised here.
-  for async_result in async_results:
-    async_result.get()
+  # Skip the file shards written by a previous run.
+  file_shards = _pending_file_shards(file_shards,
+                                     FLAGS.overwrite_existing_shards)
+  num_pending_tces = sum(len(tce_table) for tce_table, _ in file_shards)
+
+  # Launch subprocesses for the TCEs.
+  if file_shards:
+    num_processes = max(1, min(num_pending_tces,
+                               FLAGS.num_worker_processes))
+    tf.logging.info("Launching %d subprocesses for %d TCEs in %d file shards",
+                    num_processes, num_pending_tces, len(file_shards))
+    _process_file_shards(file_shards, num_processes)
 
   tf.logging.info("Finished processing %d total file shards", num_file_shards)
 
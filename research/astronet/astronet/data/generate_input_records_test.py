@@ -0,0 +1,80 @@
+# Copyright 2018 The TensorFlow Authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for generate_input_records."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os.path
+
+import pandas as pd
+import tensorflow as tf
+
+from astronet.data import generate_input_records
+
+
+def _tce_table(kepids):
+  return pd.DataFrame({
+      "kepid": kepids,
+      "tce_plnt_num": range(1, len(kepids) + 1)
+  })
+
+
+class GenerateInputRecordsTest(tf.test.TestCase):
+
+  def testGroupTcesByStar(self):
+    file_shards = [
+        (_tce_table([1, 2, 2, 3]), "shard-0"),
+        (_tce_table([4, 3, 5, 5, 5]), "shard-1"),
+        (_tce_table([2, 6]), "shard-2"),
+    ]
+    tasks = generate_input_records._group_tces_by_star(file_shards)
+
+    # Each star comes with the first shard it has a TCE in, and by decreasing
+    # number of TCEs within a shard.
+    self.assertEqual([2, 3, 1, 5, 4, 6], [kepid for kepid, _ in tasks])
+    tces_by_star = {
+        kepid: [(shard_index, tce_index)
+                for shard_index, tce_index, _ in tces]
+        for kepid, tces in tasks
+    }
+    self.assertEqual([(0, 1), (0, 2), (2, 0)], tces_by_star[2])
+    self.assertEqual([(0, 3), (1, 1)], tces_by_star[3])
+    self.assertEqual([(1, 2), (1, 3), (1, 4)], tces_by_star[5])
+    for kepid, tces in tasks:
+      for _, _, tce in tces:
+        self.assertEqual(kepid, tce.kepid)
+
+  def testPendingFileShards(self):
+    output_dir = self.get_temp_dir()
+    file_shards = [(_tce_table([i]), os.path.join(output_dir, "shard-%d" % i))
+                   for i in range(3)]
+    with tf.gfile.Open(file_shards[1][1], "w"):
+      pass
+
+    pending = generate_input_records._pending_file_shards(
+        file_shards, overwrite_existing_shards=False)
+    self.assertEqual([file_shards[0][1], file_shards[2][1]],
+                     [file_name for _, file_name in pending])
+
+    pending = generate_input_records._pending_file_shards(
+        file_shards, overwrite_existing_shards=True)
+    self.assertEqual([file_name for _, file_name in file_shards],
+                     [file_name for _, file_name in pending])
+
+
+if __name__ == "__main__":
+  tf.test.main()
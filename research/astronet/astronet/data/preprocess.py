@@ -18,6 +18,9 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import hashlib
+import os
+
 import numpy as np
 import tensorflow as tf
 
@@ -89,6 +92,73 @@ def read_and_process_light_curve(kepid, kepler_data_dir, max_gap_width=0.75):
   return time, flux
 
 
+def _light_curve_cache_filename(cache_dir, kepid, kepler_data_dir,
+                                max_gap_width):
+  """Returns the cache file name for a processed light curve.
+
+  The name includes a hash of the paths, sizes and modification times of the
+  light curve files, so that reading from another kepler_data_dir, or updated
+  files, never returns a stale entry.
+  """
+  key = hashlib.sha1()
+  for file_name in kepler_io.kepler_filenames(kepler_data_dir, kepid):
+    stat = tf.gfile.Stat(file_name)
+    key.update(("%s:%d:%d\n" % (file_name, stat.length,
+                                 stat.mtime_nsec)).encode("utf-8"))
+  return os.path.join(cache_dir, "kplr%.9d-gap%g-%s.npz" %
+                      (int(kepid), max_gap_width, key.hexdigest()[:16]))
+
+
+def read_and_process_light_curve_cached(kepid,
+                                        kepler_data_dir,
+                                        cache_dir,
+                                        max_gap_width=0.75):
+  """Like read_and_process_light_curve(), but caches the result on disk.
+
+  Fitting the spline is the most expensive step in processing a TCE, and many
+  TCEs share the same target star. The normalized light curve of each star is
+  therefore saved in cache_dir the first time it is computed and read back for
+  subsequent TCEs on that star, including TCEs processed by other processes or
+  in later runs. Entries are keyed by the light curve files they were computed
+  from, so they are not reused for a different kepler_data_dir.
+
+  Args:
+    kepid: Kepler id of the target star.
+    kepler_data_dir: Base directory containing Kepler data. See
+        kepler_io.kepler_filenames().
+    cache_dir: Directory in which to cache processed light curves.
+    max_gap_width: Gap size (in days) above which the light curve is split for
+        the fitting of B-splines.
+
+  Returns:
+    time: 1D NumPy array; the time values of the light curve.
+    flux: 1D NumPy array; the normalized flux values of the light curve.
+
+  Raises:
+    IOError: If the light curve files for this Kepler ID cannot be found.
+    ValueError: If the spline could not be fit.
+  """
+  filename = _light_curve_cache_filename(cache_dir, kepid, kepler_data_dir,
+                                         max_gap_width)
+  if tf.gfile.Exists(filename):
+    with tf.gfile.Open(filename, "rb") as f:
+      cached = np.load(f)
+      return cached["time"], cached["flux"]
+
+  time, flux = read_and_process_light_curve(kepid, kepler_data_dir,
+                                            max_gap_width)
+
+  # Write to a temporary file first so that concurrent readers never see a
+  # partially written cache entry.
+  tf.gfile.MakeDirs(cache_dir)
+  tmp_filename = "%s.tmp-%d" % (filename, os.getpid())
+  with tf.gfile.Open(tmp_filename, "wb") as f:
+    np.savez(f, time=time, flux=flux)
+  tf.gfile.Rename(tmp_filename, filename, overwrite=True)
+
+  return time, flux
+
+
 def phase_fold_and_sort_light_curve(time, flux, period, t0):
   """Phase folds a light curve and sorts by ascending time.
 
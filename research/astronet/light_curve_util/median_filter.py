@@ -83,38 +83,49 @@ def median_filter(x, y, num_bins, bin_width=None, x_min=None, x_max=None):
 
   bin_spacing = (x_max - x_min - bin_width) / (num_bins - 1)
 
+  x = np.asarray(x)
+  y = np.asarray(y)
+
   # Bins with no y-values will fall back to the global median.
   result = np.repeat(np.median(y), num_bins)
 
-  # Find the first element of x >= x_min. This loop is guaranteed to produce
-  # a valid index because we know that x_min <= x[-1].
-  x_start = 0
-  while x[x_start] < x_min:
-    x_start += 1
+  # Left and right endpoints of each bin. The cumulative sum reproduces the
+  # rounding of advancing each endpoint by bin_spacing one bin at a time.
+  steps = np.repeat(bin_spacing, num_bins - 1)
+  bin_mins = np.cumsum(np.concatenate([[x_min], steps]))
+  bin_maxs = np.cumsum(np.concatenate([[x_min + bin_width], steps]))
 
   # The bin at index i is the median of all elements y[j] such that
-  # bin_min <= x[j] < bin_max, where bin_min and bin_max are the endpoints of
-  # bin i.
-  bin_min = x_min  # Left endpoint of the current bin.
-  bin_max = x_min + bin_width  # Right endpoint of the current bin.
-  j_start = x_start  # Inclusive left index of the current bin.
-  j_end = x_start  # Exclusive end index of the current bin.
-
-  for i in range(num_bins):
-    # Move j_start to the first index of x >= bin_min.
-    while j_start < x_len and x[j_start] < bin_min:
-      j_start += 1
-
-    # Move j_end to the first index of x >= bin_max (exclusive end index).
-    while j_end < x_len and x[j_end] < bin_max:
-      j_end += 1
-
-    if j_end > j_start:
-      # Compute and insert the median bin value.
-      result[i] = np.median(y[j_start:j_end])
-
-    # Advance the bin.
-    bin_min += bin_spacing
-    bin_max += bin_spacing
-
+  # bin_min <= x[j] < bin_max, i.e. j_starts[i] <= j < j_ends[i].
+  j_starts = np.searchsorted(x, bin_mins, side="left")
+  j_ends = np.maximum(np.searchsorted(x, bin_maxs, side="left"), j_starts)
+  counts = j_ends - j_starts
+  nonempty = counts > 0
+  if not np.any(nonempty):
+    return result
+
+  # Gather the y-values of every bin into one flat array of consecutive
+  # segments. Bins may overlap, so the same y-value can appear in several
+  # segments.
+  offsets = np.cumsum(counts) - counts
+  total = offsets[-1] + counts[-1]
+  bin_ids = np.repeat(np.arange(num_bins), counts)
+  indices = np.arange(total) - np.repeat(offsets - j_starts, counts)
+  values = y[indices]
+
+  # Sort the values within each segment. NaNs are sorted to the end of their
+  # segment.
+  values = values[np.lexsort((values, bin_ids))]
+
+  # The median of a sorted segment is the mean of its one or two middle values.
+  offsets = offsets[nonempty]
+  counts = counts[nonempty]
+  lower = values[offsets + (counts - 1) // 2]
+  upper = values[offsets + counts // 2]
+  medians = (lower + upper) / 2
+
+  # Match np.median, which returns NaN for any bin containing a NaN.
+  medians[np.isnan(values[offsets + counts - 1])] = np.nan
+
+  result[nonempty] = medians
   return result
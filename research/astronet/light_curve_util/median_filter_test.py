@@ -123,6 +123,35 @@ class MedianFilterTest(absltest.TestCase):
     result = median_filter.median_filter(x, y, num_bins=5)
     np.testing.assert_array_equal([7, 1, 5, 2, 3], result)
 
+  def testNaNBins(self):
+    x = np.array([-1, 0, 1, 2])
+    y = np.array([1, np.nan, 3, 4])
+    result = median_filter.median_filter(
+        x, y, num_bins=3, bin_width=1, x_min=-1, x_max=2)
+    np.testing.assert_array_equal([1, np.nan, 3], result)
+
+  def testMatchesPerBinMedian(self):
+    rs = np.random.RandomState(123)
+    x = np.sort(rs.uniform(-10, 10, size=1000))
+    y = rs.normal(size=1000)
+    num_bins = 37
+    bin_width = 1.3
+    x_min = -8.5
+    x_max = 9.5
+    result = median_filter.median_filter(x, y, num_bins, bin_width, x_min,
+                                         x_max)
+
+    # Compute the expected result by taking the median of each bin separately.
+    expected = np.repeat(np.median(y), num_bins)
+    bin_spacing = (x_max - x_min - bin_width) / (num_bins - 1)
+    bin_min = x_min
+    for i in range(num_bins):
+      in_bin = (x >= bin_min) & (x < bin_min + bin_width)
+      if np.any(in_bin):
+        expected[i] = np.median(y[in_bin])
+      bin_min += bin_spacing
+    np.testing.assert_allclose(expected, result)
+
 
 if __name__ == '__main__':
   absltest.main()
@@ -4,11 +4,11 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-import itertools
 import warnings
 
 import numpy as np
 from pydl.pydlutils import bspline
+from scipy import linalg
 
 from third_party.robust_mean import robust_mean
 
@@ -18,35 +18,200 @@ class SplineError(Exception):
   pass
 
 
-def kepler_spline(time, flux, bkspace=1.5, maxiter=5, outlier_cut=3):
-  """Computes a best-fit spline curve for a light curve segment.
+# Order of the B-splines fit by pydlutils.bspline (cubic splines).
+_ORDER = 4
+
+# Fits whose normal equations have a Cholesky pivot smaller than this fraction
+# of its diagonal element are left to bspline.iterfit(). These equations are
+# (nearly) singular, e.g. when outlier removal empties a few neighboring
+# intervals between break points, and whether bspline.iterfit() succeeds then
+# depends on its rounding errors.
+_MIN_PIVOT_RATIO = 1e-6
+
+
+class _FallbackError(Exception):
+  """Case of bspline.iterfit() not handled by _iterfit()."""
+  pass
+
+
+class _SplineBasis(object):
+  """B-spline basis of pydlutils.bspline evaluated at the points of a segment.
+
+  bspline.iterfit() spaces the break points evenly over the range of the
+  points it fits, so the basis is computed once for all the points of the
+  segment and shared by the fits on all the subsets of them with the same
+  range, e.g. by the outlier removal iterations of kepler_spline() which keep
+  the first and last points.
+  """
+
+  def __init__(self, time, t_min, t_max, num_breakpoints):
+    sset = bspline.bspline(np.array([t_min, t_max]), nbkpts=num_breakpoints)
+    breakpoints = sset.breakpoints
+    self._num_coeffs = breakpoints.size - _ORDER
+
+    # Interval of each point between the break points, as bspline.intrv().
+    ileft = np.clip(
+        np.searchsorted(breakpoints, time) - 1, _ORDER - 1,
+        self._num_coeffs - 1)
+
+    # The basis functions that are nonzero at each point are those of the
+    # coefficients first_coeff + [0, _ORDER).
+    first_coeff = ileft - (_ORDER - 1)
+    self._values = sset.bsplvn(time, ileft)
+    self._coeff_index = first_coeff[:, np.newaxis] + np.arange(_ORDER)
+
+    # Products of the pairs (i, j), i <= j, of basis functions nonzero at each
+    # point, and their indices in the banded normal equations flattened in the
+    # lower form of scipy.linalg.cholesky_banded(): (j - i, first_coeff + i).
+    i, j = np.triu_indices(_ORDER)
+    self._products = self._values[:, i] * self._values[:, j]
+    self._product_index = (
+        (j - i) * self._num_coeffs + self._coeff_index[:, i])
+
+  def fit(self, rows, y, invvar):
+    """Least squares fit of points with the same variance, as bspline.fit().
+
+    Args:
+      rows: Indices of the points to fit.
+      y: Values of the points to fit.
+      invvar: Inverse variance of the values.
+
+    Returns:
+      The coefficients of the spline.
+
+    Raises:
+      _FallbackError: If bspline.bspline.fit() would mask break points, or
+          the normal equations are ill-conditioned.
+    """
+    if len(rows) == len(self._values):
+      rows = slice(None)  # Avoid copies when fitting all the points.
+    alpha = np.bincount(
+        self._product_index[rows].ravel(),
+        weights=self._products[rows].ravel(),
+        minlength=_ORDER * self._num_coeffs).reshape(_ORDER, -1) * invvar
+    beta = np.bincount(
+        self._coeff_index[rows].ravel(),
+        weights=(self._values[rows] * y[:, np.newaxis]).ravel(),
+        minlength=self._num_coeffs) * invvar
+
+    # bspline.bspline.fit() masks break points if a diagonal element is at
+    # most min_influence. Fall back to it with a margin for rounding errors.
+    min_influence = 1.0e-10 * invvar * len(y) / self._num_coeffs
+    if (not np.all(alpha[0] > 2 * min_influence) or
+        not np.all(np.isfinite(alpha))):
+      raise _FallbackError()
+    try:
+      lower = linalg.cholesky_banded(alpha, lower=True)
+    except linalg.LinAlgError:
+      raise _FallbackError()
+    if np.any(lower[0]**2 < _MIN_PIVOT_RATIO * alpha[0]):
+      raise _FallbackError()
+    return linalg.cho_solve_banded((lower, True), beta)
+
+  def value(self, coeffs):
+    """Evaluates the spline with coefficients coeffs at all the points."""
+    return np.sum(self._values * coeffs[self._coeff_index], axis=1)
 
-  The spline is fit using an iterative process to remove outliers that may cause
-  the spline to be "pulled" by discrepent points. In each iteration the spline
-  is fit, and if there are any points where the absolute deviation from the
-  median residual is at least 3*sigma (where sigma is a robust estimate of the
-  standard deviation of the residuals), those points are removed and the spline
-  is re-fit.
+
+def _iterfit(basis, rows, y):
+  """Fits a spline as bspline.iterfit().
+
+  bspline.iterfit() only iterates while its fit masks break points, or until
+  its first outlier rejection (its loop runs while qdone == -1, and
+  djs_reject() returns a bool), whose result does not change the fit. Without
+  masked break points, its spline is therefore that of its first fit.
 
   Args:
-    time: Numpy array; the time values of the light curve.
-    flux: Numpy array; the flux (brightness) values of the light curve.
-    bkspace: Spline break point spacing in time units.
-    maxiter: Maximum number of attempts to fit the spline after removing badly
-        fit points.
-    outlier_cut: The maximum number of standard deviations from the median
-        spline residual before a point is considered an outlier.
+    basis: _SplineBasis for the range of the points to fit.
+    rows: Indices of the points to fit.
+    y: Values of the points to fit.
 
   Returns:
-    spline: The values of the fitted spline corresponding to the input time
-        values.
-    mask: Boolean mask indicating the points used to fit the final spline.
+    The coefficients of the spline.
+
+  Raises:
+    _FallbackError: In the cases where bspline.iterfit() masks break points,
+        or gives up the fit.
+  """
+  num_points = y.size
+  if num_points < _ORDER:
+    raise _FallbackError()
+  var = y.var() * (float(num_points) / float(num_points - 1))
+  if var == 0:
+    var = 1.0
+  invvar = (np.ones(1, dtype=y.dtype) / var)[0]
+  if not invvar > 0:
+    raise _FallbackError()
+  return basis.fit(rows, y, invvar)
+
+
+class _SegmentSplines(object):
+  """Spline fits on a light curve segment, shared by break-point spacings.
+
+  The break points placed by bspline.iterfit() only depend on the range of
+  the fit points and on their number, int(range / bkspace) + 1. Spacings that
+  round to the same break points therefore give the same splines, and the
+  basis and the fits are computed once for all of them.
   """
-  # Rescale time into [0, 1].
+
+  def __init__(self, time, flux, use_pydl_iterfit=False):
+    self.time = time
+    self.flux = flux
+    self._use_pydl_iterfit = use_pydl_iterfit
+    self._bases = {}
+    self._splines = {}
+
+  def fit(self, mask, bkspace):
+    """Fits a spline on the points in mask and evaluates it at all points.
+
+    Same as bspline.iterfit(time[mask], flux[mask], bkspace=bkspace)[0]
+    .value(time)[0], up to rounding errors.
+
+    Args:
+      mask: Boolean mask of the points to fit.
+      bkspace: Spline break point spacing in time units.
+
+    Returns:
+      The values of the spline at all the points.
+    """
+    if not self._use_pydl_iterfit:
+      rows = np.flatnonzero(mask)
+      fit_time = self.time[rows]
+      t_min = np.min(fit_time)
+      t_max = np.max(fit_time)
+      num_breakpoints = max(int((t_max - t_min) / bkspace) + 1, 2)
+      basis_key = (t_min, t_max, num_breakpoints)
+      spline_key = basis_key + (mask.tobytes(),)
+      if spline_key in self._splines:
+        return self._splines[spline_key]
+
+      if basis_key not in self._bases:
+        self._bases[basis_key] = _SplineBasis(self.time, t_min, t_max,
+                                              num_breakpoints)
+      basis = self._bases[basis_key]
+      try:
+        spline = basis.value(_iterfit(basis, rows, self.flux[rows]))
+        self._splines[spline_key] = spline
+        return spline
+      except _FallbackError:
+        pass
+
+    curve = bspline.iterfit(
+        self.time[mask], self.flux[mask], bkspace=bkspace)[0]
+    return curve.value(self.time)[0]
+
+
+def _rescale_time(time):
+  """Rescales time into [0, 1]; returns the rescaled time and the scale."""
   t_min = np.min(time)
   t_max = np.max(time)
-  time = (time - t_min) / (t_max - t_min)
-  bkspace /= (t_max - t_min)  # Rescale bucket spacing.
+  return (time - t_min) / (t_max - t_min), t_max - t_min
+
+
+def _kepler_spline(segment, bkspace, maxiter, outlier_cut):
+  """Computes kepler_spline() for a _SegmentSplines, with rescaled bkspace."""
+  time = segment.time
+  flux = segment.flux
 
   # Values of the best fitting spline evaluated at the time points.
   spline = None
@@ -56,7 +221,7 @@ def kepler_spline(time, flux, bkspace=1.5, maxiter=5, outlier_cut=3):
 
   for _ in range(maxiter):
     if spline is None:
-      mask = np.ones_like(time, dtype=np.bool)  # Try to fit all points.
+      mask = np.ones_like(time, dtype=bool)  # Try to fit all points.
     else:
       # Choose points where the absolute deviation from the median residual is
       # less than 3*sigma, where sigma is a robust estimate of the standard
@@ -75,12 +240,10 @@ def kepler_spline(time, flux, bkspace=1.5, maxiter=5, outlier_cut=3):
         # catch any exception and raise a more informative error.
         warnings.simplefilter("ignore")
 
-        # Fit the spline on non-outlier points.
-        curve = bspline.iterfit(time[mask], flux[mask], bkspace=bkspace)[0]
-
-      # Evaluate spline at the time points.
-      spline = curve.value(time)[0]
-    except (IndexError, TypeError) as e:
+        # Fit the spline on non-outlier points and evaluate it at the time
+        # points.
+        spline = segment.fit(mask, bkspace)
+    except (IndexError, TypeError, ValueError) as e:
       raise SplineError(
           "Fitting spline failed with error: '%s'. This might be caused by the "
           "breakpoint spacing being too small, and/or there being insufficient "
@@ -89,12 +252,51 @@ def kepler_spline(time, flux, bkspace=1.5, maxiter=5, outlier_cut=3):
   return spline, mask
 
 
+def kepler_spline(time,
+                  flux,
+                  bkspace=1.5,
+                  maxiter=5,
+                  outlier_cut=3,
+                  use_pydl_iterfit=False):
+  """Computes a best-fit spline curve for a light curve segment.
+
+  The spline is fit using an iterative process to remove outliers that may cause
+  the spline to be "pulled" by discrepent points. In each iteration the spline
+  is fit, and if there are any points where the absolute deviation from the
+  median residual is at least 3*sigma (where sigma is a robust estimate of the
+  standard deviation of the residuals), those points are removed and the spline
+  is re-fit.
+
+  Args:
+    time: Numpy array; the time values of the light curve.
+    flux: Numpy array; the flux (brightness) values of the light curve.
+    bkspace: Spline break point spacing in time units.
+    maxiter: Maximum number of attempts to fit the spline after removing badly
+        fit points.
+    outlier_cut: The maximum number of standard deviations from the median
+        spline residual before a point is considered an outlier.
+    use_pydl_iterfit: Whether to fit the splines with pydlutils.bspline
+        iterfit() itself, instead of the faster equivalent of this module.
+
+  Returns:
+    spline: The values of the fitted spline corresponding to the input time
+        values.
+    mask: Boolean mask indicating the points used to fit the final spline.
+  """
+  time, scale = _rescale_time(time)
+  bkspace /= scale  # Rescale bucket spacing.
+  return _kepler_spline(
+      _SegmentSplines(time, flux, use_pydl_iterfit), bkspace, maxiter,
+      outlier_cut)
+
+
 def choose_kepler_spline(all_time,
                          all_flux,
                          bkspaces,
                          maxiter=5,
                          penalty_coeff=1.0,
-                         verbose=True):
+                         verbose=True,
+                         use_pydl_iterfit=False):
   """Computes the best-fit Kepler spline across a break-point spacings.
 
   Some Kepler light curves have low-frequency variability, while others have
@@ -108,6 +310,9 @@ def choose_kepler_spline(all_time,
   divided into different segments (e.g. split by quarter breaks or gaps in the
   in the data). A separate spline is fit for each segment.
 
+  The segments are processed one at a time for all the break-point spacings,
+  which share the fits of spacings giving the same break points.
+
   Args:
     all_time: List of 1D numpy arrays; the time values of the light curve.
     all_flux: List of 1D numpy arrays; the flux (brightness) values of the light
@@ -122,6 +327,8 @@ def choose_kepler_spline(all_time,
     verbose: Whether to log individual spline errors. Note that if bkspaces
         contains many values (particularly small ones) then this may cause
         logging pollution if calling this function for many light curves.
+    use_pydl_iterfit: Whether to fit the splines with pydlutils.bspline
+        iterfit() itself, instead of the faster equivalent of this module.
 
   Returns:
     spline: List of numpy arrays; values of the best-fit spline corresponding to
@@ -136,67 +343,80 @@ def choose_kepler_spline(all_time,
   abs_deviations = np.concatenate([np.abs(f[1:] - f[:-1]) for f in all_flux])
   sigma = np.median(abs_deviations) * 1.48 / np.sqrt(2)
 
-  best_bic = None
-  best_spline = None
-  best_spline_mask = None
-  best_bkspace = None
-  bad_bkspaces = []
-  for bkspace in bkspaces:
-    nparams = 0  # Total number of free parameters in the piecewise spline.
-    npoints = 0  # Total number of data points used to fit the piecewise spline.
-    ssr = 0  # Sum of squared residuals between the model and the spline.
-
-    spline = []
-    spline_mask = []
-    bad_bkspace = False  # Indicates that the current bkspace should be skipped.
-    for time, flux in itertools.izip(all_time, all_flux):
-      # Don't fit a spline on less than 4 points.
-      if len(time) < 4:
-        spline.append(flux)
-        spline_mask.append(np.ones_like(flux), dtype=np.bool)
+  # For each bkspace: the total number of free parameters in the piecewise
+  # spline, the total number of data points used to fit it, and the sum of
+  # squared residuals between the model and the spline.
+  num_bkspaces = len(bkspaces)
+  nparams = np.zeros(num_bkspaces, dtype=np.int64)
+  npoints = np.zeros(num_bkspaces, dtype=np.int64)
+  ssr = np.zeros(num_bkspaces)
+
+  spline = [[] for _ in bkspaces]
+  spline_mask = [[] for _ in bkspaces]
+  bad_bkspace = np.zeros(num_bkspaces, dtype=bool)  # Bkspaces to skip.
+
+  for time, flux in zip(all_time, all_flux):
+    # Don't fit a spline on less than 4 points.
+    if len(time) < 4:
+      for b in range(num_bkspaces):
+        spline[b].append(flux)
+        spline_mask[b].append(np.ones_like(flux, dtype=bool))
+      continue
+
+    # Time is rescaled into [0, 1] once for all the bkspaces.
+    segment_time, scale = _rescale_time(time)
+    segment = _SegmentSplines(segment_time, flux, use_pydl_iterfit)
+    for b, bkspace in enumerate(bkspaces):
+      if bad_bkspace[b]:
         continue
 
       # Fit B-spline to this light-curve segment.
       try:
-        spline_piece, mask = kepler_spline(
-            time, flux, bkspace=bkspace, maxiter=maxiter)
+        spline_piece, mask = _kepler_spline(
+            segment, bkspace / scale, maxiter=maxiter, outlier_cut=3)
 
       # It's expected to get a SplineError occasionally for small values of
       # bkspace.
       except SplineError as e:
         if verbose:
           warnings.warn("Bad bkspace %.4f: %s" % (bkspace, e))
-        bad_bkspaces.append(bkspace)
-        bad_bkspace = True
-        break
+        bad_bkspace[b] = True
+        continue
 
-      spline.append(spline_piece)
-      spline_mask.append(mask)
+      spline[b].append(spline_piece)
+      spline_mask[b].append(mask)
 
       # Accumulate the number of free parameters.
       total_time = np.max(time) - np.min(time)
       nknots = int(total_time / bkspace) + 1  # From the bspline implementation.
-      nparams += nknots + 3 - 1  # number of knots + degree of spline - 1
+      nparams[b] += nknots + 3 - 1  # number of knots + degree of spline - 1
 
       # Accumulate the number of points and the squared residuals.
-      npoints += np.sum(mask)
-      ssr += np.sum((flux[mask] - spline_piece[mask])**2)
+      npoints[b] += np.sum(mask)
+      ssr[b] += np.sum((flux[mask] - spline_piece[mask])**2)
 
-    if bad_bkspace:
+  best_bic = None
+  best_b = None
+  for b in range(num_bkspaces):
+    if bad_bkspace[b]:
       continue
 
     # The following term is -2*ln(L), where L is the likelihood of the data
     # given the model, under the assumption that the model errors are iid
     # Gaussian with mean 0 and standard deviation sigma.
-    likelihood_term = npoints * np.log(2 * np.pi * sigma**2) + ssr / sigma**2
+    likelihood_term = (npoints[b] * np.log(2 * np.pi * sigma**2) +
+                       ssr[b] / sigma**2)
 
     # Bayesian information criterion.
-    bic = likelihood_term + penalty_coeff * nparams * np.log(npoints)
+    bic = likelihood_term + penalty_coeff * nparams[b] * np.log(npoints[b])
 
     if best_bic is None or bic < best_bic:
       best_bic = bic
-      best_spline = spline
-      best_spline_mask = spline_mask
-      best_bkspace = bkspace
-
-  return best_spline, best_spline_mask, best_bkspace, bad_bkspaces
+      best_b = b
+
+  bad_bkspaces = [
+      bkspace for b, bkspace in enumerate(bkspaces) if bad_bkspace[b]
+  ]
+  if best_b is None:
+    return None, None, None, bad_bkspaces
+  return spline[best_b], spline_mask[best_b], bkspaces[best_b], bad_bkspaces
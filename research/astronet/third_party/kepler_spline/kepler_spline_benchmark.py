@@ -0,0 +1,89 @@
+"""Benchmark of choose_kepler_spline() against pydlutils.bspline.iterfit().
+
+Fits splines to synthetic light curves shaped like Kepler long cadence data
+(segments of ~90 days with a 29.4 minute cadence, low-frequency variability,
+white noise and outliers), once with the spline fitting of this module and
+once with pydlutils.bspline.iterfit(), checks that both choose the same
+break-point spacings, and reports the time of each.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+
+from third_party.kepler_spline import kepler_spline
+
+
+def _light_curve(rng, num_segments, points_per_segment):
+  """Returns a random piecewise light curve."""
+  all_time = []
+  all_flux = []
+  t0 = 0
+  for _ in range(num_segments):
+    t = t0 + np.arange(points_per_segment) * 0.0204
+    period = rng.uniform(0.5, 10)
+    flux = 1 + 0.01 * np.sin(2 * np.pi * t / period)
+    flux += rng.uniform(1e-4, 2e-3) * rng.randn(points_per_segment)
+    outliers = rng.rand(points_per_segment) < 0.005
+    flux[outliers] -= rng.uniform(0, 0.05, size=np.sum(outliers))
+    all_time.append(t)
+    all_flux.append(flux.astype(np.float32))
+    t0 = t[-1] + rng.uniform(0.5, 2)
+  return all_time, all_flux
+
+
+def main(num_light_curves, num_segments, points_per_segment, seed):
+  rng = np.random.RandomState(seed)
+  light_curves = [
+      _light_curve(rng, num_segments, points_per_segment)
+      for _ in range(num_light_curves)
+  ]
+  bkspaces = np.logspace(np.log10(0.5), np.log10(20), num=20)
+
+  results = {}
+  for use_pydl_iterfit in (True, False):
+    start = time.time()
+    results[use_pydl_iterfit] = [
+        kepler_spline.choose_kepler_spline(
+            all_time, all_flux, bkspaces, verbose=False,
+            use_pydl_iterfit=use_pydl_iterfit)
+        for all_time, all_flux in light_curves
+    ]
+    elapsed = time.time() - start
+    print("%-18s %8.3f seconds per light curve" % (
+        "pydl iterfit:" if use_pydl_iterfit else "kepler_spline:",
+        elapsed / num_light_curves))
+
+  num_different = sum(
+      pydl_result[2] != result[2]
+      for pydl_result, result in zip(results[True], results[False]))
+  print("Different break-point spacings chosen for %d of %d light curves." %
+        (num_different, num_light_curves))
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      "--num_light_curves",
+      type=int,
+      default=10,
+      help="Number of light curves to fit.")
+  parser.add_argument(
+      "--num_segments",
+      type=int,
+      default=14,
+      help="Number of segments of each light curve.")
+  parser.add_argument(
+      "--points_per_segment",
+      type=int,
+      default=4300,
+      help="Number of points of each segment.")
+  parser.add_argument(
+      "--seed", type=int, default=0, help="Seed of the random light curves.")
+  args = parser.parse_args()
+  main(**vars(args))
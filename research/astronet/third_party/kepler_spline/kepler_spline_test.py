@@ -107,6 +107,44 @@ class KeplerSplineTest(absltest.TestCase):
     self.assertAlmostEqual(bkspace, 1.89634509537)
     self.assertEmpty(bad_bkspaces)
 
+  def testKeplerSplineMatchesPydlIterfit(self):
+    # Noisy sine wave with outliers. Removing the first point changes the range
+    # of the fit points.
+    rng = np.random.RandomState(123)
+    time = np.arange(0, 30, 0.02)
+    flux = np.sin(time) + 0.01 * rng.randn(len(time))
+    flux[[0, 100, 101, 700, len(time) - 1]] = [3, -2, -2, 5, -4]
+
+    for bkspace in [0.3, 1, 4]:
+      spline, mask = kepler_spline.kepler_spline(time, flux, bkspace=bkspace)
+      expected_spline, expected_mask = kepler_spline.kepler_spline(
+          time, flux, bkspace=bkspace, use_pydl_iterfit=True)
+      np.testing.assert_allclose(spline, expected_spline, atol=1e-12)
+      np.testing.assert_array_equal(mask, expected_mask)
+      self.assertFalse(mask[0])
+
+  def testChooseKeplerSplineMatchesPydlIterfit(self):
+    rng = np.random.RandomState(123)
+    time = [np.arange(0, 40, 0.0204), np.arange(42, 50, 0.0204),
+            np.array([51, 52])]
+    flux = [1 + 0.01 * np.sin(t / 2) + 1e-3 * rng.randn(len(t)) for t in time]
+    flux[0][rng.rand(len(time[0])) < 0.01] -= 0.02
+
+    # Include spacings so small that the spline cannot be fit.
+    bkspaces = np.logspace(np.log10(0.01), np.log10(20), num=20)
+    spline, mask, bkspace, bad_bkspaces = kepler_spline.choose_kepler_spline(
+        time, flux, bkspaces, verbose=False)
+    (expected_spline, expected_mask, expected_bkspace,
+     expected_bad_bkspaces) = kepler_spline.choose_kepler_spline(
+         time, flux, bkspaces, verbose=False, use_pydl_iterfit=True)
+    self.assertEqual(bkspace, expected_bkspace)
+    self.assertEqual(bad_bkspaces, expected_bad_bkspaces)
+    self.assertNotEmpty(bad_bkspaces)
+    for s, m, expected_s, expected_m in zip(spline, mask, expected_spline,
+                                            expected_mask):
+      np.testing.assert_allclose(s, expected_s, atol=1e-12)
+      np.testing.assert_array_equal(m, expected_m)
+
 
 if __name__ == "__main__":
   absltest.main()
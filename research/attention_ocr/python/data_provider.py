@@ -45,6 +45,23 @@ ShuffleBatchConfig = collections.namedtuple('ShuffleBatchConfig', [
 DEFAULT_SHUFFLE_CONFIG = ShuffleBatchConfig(
     num_batching_threads=8, queue_capacity=3000, min_after_dequeue=1000)
 
+# A namedtuple to define a configuration of the tf.data input pipeline.
+#   num_parallel_reads: a number of data files read in parallel.
+#   num_parallel_calls: a number of examples decoded and preprocessed in
+#     parallel.
+#   shuffle_buffer_size: a number of examples in the shuffle buffer.
+#   prefetch_batches: a number of batches prepared ahead of their use.
+DatasetConfig = collections.namedtuple('DatasetConfig', [
+    'num_parallel_reads', 'num_parallel_calls', 'shuffle_buffer_size',
+    'prefetch_batches'
+])
+
+DEFAULT_DATASET_CONFIG = DatasetConfig(
+    num_parallel_reads=8,
+    num_parallel_calls=8,
+    shuffle_buffer_size=1000,
+    prefetch_batches=2)
+
 
 def augment_image(image):
   """Augmentation the image with a random modification.
@@ -150,12 +167,83 @@ def preprocess_image(image, augment=False, central_crop_size=None,
   return image
 
 
+def _get_data_with_tf_data(dataset, batch_size, augment, central_crop_size,
+                           shuffle, dataset_config):
+  """Same as get_data, but reads the data with a tf.data pipeline.
+
+  The data files are read in parallel and their records interleaved. Each
+  record is decoded and preprocessed by a single function, mapped in parallel
+  over the records, and the batches are prefetched.
+
+  Args:
+    dataset: a slim.data.dataset.Dataset object of TFRecord files.
+    batch_size: number of samples per batch.
+    augment: if True does random image distortion.
+    central_crop_size: A tuple (crop_width, crop_height).
+    shuffle: if True use data shuffling.
+    dataset_config: A namedtuple DatasetConfig.
+
+  Returns:
+    An InputEndpoints namedtuple.
+
+  Raises:
+    ValueError: if the dataset is not made of TFRecord files, or no file
+      matches its data sources.
+  """
+  if dataset.reader is not tf.TFRecordReader:
+    raise ValueError('The tf.data pipeline only reads TFRecord files.')
+  data_sources = dataset.data_sources
+  if not isinstance(data_sources, (list, tuple)):
+    data_sources = [data_sources]
+  filenames = sorted(
+      filename for pattern in data_sources
+      for filename in tf.gfile.Glob(pattern))
+  if not filenames:
+    raise ValueError('No data files match %s' % dataset.data_sources)
+
+  filename_dataset = tf.data.Dataset.from_tensor_slices(filenames)
+  if shuffle:
+    filename_dataset = filename_dataset.shuffle(len(filenames))
+  filename_dataset = filename_dataset.repeat()
+  records_dataset = filename_dataset.apply(
+      tf.contrib.data.parallel_interleave(
+          tf.data.TFRecordDataset,
+          cycle_length=dataset_config.num_parallel_reads,
+          sloppy=shuffle))
+  if shuffle:
+    records_dataset = records_dataset.shuffle(
+        dataset_config.shuffle_buffer_size)
+
+  def decode_and_preprocess(record):
+    image_orig, label = dataset.decoder.decode(record, ['image', 'label'])
+    image = preprocess_image(
+        image_orig, augment, central_crop_size,
+        num_towers=dataset.num_of_views)
+    label_one_hot = slim.one_hot_encoding(label, dataset.num_char_classes)
+    return image, image_orig, label, label_one_hot
+
+  batches = records_dataset.map(
+      decode_and_preprocess,
+      num_parallel_calls=dataset_config.num_parallel_calls).apply(
+          tf.contrib.data.batch_and_drop_remainder(batch_size)).prefetch(
+              dataset_config.prefetch_batches)
+  images, images_orig, labels, labels_one_hot = (
+      batches.make_one_shot_iterator().get_next())
+
+  return InputEndpoints(
+      images=images,
+      images_orig=images_orig,
+      labels=labels,
+      labels_one_hot=labels_one_hot)
+
+
 def get_data(dataset,
              batch_size,
              augment=False,
              central_crop_size=None,
              shuffle_config=None,
-             shuffle=True):
+             shuffle=True,
+             dataset_config=None):
   """Wraps calls to DatasetDataProviders and shuffle_batch.
 
   For more details about supported Dataset objects refer to datasets/fsns.py.
@@ -167,10 +255,17 @@ def get_data(dataset,
     central_crop_size: A CharLogittuple (crop_width, crop_height).
     shuffle_config: A namedtuple ShuffleBatchConfig.
     shuffle: if True use data shuffling.
+    dataset_config: optional, a namedtuple DatasetConfig. If set, the data is
+      read with a tf.data pipeline instead of DatasetDataProvider queues, and
+      shuffle_config is ignored.
 
   Returns:
-
+    An InputEndpoints namedtuple.
   """
+  if dataset_config:
+    return _get_data_with_tf_data(dataset, batch_size, augment,
+                                  central_crop_size, shuffle, dataset_config)
+
   if not shuffle_config:
     shuffle_config = DEFAULT_SHUFFLE_CONFIG
 
@@ -67,6 +67,23 @@ class DataProviderTest(tf.test.TestCase):
 
     self.assertEqual(images_np.shape, (batch_size, 100, 500, 3))
 
+  def test_tf_data_pipeline_has_correct_shape(self):
+    batch_size = 4
+    data = data_provider.get_data(
+        dataset=datasets.fsns_test.get_test_split(),
+        batch_size=batch_size,
+        augment=True,
+        central_crop_size=(500, 100),
+        dataset_config=data_provider.DEFAULT_DATASET_CONFIG)
+
+    with self.test_session() as sess:
+      images_np, images_orig_np, labels_np = sess.run(
+          [data.images, data.images_orig, data.labels_one_hot])
+
+    self.assertEqual(images_np.shape, (batch_size, 100, 500, 3))
+    self.assertEqual(images_orig_np.shape, (batch_size, 150, 600, 3))
+    self.assertEqual(labels_np.shape, (batch_size, 37, 134))
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -14,7 +14,19 @@ Usage:
 python demo_inference.py --batch_size=32 \
   --checkpoint=model.ckpt-399731\
   --image_path_pattern=./datasets/data/fsns/temp/fsns_train_%02d.png
+
+To OCR all the images matching a glob, restoring the checkpoint only once and
+writing a line "<path>\t<predicted text>" per image as the batches complete:
+python demo_inference.py --batch_size=32 \
+  --checkpoint=model.ckpt-399731\
+  --image_glob='./datasets/data/fsns/temp/*.png' \
+  --output_file=/tmp/predictions.tsv
 """
+import functools
+import logging
+from multiprocessing import pool
+import time
+
 import numpy as np
 import PIL.Image
 
@@ -33,6 +45,17 @@ common_flags.define()
 flags.DEFINE_string('image_path_pattern', '',
                     'A file pattern with a placeholder for the image index.')
 
+flags.DEFINE_string('image_glob', '',
+                    'If set, runs batched inference on all the images '
+                    'matching this glob instead of image_path_pattern.')
+
+flags.DEFINE_string('output_file', '',
+                    'File where to write the predictions of image_glob. '
+                    'Prints them if empty.')
+
+flags.DEFINE_integer('num_loader_threads', 8,
+                     'Number of threads loading the images of image_glob.')
+
 
 def get_dataset_image_size(dataset_name):
   # Ideally this info should be exposed through the dataset interface itself.
@@ -54,6 +77,60 @@ def load_images(file_pattern, batch_size, dataset_name):
   return images_actual_data
 
 
+def _load_image_into(images, index, path):
+  """Reads the image file into images[index]."""
+  pil_image = PIL.Image.open(tf.gfile.GFile(path, 'rb')).convert('RGB')
+  image = np.asarray(pil_image)
+  if image.shape != images.shape[1:]:
+    raise ValueError('Image %s has shape %s, expected %s' %
+                     (path, image.shape, images.shape[1:]))
+  images[index, ...] = image
+
+
+def iterate_image_batches(filenames, batch_size, dataset_name,
+                          num_threads=8):
+  """Loads the image files in batches with a pool of threads.
+
+  The images of the next batch are loaded while the caller processes the
+  current one, so at most two batches are held in memory.
+
+  Args:
+    filenames: a list of image files, of the image size of the dataset.
+    batch_size: number of images per batch.
+    dataset_name: name of the dataset, which defines the image size.
+    num_threads: number of threads loading the images.
+
+  Yields:
+    Tuples (batch_filenames, images), where images is a uint8 array of shape
+    [batch_size, height, width, 3]. The last batch is padded with zero images,
+    which are not listed in batch_filenames.
+  """
+  width, height = get_dataset_image_size(dataset_name)
+  chunks = [filenames[i:i + batch_size]
+            for i in range(0, len(filenames), batch_size)]
+  if not chunks:
+    return
+  thread_pool = pool.ThreadPool(num_threads)
+
+  def load_async(chunk):
+    images = np.zeros((batch_size, height, width, 3), dtype=np.uint8)
+    load = functools.partial(_load_image_into, images)
+    return images, thread_pool.map_async(lambda args: load(*args),
+                                         list(enumerate(chunk)))
+
+  try:
+    pending = load_async(chunks[0])
+    for i, chunk in enumerate(chunks):
+      images, result = pending
+      result.get()
+      if i + 1 < len(chunks):
+        pending = load_async(chunks[i + 1])
+      yield chunk, images
+  finally:
+    thread_pool.terminate()
+    thread_pool.join()
+
+
 def create_model(batch_size, dataset_name):
   width, height = get_dataset_image_size(dataset_name)
   dataset = common_flags.create_dataset(split_name=FLAGS.split_name)
@@ -84,7 +161,67 @@ def run(checkpoint, batch_size, dataset_name, image_path_pattern):
   return predictions.tolist()
 
 
+def run_batched(checkpoint, batch_size, dataset_name, filenames,
+                num_threads=8):
+  """Runs the model on all the image files, restoring the checkpoint once.
+
+  Args:
+    checkpoint: path of the checkpoint to restore.
+    batch_size: number of images per model run.
+    dataset_name: name of the dataset the model was trained on.
+    filenames: a list of image files, of the image size of the dataset.
+    num_threads: number of threads loading the images.
+
+  Yields:
+    Tuples (filename, predicted text) for all the files, in order, one batch
+    at a time.
+  """
+  images_placeholder, endpoints = create_model(batch_size, dataset_name)
+  session_creator = monitored_session.ChiefSessionCreator(
+    checkpoint_filename_with_path=checkpoint)
+  with monitored_session.MonitoredSession(
+      session_creator=session_creator) as sess:
+    num_images = 0
+    start_time = time.time()
+    for batch_filenames, images_data in iterate_image_batches(
+        filenames, batch_size, dataset_name, num_threads):
+      predictions = sess.run(endpoints.predicted_text,
+                             feed_dict={images_placeholder: images_data})
+      for filename, text in zip(batch_filenames, predictions):
+        yield filename, text
+      num_images += len(batch_filenames)
+      logging.info('Processed %d/%d images, %.1f images/sec', num_images,
+                   len(filenames), num_images / (time.time() - start_time))
+
+
+def run_on_glob(checkpoint, batch_size, dataset_name, image_glob, output_file,
+                num_threads=8):
+  """Writes the predictions of all the images matching image_glob.
+
+  Each image gets a line "<path>\t<predicted text>", written as soon as its
+  batch is done, so that the output of an interrupted run is usable.
+  """
+  filenames = sorted(tf.gfile.Glob(image_glob))
+  logging.info('Found %d images matching %s', len(filenames), image_glob)
+  predictions = run_batched(checkpoint, batch_size, dataset_name, filenames,
+                            num_threads)
+  if not output_file:
+    for filename, text in predictions:
+      print('%s\t%s' % (filename, tf.compat.as_str_any(text)))
+    return
+  with tf.gfile.GFile(output_file, 'wb') as f:
+    for i, (filename, text) in enumerate(predictions):
+      f.write(tf.compat.as_bytes(filename) + b'\t' + tf.compat.as_bytes(text) +
+              b'\n')
+      if (i + 1) % batch_size == 0:
+        f.flush()
+
+
 def main(_):
+  if FLAGS.image_glob:
+    run_on_glob(FLAGS.checkpoint, FLAGS.batch_size, FLAGS.dataset_name,
+                FLAGS.image_glob, FLAGS.output_file, FLAGS.num_loader_threads)
+    return
   print("Predicted strings:")
   predictions = run(FLAGS.checkpoint, FLAGS.batch_size, FLAGS.dataset_name,
                   FLAGS.image_path_pattern)
@@ -0,0 +1,59 @@
+"""Measures the throughput of batched inference with demo_inference.
+
+Times the loading of the images matching a glob with one thread and with
+--num_loader_threads threads, then the end-to-end batched inference, e.g.
+
+python inference_benchmark.py --batch_size=32 \
+  --checkpoint=model.ckpt-399731 \
+  --image_glob='./datasets/data/fsns/temp/*.png'
+"""
+import time
+
+import tensorflow as tf
+from tensorflow.python.platform import flags
+
+import demo_inference
+
+FLAGS = flags.FLAGS
+
+
+def benchmark_loading(filenames, num_threads):
+  """Returns the images/sec of loading the files in batches."""
+  start_time = time.time()
+  for _ in demo_inference.iterate_image_batches(
+      filenames, FLAGS.batch_size, FLAGS.dataset_name, num_threads):
+    pass
+  return len(filenames) / (time.time() - start_time)
+
+
+def benchmark_inference(filenames):
+  """Returns the seconds to the first prediction and the images/sec after."""
+  start_time = time.time()
+  predictions = demo_inference.run_batched(
+      FLAGS.checkpoint, FLAGS.batch_size, FLAGS.dataset_name, filenames,
+      FLAGS.num_loader_threads)
+  next(predictions)
+  first_batch_time = time.time()
+  for _ in predictions:
+    pass
+  num_images = max(len(filenames) - FLAGS.batch_size, 0)
+  return (first_batch_time - start_time,
+          num_images / max(time.time() - first_batch_time, 1e-9))
+
+
+def main(_):
+  filenames = sorted(tf.gfile.Glob(FLAGS.image_glob))
+  if not filenames:
+    raise ValueError('No images match %s' % FLAGS.image_glob)
+  print('Loading, 1 thread:   %8.1f images/sec' %
+        benchmark_loading(filenames, 1))
+  print('Loading, %d threads: %8.1f images/sec' %
+        (FLAGS.num_loader_threads,
+         benchmark_loading(filenames, FLAGS.num_loader_threads)))
+  startup_time, images_per_sec = benchmark_inference(filenames)
+  print('Inference: %.1f sec to the first batch (graph and checkpoint), '
+        'then %.1f images/sec' % (startup_time, images_per_sec))
+
+
+if __name__ == '__main__':
+  tf.app.run()
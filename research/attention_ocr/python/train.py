@@ -20,6 +20,7 @@ python train.py
 """
 import collections
 import logging
+import time
 import tensorflow as tf
 from tensorflow.contrib import slim
 from tensorflow import app
@@ -75,6 +76,26 @@ flags.DEFINE_boolean('reset_train_dir', False,
 
 flags.DEFINE_boolean('show_graph_stats', False,
                      'Output model size stats to stderr.')
+
+flags.DEFINE_bool('use_tf_data', False,
+                  'If True, reads the training data with a tf.data pipeline '
+                  'instead of queue runners.')
+
+flags.DEFINE_integer('num_parallel_reads', 8,
+                     'Number of data files read in parallel by the tf.data '
+                     'pipeline.')
+
+flags.DEFINE_integer('num_parallel_calls', 8,
+                     'Number of examples decoded and preprocessed in parallel '
+                     'by the tf.data pipeline.')
+
+flags.DEFINE_integer('prefetch_batches', 2,
+                     'Number of batches prefetched by the tf.data pipeline.')
+
+flags.DEFINE_integer('input_stats_every_n_steps', 0,
+                     'If positive, every this many steps logs how long the '
+                     'training step waited for its input batch and how long '
+                     'the rest of the step took.')
 # yapf: enable
 
 TrainingHParams = collections.namedtuple('TrainingHParams', [
@@ -93,6 +114,64 @@ def get_training_hparams():
       use_augment_input=FLAGS.use_augment_input)
 
 
+def get_dataset_config():
+  """Returns the tf.data pipeline config, or None to use queue runners."""
+  if not FLAGS.use_tf_data:
+    return None
+  return data_provider.DEFAULT_DATASET_CONFIG._replace(
+      num_parallel_reads=FLAGS.num_parallel_reads,
+      num_parallel_calls=FLAGS.num_parallel_calls,
+      prefetch_batches=FLAGS.prefetch_batches)
+
+
+class InputStatsTrainStep(object):
+  """A train_step_fn for slim.learning.train which reports input stalls.
+
+  Every n-th step is traced, and the time spent in the op producing the input
+  batch (the dequeue of the batching queue, or the get_next of the tf.data
+  iterator) is logged as input bound time, and the rest of the step as
+  compute bound time. The other steps run as slim.learning.train_step.
+  """
+
+  def __init__(self, input_op_name, every_n_steps):
+    self._input_op_name = input_op_name
+    self._every_n_steps = every_n_steps
+    self._num_steps = 0
+
+  def __call__(self, sess, train_op, global_step, train_step_kwargs):
+    self._num_steps += 1
+    if self._num_steps % self._every_n_steps:
+      return slim.learning.train_step(sess, train_op, global_step,
+                                      train_step_kwargs)
+
+    run_options = tf.RunOptions(trace_level=tf.RunOptions.SOFTWARE_TRACE)
+    run_metadata = tf.RunMetadata()
+    start_time = time.time()
+    total_loss, np_global_step = sess.run(
+        [train_op, global_step], options=run_options,
+        run_metadata=run_metadata)
+    step_time = time.time() - start_time
+
+    # The same node may be reported by several devices of the step stats.
+    input_time = 1e-6 * max([0] + [
+        node_stats.all_end_rel_micros
+        for dev_stats in run_metadata.step_stats.dev_stats
+        for node_stats in dev_stats.node_stats
+        if node_stats.node_name == self._input_op_name
+    ])
+    logging.info(
+        'global step %d: %.3f sec/step, input bound %.3f sec (%.0f%%), '
+        'compute bound %.3f sec', np_global_step, step_time, input_time,
+        100.0 * input_time / max(step_time, 1e-9),
+        max(step_time - input_time, 0.0))
+
+    if 'should_stop' in train_step_kwargs:
+      should_stop = sess.run(train_step_kwargs['should_stop'])
+    else:
+      should_stop = False
+    return total_loss, should_stop
+
+
 def create_optimizer(hparams):
   """Creates optimized based on the specified flags."""
   if hparams.optimizer == 'momentum':
@@ -110,13 +189,15 @@ def create_optimizer(hparams):
   return optimizer
 
 
-def train(loss, init_fn, hparams):
+def train(loss, init_fn, hparams, input_op_name=None):
   """Wraps slim.learning.train to run a training loop.
 
   Args:
     loss: a loss tensor
     init_fn: A callable to be executed after all other initialization is done.
     hparams: a model hyper parameters
+    input_op_name: optional, name of the op producing the input batch, needed
+      to log the input stats with --input_stats_every_n_steps.
   """
   optimizer = create_optimizer(hparams)
 
@@ -139,6 +220,12 @@ def train(loss, init_fn, hparams):
       summarize_gradients=True,
       clip_gradient_norm=FLAGS.clip_gradient_norm)
 
+  if FLAGS.input_stats_every_n_steps > 0 and input_op_name:
+    train_step_fn = InputStatsTrainStep(input_op_name,
+                                        FLAGS.input_stats_every_n_steps)
+  else:
+    train_step_fn = slim.learning.train_step
+
   slim.learning.train(
       train_op=train_op,
       logdir=FLAGS.train_log_dir,
@@ -150,7 +237,8 @@ def train(loss, init_fn, hparams):
       save_interval_secs=FLAGS.save_interval_secs,
       startup_delay_steps=startup_delay_steps,
       sync_optimizer=sync_optimizer,
-      init_fn=init_fn)
+      init_fn=init_fn,
+      train_step_fn=train_step_fn)
 
 
 def prepare_training_dir():
@@ -193,7 +281,8 @@ def main(_):
         dataset,
         FLAGS.batch_size,
         augment=hparams.use_augment_input,
-        central_crop_size=common_flags.get_crop_size())
+        central_crop_size=common_flags.get_crop_size(),
+        dataset_config=get_dataset_config())
     endpoints = model.create_base(data.images, data.labels_one_hot)
     total_loss = model.create_loss(data, endpoints)
     model.create_summaries(data, endpoints, dataset.charset, is_training=True)
@@ -202,7 +291,7 @@ def main(_):
     if FLAGS.show_graph_stats:
       logging.info('Total number of weights in the graph: %s',
                    calculate_graph_metrics())
-    train(total_loss, init_fn, hparams)
+    train(total_loss, init_fn, hparams, input_op_name=data.images.op.name)
 
 
 if __name__ == '__main__':
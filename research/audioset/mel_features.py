@@ -87,7 +87,7 @@ def stft_magnitude(signal, fft_length,
   # Apply frame window to each frame. We use a periodic Hann (cosine of period
   # window_length) instead of the symmetric Hann of np.hanning (period
   # window_length-1).
-  window = periodic_hann(window_length)
+  window = cached_periodic_hann(window_length)
   windowed_frames = frames * window
   return np.abs(np.fft.rfft(windowed_frames, int(fft_length)))
 
@@ -170,25 +170,78 @@ def spectrogram_to_mel_matrix(num_mel_bins=20,
   band_edges_mel = np.linspace(hertz_to_mel(lower_edge_hertz),
                                hertz_to_mel(upper_edge_hertz), num_mel_bins + 2)
   # Matrix to post-multiply feature arrays whose rows are num_spectrogram_bins
-  # of spectrogram values.
-  mel_weights_matrix = np.empty((num_spectrogram_bins, num_mel_bins))
-  for i in range(num_mel_bins):
-    lower_edge_mel, center_mel, upper_edge_mel = band_edges_mel[i:i + 3]
-    # Calculate lower and upper slopes for every spectrogram bin.
-    # Line segments are linear in the *mel* domain, not hertz.
-    lower_slope = ((spectrogram_bins_mel - lower_edge_mel) /
-                   (center_mel - lower_edge_mel))
-    upper_slope = ((upper_edge_mel - spectrogram_bins_mel) /
-                   (upper_edge_mel - center_mel))
-    # .. then intersect them with each other and zero.
-    mel_weights_matrix[:, i] = np.maximum(0.0, np.minimum(lower_slope,
-                                                          upper_slope))
+  # of spectrogram values. Column i is computed from the lower, center and
+  # upper edges band_edges_mel[i:i + 3].
+  lower_edge_mel = band_edges_mel[:-2]
+  center_mel = band_edges_mel[1:-1]
+  upper_edge_mel = band_edges_mel[2:]
+  spectrogram_bins_mel = spectrogram_bins_mel[:, np.newaxis]
+  # Calculate lower and upper slopes for every spectrogram bin and mel band.
+  # Line segments are linear in the *mel* domain, not hertz.
+  lower_slope = ((spectrogram_bins_mel - lower_edge_mel) /
+                 (center_mel - lower_edge_mel))
+  upper_slope = ((upper_edge_mel - spectrogram_bins_mel) /
+                 (upper_edge_mel - center_mel))
+  # .. then intersect them with each other and zero.
+  mel_weights_matrix = np.maximum(0.0, np.minimum(lower_slope, upper_slope))
   # HTK excludes the spectrogram DC bin; make sure it always gets a zero
   # coefficient.
   mel_weights_matrix[0, :] = 0.0
   return mel_weights_matrix
 
 
+# Caches of read-only windows and mel matrices, keyed by their arguments.
+_PERIODIC_HANN_CACHE = {}
+_MEL_MATRIX_CACHE = {}
+
+
+def cached_periodic_hann(window_length):
+  """Like periodic_hann(), but returns a cached, read-only window.
+
+  Args:
+    window_length: The number of points in the returned window.
+
+  Returns:
+    A read-only 1D np.array containing the periodic hann window.
+  """
+  window = _PERIODIC_HANN_CACHE.get(window_length)
+  if window is None:
+    window = periodic_hann(window_length)
+    window.flags.writeable = False
+    _PERIODIC_HANN_CACHE[window_length] = window
+  return window
+
+
+def cached_spectrogram_to_mel_matrix(num_mel_bins=20,
+                                     num_spectrogram_bins=129,
+                                     audio_sample_rate=8000,
+                                     lower_edge_hertz=125.0,
+                                     upper_edge_hertz=3800.0):
+  """Like spectrogram_to_mel_matrix(), but returns a cached, read-only matrix.
+
+  Args:
+    num_mel_bins: See spectrogram_to_mel_matrix().
+    num_spectrogram_bins: See spectrogram_to_mel_matrix().
+    audio_sample_rate: See spectrogram_to_mel_matrix().
+    lower_edge_hertz: See spectrogram_to_mel_matrix().
+    upper_edge_hertz: See spectrogram_to_mel_matrix().
+
+  Returns:
+    A read-only np.array with shape (num_spectrogram_bins, num_mel_bins).
+
+  Raises:
+    ValueError: if frequency edges are incorrectly ordered or out of range.
+  """
+  key = (num_mel_bins, num_spectrogram_bins, audio_sample_rate,
+         lower_edge_hertz, upper_edge_hertz)
+  mel_matrix = _MEL_MATRIX_CACHE.get(key)
+  if mel_matrix is None:
+    mel_matrix = spectrogram_to_mel_matrix(*key)
+    mel_matrix.flags.writeable = False
+    _MEL_MATRIX_CACHE[key] = mel_matrix
+  return mel_matrix
+
+
 def log_mel_spectrogram(data,
                         audio_sample_rate=8000,
                         log_offset=0.0,
@@ -217,7 +270,7 @@ def log_mel_spectrogram(data,
       fft_length=fft_length,
       hop_length=hop_length_samples,
       window_length=window_length_samples)
-  mel_spectrogram = np.dot(spectrogram, spectrogram_to_mel_matrix(
+  mel_spectrogram = np.dot(spectrogram, cached_spectrogram_to_mel_matrix(
       num_spectrogram_bins=spectrogram.shape[1],
       audio_sample_rate=audio_sample_rate, **kwargs))
   return np.log(mel_spectrogram + log_offset)
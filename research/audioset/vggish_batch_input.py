@@ -0,0 +1,254 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Batched and streaming computation of input examples for VGGish.
+
+vggish_input.waveform_to_examples() handles one waveform at a time. The
+ExampleExtractor in this module produces the same examples, but computes the
+STFT, mel projection and log of many clips in a single pass, and can stream
+fixed-size batches of examples from long WAV files without reading them into
+memory.
+"""
+
+try:
+  from math import gcd
+except ImportError:  # Python 2.
+  from fractions import gcd
+
+import numpy as np
+import resampy
+from scipy.io import wavfile
+
+import mel_features
+import vggish_params
+
+# Context (in seconds) resampled on either side of each chunk of a streamed
+# file, so that the resampling filter sees the same input it would see if the
+# whole file were resampled at once.
+_RESAMPLE_CONTEXT_SECONDS = 0.1
+
+
+class ExampleExtractor(object):
+  """Converts audio waveforms into batches of VGGish input examples.
+
+  The Hann window and mel matrix are computed once per extractor (and cached
+  across extractors by mel_features), and the frames of all clips in a batch
+  are gathered with stride tricks from one concatenated buffer so that the FFT,
+  mel projection and log are each a single NumPy call.
+  """
+
+  def __init__(self, sample_rate=vggish_params.SAMPLE_RATE):
+    """Constructs an extractor.
+
+    Args:
+      sample_rate: Sample rate of the waveforms that the examples are computed
+        from. Waveforms at other rates are resampled to this rate first.
+    """
+    self._sample_rate = sample_rate
+    self._window_length = int(round(
+        sample_rate * vggish_params.STFT_WINDOW_LENGTH_SECONDS))
+    self._hop_length = int(round(
+        sample_rate * vggish_params.STFT_HOP_LENGTH_SECONDS))
+    self._fft_length = 2 ** int(
+        np.ceil(np.log(self._window_length) / np.log(2.0)))
+    self._window = mel_features.cached_periodic_hann(self._window_length)
+    self._mel_matrix = mel_features.cached_spectrogram_to_mel_matrix(
+        num_mel_bins=vggish_params.NUM_MEL_BINS,
+        num_spectrogram_bins=self._fft_length // 2 + 1,
+        audio_sample_rate=sample_rate,
+        lower_edge_hertz=vggish_params.MEL_MIN_HZ,
+        upper_edge_hertz=vggish_params.MEL_MAX_HZ)
+
+    features_sample_rate = 1.0 / vggish_params.STFT_HOP_LENGTH_SECONDS
+    self._example_window_length = int(round(
+        vggish_params.EXAMPLE_WINDOW_SECONDS * features_sample_rate))
+    self._example_hop_length = int(round(
+        vggish_params.EXAMPLE_HOP_SECONDS * features_sample_rate))
+
+    # Number of waveform samples covered by, and between the starts of,
+    # consecutive examples.
+    self._example_samples = ((self._example_window_length - 1) *
+                             self._hop_length + self._window_length)
+    self._example_hop_samples = self._example_hop_length * self._hop_length
+
+  def _to_mono(self, data, sample_rate):
+    """Converts a waveform to mono at the extractor's sample rate."""
+    if len(data.shape) > 1:
+      data = np.mean(data, axis=1)
+    if sample_rate != self._sample_rate:
+      data = resampy.resample(data, sample_rate, self._sample_rate)
+    return data
+
+  def _num_frames(self, num_samples, window_length, hop_length):
+    """Returns the number of complete frames mel_features.frame() extracts."""
+    if num_samples < window_length:
+      return 0
+    return 1 + (num_samples - window_length) // hop_length
+
+  def _gather_frames(self, data, lengths, window_length, hop_length):
+    """Gathers the frames of several concatenated sequences.
+
+    Args:
+      data: np.array of shape (sum(lengths), ...) holding the concatenated
+        sequences.
+      lengths: List of the lengths of each sequence.
+      window_length: Number of rows in each frame.
+      hop_length: Advance (in rows) between each frame of a sequence.
+
+    Returns:
+      frames: np.array of shape (num_frames, window_length, ...) containing
+        the frames of every sequence in order.
+      num_frames: np.array with the number of frames of each sequence.
+    """
+    num_frames = np.array([
+        self._num_frames(length, window_length, hop_length)
+        for length in lengths], dtype=np.int64)
+    if len(data) < window_length:
+      return np.zeros((0, window_length) + data.shape[1:], data.dtype), (
+          num_frames)
+    # Every possible frame start, as a strided view that does not copy data.
+    all_frames = mel_features.frame(data, window_length, 1)
+    seq_starts = np.cumsum(lengths) - lengths
+    frame_offsets = np.arange(num_frames.sum()) - np.repeat(
+        np.cumsum(num_frames) - num_frames, num_frames)
+    frame_starts = (np.repeat(seq_starts, num_frames) +
+                    frame_offsets * hop_length)
+    return all_frames[frame_starts], num_frames
+
+  def _examples_from_mono(self, waveforms):
+    """Computes the examples of mono waveforms at the extractor's rate."""
+    lengths = [len(waveform) for waveform in waveforms]
+    data = (np.concatenate(waveforms) if waveforms
+            else np.zeros(0, dtype=np.float64))
+    frames, num_frames = self._gather_frames(
+        data, lengths, self._window_length, self._hop_length)
+    spectrogram = np.abs(np.fft.rfft(frames * self._window, self._fft_length))
+    log_mel = np.log(np.dot(spectrogram, self._mel_matrix) +
+                     vggish_params.LOG_OFFSET)
+    return self._gather_frames(log_mel, num_frames,
+                               self._example_window_length,
+                               self._example_hop_length)
+
+  def waveform_to_examples(self, data, sample_rate):
+    """Converts one waveform into examples.
+
+    Args:
+      data: See vggish_input.waveform_to_examples().
+      sample_rate: Sample rate of data.
+
+    Returns:
+      See vggish_input.waveform_to_examples().
+    """
+    examples, _ = self.waveforms_to_examples([data], [sample_rate])
+    return examples
+
+  def waveforms_to_examples(self, waveforms, sample_rates):
+    """Converts a batch of waveforms into examples in one pass.
+
+    Args:
+      waveforms: List of np.arrays, each of which is a waveform as accepted by
+        vggish_input.waveform_to_examples(). The waveforms may have different
+        lengths, numbers of channels and sample rates.
+      sample_rates: List of the sample rates of each waveform, or a single
+        sample rate shared by all of them.
+
+    Returns:
+      examples: 3-D np.array of shape [num_examples, num_frames, num_bands]
+        containing the examples of every waveform in order.
+      num_examples: 1-D np.array with the number of examples of each waveform,
+        which may be 0 for waveforms shorter than one example.
+    """
+    if np.isscalar(sample_rates):
+      sample_rates = [sample_rates] * len(waveforms)
+    return self._examples_from_mono([
+        self._to_mono(np.asarray(data), sample_rate)
+        for data, sample_rate in zip(waveforms, sample_rates)])
+
+  def wavfile_to_example_batches(self, wav_file, batch_size,
+                                 chunk_seconds=60.0):
+    """Streams batches of examples from a WAV file.
+
+    The file is memory-mapped and processed chunk_seconds of audio at a time,
+    so arbitrarily long files can be processed in bounded memory. Without
+    resampling, the examples are identical to those of
+    vggish_input.wavfile_to_examples(); with resampling they differ only by
+    floating point rounding.
+
+    Args:
+      wav_file: String path to a WAV file with signed 16-bit PCM samples.
+      batch_size: Number of examples in each yielded batch.
+      chunk_seconds: Approximate duration of audio read at a time.
+
+    Yields:
+      3-D np.arrays of shape [batch_size, num_frames, num_bands]. The last
+      batch may contain fewer than batch_size examples.
+    """
+    sr, wav_data = wavfile.read(wav_file, mmap=True)
+    assert wav_data.dtype == np.int16, 'Bad sample type: %r' % wav_data.dtype
+
+    # Chunk boundaries are placed at multiples of input_unit input samples,
+    # which correspond to exactly output_unit resampled samples.
+    divisor = gcd(sr, self._sample_rate)
+    input_unit = sr // divisor
+    output_unit = self._sample_rate // divisor
+    units_per_chunk = max(1, int(chunk_seconds * sr) // input_unit)
+    context_units = 0
+    if sr != self._sample_rate:
+      context_units = int(np.ceil(_RESAMPLE_CONTEXT_SECONDS * sr / input_unit))
+
+    num_samples = len(wav_data)
+    buffered = []  # Resampled audio not yet covered by emitted examples.
+    num_buffered = 0
+    pending = []  # Examples not yet emitted in a batch.
+    num_pending = 0
+    for chunk_unit in range(0, -(-num_samples // input_unit), units_per_chunk):
+      start = chunk_unit * input_unit
+      end = min(num_samples, start + units_per_chunk * input_unit)
+      context_start = max(0, start - context_units * input_unit)
+      context_end = min(num_samples, end + context_units * input_unit)
+      chunk = self._to_mono(
+          wav_data[context_start:context_end] / 32768.0, sr)
+      # Trim the context from the resampled chunk.
+      trim_start = (start - context_start) // input_unit * output_unit
+      trim_end = trim_start + int(np.ceil(
+          (end - start) * output_unit / float(input_unit)))
+      chunk = chunk[trim_start:trim_end]
+      buffered.append(chunk)
+      num_buffered += len(chunk)
+
+      num_examples = self._num_frames(num_buffered, self._example_samples,
+                                      self._example_hop_samples)
+      if not num_examples:
+        continue
+      data = np.concatenate(buffered)
+      covered = num_examples * self._example_hop_samples
+      examples, _ = self._examples_from_mono(
+          [data[:covered - self._example_hop_samples +
+                self._example_samples]])
+      buffered = [data[covered:]]
+      num_buffered = len(buffered[0])
+
+      pending.append(examples)
+      num_pending += len(examples)
+      if num_pending >= batch_size:
+        examples = np.concatenate(pending)
+        num_batches = num_pending // batch_size
+        for i in range(num_batches):
+          yield examples[i * batch_size:(i + 1) * batch_size]
+        pending = [examples[num_batches * batch_size:]]
+        num_pending = len(pending[0])
+
+    if num_pending:
+      yield np.concatenate(pending)
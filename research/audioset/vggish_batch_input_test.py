@@ -0,0 +1,109 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests that vggish_batch_input matches vggish_input.
+
+Usage:
+  $ python vggish_batch_input_test.py
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+import vggish_batch_input
+import vggish_input
+
+# (sample rate, duration in seconds) of the waveforms compared. The durations
+# cover waveforms shorter than one example, exactly one example, and several
+# examples with a partial one at the end.
+_WAVEFORMS = [(16000, 0.5), (16000, 0.96), (16000, 3.3), (44100, 2.1),
+              (22050, 1.7), (8000, 4.0)]
+
+
+class VggishBatchInputTest(unittest.TestCase):
+
+  def setUp(self):
+    self._rng = np.random.RandomState(0)
+    self._tmp_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self._tmp_dir)
+
+  def _random_waveform(self, sample_rate, seconds, num_channels=None):
+    shape = (int(sample_rate * seconds),)
+    if num_channels:
+      shape += (num_channels,)
+    return self._rng.uniform(-1.0, 1.0, size=shape)
+
+  def assertExamplesClose(self, expected, actual):
+    self.assertEqual(expected.shape, actual.shape)
+    if expected.size:
+      np.testing.assert_allclose(expected, actual, rtol=1e-6, atol=1e-6)
+
+  def testWaveformToExamples(self):
+    extractor = vggish_batch_input.ExampleExtractor()
+    for sample_rate, seconds in _WAVEFORMS:
+      for num_channels in (None, 2):
+        data = self._random_waveform(sample_rate, seconds, num_channels)
+        self.assertExamplesClose(
+            vggish_input.waveform_to_examples(data, sample_rate),
+            extractor.waveform_to_examples(data, sample_rate))
+
+  def testWaveformsToExamples(self):
+    waveforms = []
+    sample_rates = []
+    for sample_rate, seconds in _WAVEFORMS:
+      waveforms.append(self._random_waveform(sample_rate, seconds))
+      sample_rates.append(sample_rate)
+    expected = [vggish_input.waveform_to_examples(data, sample_rate)
+                for data, sample_rate in zip(waveforms, sample_rates)]
+
+    examples, num_examples = (
+        vggish_batch_input.ExampleExtractor().waveforms_to_examples(
+            waveforms, sample_rates))
+    self.assertEqual([len(e) for e in expected], list(num_examples))
+    self.assertExamplesClose(np.concatenate(expected), examples)
+
+  def testWavfileToExampleBatches(self):
+    extractor = vggish_batch_input.ExampleExtractor()
+    for sample_rate, seconds in _WAVEFORMS:
+      wav_file = os.path.join(self._tmp_dir, '%d.wav' % sample_rate)
+      samples = (self._random_waveform(sample_rate, seconds, 2) *
+                 32767).astype(np.int16)
+      wavfile.write(wav_file, sample_rate, samples)
+      expected = vggish_input.wavfile_to_examples(wav_file)
+
+      for batch_size, chunk_seconds in ((1, 0.3), (3, 1.0), (100, 60.0)):
+        batches = list(extractor.wavfile_to_example_batches(
+            wav_file, batch_size, chunk_seconds=chunk_seconds))
+        self.assertTrue(all(len(batch) == batch_size
+                            for batch in batches[:-1]))
+        if batches:
+          self.assertTrue(0 < len(batches[-1]) <= batch_size)
+          actual = np.concatenate(batches)
+        else:
+          actual = np.zeros_like(expected)
+        # Resampling chunks with a finite context only matches resampling
+        # the whole file up to floating point rounding.
+        self.assertExamplesClose(expected, actual)
+
+
+if __name__ == '__main__':
+  unittest.main()
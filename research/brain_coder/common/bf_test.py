@@ -132,6 +132,45 @@ class BfTest(tf.test.TestCase):
             next_input=0, output_buffer=[2, 1, 0])],
         er.program_trace)
 
+  def testCompiledProgram(self):
+    program = bf.compile_program('++++>>-<,[-]]x.')
+    self.assertFalse(program.correct_syntax)
+    self.assertEqual(
+        [2, 0, 3, 1, 7, 4, 3, 5, 5, 8, 6],
+        program.ops)
+    self.assertEqual(
+        [4, 2, 1, 1, 1, 7, 1, 5, 8, 1, 1],
+        program.args)
+
+    # Run-length folded ops are partially executed when the step limit is
+    # reached.
+    er = bf.evaluate(program, base=10, max_steps=3,
+                     require_correct_syntax=False, output_memory=True)
+    self.assertEqual(
+        ([], False, bf.Status.STEP_LIMIT, 3, [3]),
+        (er.output, er.success, er.failure_reason, er.steps, er.memory))
+
+    # A compiled program can be evaluated on many inputs.
+    program = bf.compile_program(',[-]+.>.')
+    self.assertCorrectOutput([1, 0], bf.evaluate(program, input_buffer=[5]))
+    self.assertCorrectOutput([1, 0], bf.evaluate(program, input_buffer=[]))
+
+  def testEvaluateBatch(self):
+    results = bf.evaluate_batch(
+        ['>,[>,]<[.<]', '+.[].', '+]'], [[4, 3, 2], [1]], base=5,
+        timeout=None, max_steps=100)
+    self.assertEqual(3, len(results))
+    self.assertEqual([[2, 3, 4], [1]], [r.output for r in results[0]])
+    self.assertEqual([bf.Status.STEP_LIMIT] * 2,
+                     [r.failure_reason for r in results[1]])
+    self.assertEqual([bf.Status.SYNTAX_ERROR] * 2,
+                     [r.failure_reason for r in results[2]])
+
+    results = bf.evaluate_batch(
+        ['+.[].'], [[], []], stop_on_failure=True, base=5, timeout=None,
+        max_steps=100)
+    self.assertEqual(1, len(results[0]))
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -6,6 +6,10 @@ from __future__ import print_function
 
 Implementations here are based on code from Open AI:
 https://github.com/openai/universe-starter-agent/blob/master/a3c.py.
+
+Rollout holds one episode in python lists. RolloutStore holds many episodes in
+flat numpy arrays, and computes returns and advantages for all of them at once
+with batch_discounted_advantage_and_rewards.
 """
 
 from collections import namedtuple
@@ -225,6 +229,92 @@ def discounted_advantage_and_rewards(rewards, values, gamma, lambda_=1.0):
   return empirical_values, generalized_advantage
 
 
+def _discount_rows(x, gamma):
+  """Applies discount to each row of the 2D array x."""
+  return scipy.signal.lfilter([1], [1, -gamma], x[:, ::-1], axis=1)[:, ::-1]
+
+
+def _pad_episodes(flat, episode_lengths, max_time, dtype=np.float32):
+  """Scatters concatenated episodes into the rows of a zero padded array.
+
+  Args:
+    flat: Numpy array holding the timesteps of all episodes, in order.
+    episode_lengths: Numpy array with the number of timesteps of each episode.
+    max_time: Length of the rows. At least max(episode_lengths).
+    dtype: Type of the output array.
+
+  Returns:
+    Numpy array of shape (len(episode_lengths), max_time) + flat.shape[1:].
+  """
+  episode_starts = np.cumsum(episode_lengths) - episode_lengths
+  episode_index = np.repeat(np.arange(len(episode_lengths)), episode_lengths)
+  time_index = (np.arange(len(episode_index)) -
+                np.repeat(episode_starts, episode_lengths))
+  padded = np.zeros((len(episode_lengths), max_time) + flat.shape[1:],
+                    dtype=dtype)
+  padded[episode_index, time_index] = flat
+  return padded
+
+
+def batch_discounted_advantage_and_rewards(rewards, values, episode_lengths,
+                                           gamma, lambda_=1.0,
+                                           bootstrap_values=None):
+  """Compute advantages and returns for many episodes at once.
+
+  Equivalent to calling discounted_advantage_and_rewards on each episode and
+  padding the results, but the episodes are laid out as the rows of a 2D
+  array and scanned together, so the cost does not grow with the number of
+  episodes.
+
+  Args:
+    rewards: Rewards of all episodes, concatenated in episode order.
+    values: Estimated values of all episodes, concatenated like rewards.
+    episode_lengths: Number of timesteps of each episode.
+    gamma: See gamma argument in discounted_advantage_and_rewards.
+    lambda_: See lambda_ argument in discounted_advantage_and_rewards.
+    bootstrap_values: Optional estimated value V(s_T) of the final state of
+        each episode, i.e. the extra item of `values` in
+        discounted_advantage_and_rewards. None means no bootstrapping.
+
+  Returns:
+    empirical_values: Returns at each timestep.
+    generalized_advantage: Advantages at each timestep.
+    Both are float32 numpy arrays of shape
+    (len(episode_lengths), max(episode_lengths)), padded with 0s.
+
+  Raises:
+    ValueError: If the lengths of rewards and values do not match
+        episode_lengths.
+  """
+  episode_lengths = np.asarray(episode_lengths, dtype=np.int64)
+  rewards = np.asarray(rewards, dtype=np.float32)
+  values = np.asarray(values, dtype=np.float32)
+  num_timesteps = episode_lengths.sum()
+  if len(rewards) != num_timesteps or len(values) != num_timesteps:
+    raise ValueError(
+        'rewards and values must have sum(episode_lengths) = %d items. Got %d '
+        'rewards and %d values.' % (num_timesteps, len(rewards), len(values)))
+  max_time = episode_lengths.max() if len(episode_lengths) else 0
+
+  # An extra column holds V(s_T), which is 0 without bootstrapping. The float32
+  # inputs are padded as float64, like np.append does in
+  # discounted_advantage_and_rewards.
+  rewards = _pad_episodes(rewards, episode_lengths, max_time + 1, np.float64)
+  values = _pad_episodes(values, episode_lengths, max_time + 1, np.float64)
+  if bootstrap_values is not None:
+    final_steps = (np.arange(len(episode_lengths)), episode_lengths)
+    bootstrap_values = np.asarray(bootstrap_values, dtype=np.float32)
+    rewards[final_steps] = bootstrap_values
+    values[final_steps] = bootstrap_values
+  mask = np.arange(max_time) < episode_lengths[:, None]
+
+  empirical_values = _discount_rows(rewards, gamma)[:, :-1] * mask
+  delta = (rewards[:, :-1] + gamma * values[:, 1:] - values[:, :-1]) * mask
+  generalized_advantage = _discount_rows(delta, gamma * lambda_)
+  return (empirical_values.astype(np.float32),
+          generalized_advantage.astype(np.float32))
+
+
 """Batch holds a minibatch of episodes.
 
 Let bi = batch_index, i.e. the index of each episode in the minibatch.
@@ -284,15 +374,10 @@ def process_rollouts(rollouts, gamma, lambda_=1.0):
   states = utils.stack_pad([ro.states for ro in rollouts], 0, max_time)
   actions = utils.stack_pad([ro.actions for ro in rollouts], 0, max_time)
 
-  discounted_rewards = [None] * batch_size
-  discounted_adv = [None] * batch_size
-  for i, ro in enumerate(rollouts):
-    disc_r, disc_adv = discounted_advantage_and_rewards(
-        ro.rewards, ro.values, gamma, lambda_)
-    discounted_rewards[i] = disc_r
-    discounted_adv[i] = disc_adv
-  discounted_rewards = utils.stack_pad(discounted_rewards, 0, max_time)
-  discounted_adv = utils.stack_pad(discounted_adv, 0, max_time)
+  discounted_rewards, discounted_adv = batch_discounted_advantage_and_rewards(
+      [r for ro in rollouts for r in ro.rewards],
+      [v for ro in rollouts for v in ro.values],
+      episode_lengths, gamma, lambda_)
 
   total_rewards = [sum(ro.rewards) for ro in rollouts]
 
@@ -304,3 +389,179 @@ def process_rollouts(rollouts, gamma, lambda_=1.0):
                episode_lengths=episode_lengths,
                batch_size=batch_size,
                max_time=max_time)
+
+
+class RolloutStore(object):
+  """Holds the timesteps of many episodes in flat numpy arrays.
+
+  This is an alternative to a list of Rollout instances for large batches of
+  short episodes. Timesteps are written into preallocated buffers, which
+  double in size when full, and episode i occupies timesteps
+  [offsets[i], offsets[i + 1]). process() then converts all episodes into a
+  Batch at once, without per-episode python overhead.
+
+  Timesteps are added to the current episode with `add` or `add_many`, which
+  have the same arguments as in Rollout. Adding a timestep with
+  terminated=True ends the current episode, and the next timestep starts a
+  new one.
+  """
+
+  def __init__(self, state_shape=(), state_dtype=np.float32,
+               action_dtype=np.float32, capacity=1024):
+    """Creates an empty store.
+
+    Args:
+      state_shape: Shape of each state.
+      state_dtype: Type of the states.
+      action_dtype: Type of the actions.
+      capacity: Initial number of timesteps the buffers can hold.
+    """
+    capacity = max(1, capacity)
+    self._states = np.zeros((capacity,) + tuple(state_shape), state_dtype)
+    self._actions = np.zeros(capacity, action_dtype)
+    self._rewards = np.zeros(capacity, np.float64)
+    self._values = np.zeros(capacity, np.float64)
+    self._offsets = [0]
+    self._bootstrap_values = []
+    self._size = 0
+
+  @property
+  def num_episodes(self):
+    """Number of terminated episodes."""
+    return len(self._offsets) - 1
+
+  @property
+  def num_timesteps(self):
+    """Number of timesteps, including those of the unterminated episode."""
+    return self._size
+
+  @property
+  def offsets(self):
+    """Numpy array with the first timestep of each episode, and the end."""
+    return np.asarray(self._offsets, dtype=np.int64)
+
+  @property
+  def episode_lengths(self):
+    return np.diff(self.offsets)
+
+  def clear(self):
+    """Removes all timesteps, keeping the allocated buffers."""
+    self._offsets = [0]
+    self._bootstrap_values = []
+    self._size = 0
+
+  def _reserve(self, num_timesteps):
+    """Grows the buffers to hold num_timesteps more timesteps."""
+    capacity = len(self._rewards)
+    if self._size + num_timesteps <= capacity:
+      return
+    while capacity < self._size + num_timesteps:
+      capacity *= 2
+    for name in ('_states', '_actions', '_rewards', '_values'):
+      old = getattr(self, name)
+      new = np.zeros((capacity,) + old.shape[1:], old.dtype)
+      new[:self._size] = old[:self._size]
+      setattr(self, name, new)
+
+  def _end_episode(self, bootstrap_value):
+    self._offsets.append(self._size)
+    self._bootstrap_values.append(
+        0.0 if bootstrap_value is None else bootstrap_value)
+
+  def add(self, state, action, reward, value=0.0, terminated=False,
+          bootstrap_value=None):
+    """Add the next timestep to the current episode.
+
+    Args:
+      state: The state observed at the start of this timestep.
+      action: The action taken after observing the given state.
+      reward: The reward received for taking the given action.
+      value: The value estimated for the given state.
+      terminated: Whether this timestep ends the episode.
+      bootstrap_value: Optional value V(s_T) estimated for the state observed
+          after this timestep, if it ends the episode before a terminal state.
+    """
+    self._reserve(1)
+    self._states[self._size] = state
+    self._actions[self._size] = action
+    self._rewards[self._size] = reward
+    self._values[self._size] = value
+    self._size += 1
+    if terminated:
+      self._end_episode(bootstrap_value)
+
+  def add_many(self, states, actions, rewards, values=None, terminated=False,
+               bootstrap_value=None):
+    """Add many timesteps to the current episode.
+
+    Arguments are the same as `add`, but are sequences of equal size.
+
+    Raises:
+      ValueError: If the lengths of all the inputs are not equal.
+    """
+    n = len(states)
+    if len(actions) != n or len(rewards) != n or (
+        values is not None and len(values) != n):
+      raise ValueError(
+          'Number of states, actions, rewards and values must be the same. '
+          'Got %d states, %d actions, %d rewards and %s values.'
+          % (n, len(actions), len(rewards),
+             'no' if values is None else len(values)))
+    self._reserve(n)
+    end = self._size + n
+    if n:
+      self._states[self._size:end] = states
+      self._actions[self._size:end] = actions
+      self._rewards[self._size:end] = rewards
+      self._values[self._size:end] = values if values is not None else 0.0
+    self._size = end
+    if terminated:
+      self._end_episode(bootstrap_value)
+
+  def add_rollout(self, rollout):
+    """Appends the timesteps of a Rollout instance."""
+    self.add_many(rollout.states, rollout.actions, rollout.rewards,
+                  rollout.values, rollout.terminated)
+
+  def total_rewards(self):
+    """Returns a float64 numpy array with the total reward of each episode."""
+    episode_index = np.repeat(np.arange(self.num_episodes),
+                              self.episode_lengths)
+    return np.bincount(episode_index,
+                       weights=self._rewards[:self._offsets[-1]],
+                       minlength=self.num_episodes)
+
+  def process(self, gamma, lambda_=1.0, dtype=np.float32):
+    """Convert the episodes into tensors ready to be fed into a model.
+
+    Args:
+      gamma: See gamma argument in discounted_advantage_and_rewards.
+      lambda_: See lambda_ argument in discounted_advantage_and_rewards.
+      dtype: Type of the states and actions in the batch.
+
+    Returns:
+      Batch instance, as returned by process_rollouts for the same episodes.
+
+    Raises:
+      ValueError: If the last episode is not terminated.
+    """
+    if self._size != self._offsets[-1]:
+      raise ValueError('Can only process terminal rollouts.')
+    episode_lengths = self.episode_lengths
+    max_time = int(episode_lengths.max()) if self.num_episodes else 0
+    states = _pad_episodes(self._states[:self._size], episode_lengths,
+                           max_time, dtype)
+    actions = _pad_episodes(self._actions[:self._size], episode_lengths,
+                            max_time, dtype)
+    # A bootstrap value of 0 is the same as no bootstrapping.
+    discounted_rewards, discounted_adv = batch_discounted_advantage_and_rewards(
+        self._rewards[:self._size], self._values[:self._size], episode_lengths,
+        gamma, lambda_, self._bootstrap_values)
+    return Batch(states=states,
+                 actions=actions,
+                 discounted_adv=discounted_adv,
+                 discounted_r=discounted_rewards,
+                 total_rewards=self.total_rewards().tolist(),
+                 episode_lengths=episode_lengths.tolist(),
+                 batch_size=self.num_episodes,
+                 max_time=max_time)
@@ -124,6 +124,75 @@ class RolloutTest(tf.test.TestCase):
     self.assertTrue(
         np.allclose(expected_advantages, batch.discounted_adv))
 
+  def testBatchDiscountedAdvantageAndRewards(self):
+    rng = np.random.RandomState(0)
+    episode_lengths = [3, 1, 7, 0, 2]
+    rewards = rng.randn(sum(episode_lengths)).tolist()
+    values = rng.randn(sum(episode_lengths)).tolist()
+    bootstrap_values = rng.randn(len(episode_lengths)).tolist()
+    offsets = np.cumsum([0] + episode_lengths)
+    for g, l in [(1.0, 1.0), (0.95, 0.5), (0.5, 0.0)]:
+      for bootstrap in [False, True]:
+        empirical_values, generalized_advantage = (
+            rollout_lib.batch_discounted_advantage_and_rewards(
+                rewards, values, episode_lengths, g, l,
+                bootstrap_values if bootstrap else None))
+        self.assertEqual((5, 7), empirical_values.shape)
+        self.assertEqual((5, 7), generalized_advantage.shape)
+        for i, length in enumerate(episode_lengths):
+          episode_values = values[offsets[i]:offsets[i + 1]]
+          if bootstrap:
+            episode_values += [bootstrap_values[i]]
+          (expected_values,
+           expected_advantage) = rollout_lib.discounted_advantage_and_rewards(
+               rewards[offsets[i]:offsets[i + 1]], episode_values, g, l)
+          self.assertAllClose(expected_values, empirical_values[i, :length])
+          self.assertAllClose(expected_advantage,
+                              generalized_advantage[i, :length])
+          self.assertFalse(empirical_values[i, length:].any())
+          self.assertFalse(generalized_advantage[i, length:].any())
+
+  def testRolloutStoreMatchesProcessRollouts(self):
+    rng = np.random.RandomState(0)
+    g, l = 0.95, 0.9
+    rollouts = []
+    # A small capacity makes the store grow its buffers.
+    store = rollout_lib.RolloutStore(capacity=2)
+    for i, length in enumerate([4, 1, 6, 3]):
+      rollout = self.MakeRollout(
+          states=rng.randint(10, size=length).tolist(),
+          actions=rng.randint(10, size=length).tolist(),
+          rewards=rng.randn(length).tolist(),
+          values=rng.randn(length).tolist())
+      rollouts.append(rollout)
+      if i % 2:
+        store.add_rollout(rollout)
+      else:
+        for t in range(length):
+          store.add(rollout.states[t], rollout.actions[t], rollout.rewards[t],
+                    rollout.values[t], terminated=t == length - 1)
+    expected_batch = rollout_lib.process_rollouts(rollouts, gamma=g, lambda_=l)
+    batch = store.process(gamma=g, lambda_=l)
+
+    self.assertEqual(expected_batch.batch_size, batch.batch_size)
+    self.assertEqual(expected_batch.max_time, batch.max_time)
+    self.assertEqual(expected_batch.episode_lengths, batch.episode_lengths)
+    self.assertAllClose(expected_batch.total_rewards, batch.total_rewards)
+    self.assertAllEqual(expected_batch.states, batch.states)
+    self.assertAllEqual(expected_batch.actions, batch.actions)
+    self.assertAllClose(expected_batch.discounted_r, batch.discounted_r)
+    self.assertAllClose(expected_batch.discounted_adv, batch.discounted_adv)
+
+  def testRolloutStoreRejectsUnterminatedEpisode(self):
+    store = rollout_lib.RolloutStore()
+    store.add_many([1, 2], [3, 4], [1.0, 0.0], terminated=True)
+    store.add(5, 6, 1.0)
+    with self.assertRaises(ValueError):
+      store.process(gamma=1.0)
+    store.clear()
+    self.assertEqual(0, store.num_episodes)
+    self.assertEqual(0, store.num_timesteps)
+
 
 if __name__ == '__main__':
   tf.test.main()
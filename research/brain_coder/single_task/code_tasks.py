@@ -195,9 +195,11 @@ class MultiIOTaskManager(object):
     terminal_reward = 0.0
     results = []
     reason = 'correct'
+    # Compile once for all test cases.
+    program = bf.compile_program(code)
     for input_seq, output_seq in io_seqs:
       eval_result = bf.evaluate(
-          code, input_buffer=input_seq, timeout=0.1,
+          program, input_buffer=input_seq, timeout=0.1,
           max_steps=self.max_execution_steps,
           base=self.task.base,
           require_correct_syntax=self.require_correct_syntax)
@@ -234,7 +234,8 @@ def process_arch_projected_map(args, arch_vars):
   analytical_counts = utils.Foo(map_sizes=[512/ds],
                                 xy_resolution=[5.*ds],
                                 z_bins=[[-10, 10, 150, 200]],
-                                non_linearity=[arch_vars.var2])
+                                non_linearity=[arch_vars.var2],
+                                num_threads=1)
   args.navtask.task_params.analytical_counts = analytical_counts
 
   sc = 1./ds
@@ -54,6 +54,7 @@ import cv2
 label_nodes_with_class           = gu.label_nodes_with_class
 label_nodes_with_class_geodesic  = gu.label_nodes_with_class_geodesic
 get_distance_node_list           = gu.get_distance_node_list
+DistanceOracle                   = gu.DistanceOracle
 convert_to_graph_tool            = gu.convert_to_graph_tool
 generate_graph                   = gu.generate_graph
 get_hardness_distribution        = gu.get_hardness_distribution
@@ -72,6 +73,7 @@ generate_goal_images             = mu.generate_goal_images
 get_map_to_predict               = mu.get_map_to_predict
 
 bin_points                       = du.bin_points
+PointBinner                      = du.PointBinner
 make_geocentric                  = du.make_geocentric
 get_point_cloud_from_z           = du.get_point_cloud_from_z
 get_camera_matrix                = du.get_camera_matrix
@@ -674,13 +676,16 @@ class MeshMapper(Building):
     return inputs
 
 def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
-                          num_steps, num_goals, data_augment, **kwargs):
-  """Generates and returns a new episode."""
+                          num_steps, num_goals, data_augment,
+                          distance_oracle=None, **kwargs):
+  """Generates and returns a new episode. Distance fields are looked up in
+  distance_oracle, if given, instead of being computed on gtG."""
   max_compute = max_dist + 4*num_steps
   if type == 'general':
     start_node_ids, end_node_ids, dist, pred_map, paths = \
         rng_target_dist_field(batch_size, gtG, rng, max_dist, max_compute,
-                              nodes=nodes, compute_path=False)
+                              nodes=nodes, compute_path=False,
+                              distance_oracle=distance_oracle)
     target_class = None
 
   elif type == 'room_to_room_many':
@@ -689,7 +694,8 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
     # Sample the first one
     start_node_ids_, end_node_ids_, dist_, _, _ = rng_room_to_room(
         batch_size, gtG, rng, max_dist, max_compute,
-        node_room_ids=node_room_ids, nodes=nodes)
+        node_room_ids=node_room_ids, nodes=nodes,
+        distance_oracle=distance_oracle)
     start_node_ids = start_node_ids_
     goal_node_ids.append(end_node_ids_)
     dists.append(dist_)
@@ -697,7 +703,7 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
       start_node_ids_, end_node_ids_, dist_, _, _ = rng_next_goal(
           goal_node_ids[n], batch_size, gtG, rng, max_dist,
           max_compute, node_room_ids=node_room_ids, nodes=nodes,
-          dists_from_start_node=dists[n])
+          dists_from_start_node=dists[n], distance_oracle=distance_oracle)
       goal_node_ids.append(end_node_ids_)
       dists.append(dist_)
     target_class = None
@@ -720,7 +726,8 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
       start_node_ids_, end_node_ids_, dist_, _, _, _, _ = rng_next_goal_rejection_sampling(
               input_nodes, batch_size, gtG, rng, max_dist, min_dist,
               max_compute, sampling_distribution, target_distribution, nodes,
-              n_ori, step_size, distribution_bins, rejection_sampling_M)
+              n_ori, step_size, distribution_bins, rejection_sampling_M,
+              distance_oracle=distance_oracle)
       if n == 0: start_node_ids = start_node_ids_
       goal_node_ids.append(end_node_ids_)
       dists.append(dist_)
@@ -734,7 +741,8 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
     # Sample the first one.
     start_node_ids_, end_node_ids_, dist_, _, _ = rng_room_to_room(
         batch_size, gtG, rng, max_dist, max_compute,
-        node_room_ids=node_room_ids, nodes=nodes)
+        node_room_ids=node_room_ids, nodes=nodes,
+        distance_oracle=distance_oracle)
     start_node_ids = start_node_ids_
     goal_node_ids.append(end_node_ids_)
     dists.append(dist_)
@@ -743,10 +751,13 @@ def _nav_env_reset_helper(type, rng, nodes, batch_size, gtG, max_dist,
     goal_node_ids.append(start_node_ids)
     dist = []
     for i in range(batch_size):
-      dist_ = gt.topology.shortest_distance(
-          gt.GraphView(gtG, reversed=True),
-          source=gtG.vertex(start_node_ids[i]), target=None)
-      dist_ = np.array(dist_.get_array())
+      if distance_oracle is not None:
+        dist_ = distance_oracle.distance_field(start_node_ids[i], 'to')
+      else:
+        dist_ = gt.topology.shortest_distance(
+            gt.GraphView(gtG, reversed=True),
+            source=gtG.vertex(start_node_ids[i]), target=None)
+        dist_ = np.array(dist_.get_array())
       dist.append(dist_)
     dists.append(dist)
     target_class = None
@@ -867,6 +878,9 @@ class NavigationEnv(GridWorld, Building):
       self.task.nodes = nodes
       self.task.delta_theta = 2.0*np.pi/(self.task.n_ori*1.)
       self.task.nodes_to_id = nodes_to_id
+      self.task.distance_oracle = DistanceOracle(
+          gtG, cache_dir=self.task_params.distance_cache_dir,
+          name=self.building_name)
 
       logging.info('Building %s, #V=%d, #E=%d', self.building_name,
                    self.task.nodes.shape[0], self.task.gtG.num_edges())
@@ -894,7 +908,8 @@ class NavigationEnv(GridWorld, Building):
         sampling_d = get_hardness_distribution(
             self.task.gtG, self.task_params.max_dist, self.task_params.min_dist,
             np.random.RandomState(0), 4000, bins, self.task.nodes,
-            self.task_params.n_ori, self.task_params.step_size)
+            self.task_params.n_ori, self.task_params.step_size,
+            distance_oracle=self.task.distance_oracle)
 
         self.task.reset_kwargs = {'distribution_bins': bins,
                                   'target_distribution': target_d,
@@ -933,7 +948,8 @@ class NavigationEnv(GridWorld, Building):
         dists = []
         for i in range(len(self.class_map_names)):
           class_nodes_ = np.where(self.task.node_class_label[:,i])[0]
-          dists.append(get_distance_node_list(gtG, source_nodes=class_nodes_, direction='to'))
+          dists.append(self.task.distance_oracle.distance_to_nodes(
+              class_nodes_, direction='to'))
         self.task.dist_to_class = dists
         a_, b_ = np.where(self.task.node_class_label)
         self.task.class_nodes = np.concatenate((a_[:,np.newaxis], b_[:,np.newaxis]), axis=1)
@@ -957,6 +973,7 @@ class NavigationEnv(GridWorld, Building):
         _nav_env_reset_helper(tp.type, rng, self.task.nodes, tp.batch_size,
                               self.task.gtG, tp.max_dist, tp.num_steps,
                               tp.num_goals, tp.data_augment,
+                              distance_oracle=self.task.distance_oracle,
                               **(self.task.reset_kwargs))
 
     start_nodes = [tuple(nodes[_,:]) for _ in start_node_ids]
@@ -1051,6 +1068,12 @@ class VisualNavigationEnv(NavigationEnv):
       self.traversible.astype(np.float32)*1,
       self.task_params.readout_maps_scales,
       self.task_params.map_resize_method)
+    if self.task_params.outputs.analytical_counts:
+      ac = self.task_params.analytical_counts
+      self.point_binners = [
+          PointBinner(ac.map_sizes[i], ac.z_bins[i], ac.xy_resolution[i],
+                      num_threads=ac.num_threads)
+          for i in range(len(ac.map_sizes))]
     tt.toc(log_at=1, log_str='VisualNavigationEnv __init__: ')
 
   def get_weight(self):
@@ -1167,10 +1190,7 @@ class VisualNavigationEnv(NavigationEnv):
                                       self.robot.camera_elevation_degree)
       for i in range(len(self.task_params.analytical_counts.map_sizes)):
         non_linearity = self.task_params.analytical_counts.non_linearity[i]
-        count, isvalid = bin_points(XYZ*1.,
-                                    map_size=self.task_params.analytical_counts.map_sizes[i],
-                                    xy_resolution=self.task_params.analytical_counts.xy_resolution[i],
-                                    z_bins=self.task_params.analytical_counts.z_bins[i])
+        count, isvalid = self.point_binners[i].bin_points(XYZ)
         assert(count.shape[2] == 1), 'only works for n_views equal to 1.'
         count = count[:,:,0,:,:,:]
         isvalid = isvalid[:,:,0,:,:,:]
@@ -113,7 +113,8 @@ def nav_env_base_config():
                           reward_at_goal=1.,
                           discount_factor=0.99,
                           rejection_sampling_M=100,
-                          min_dist=None)
+                          min_dist=None,
+                          distance_cache_dir=None)
 
   navtask_args = utils.Foo(
       building_names=['area1_gates_wingA_floor1_westpart'],
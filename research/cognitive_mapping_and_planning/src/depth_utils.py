@@ -15,6 +15,7 @@
 
 """Utilities for processing depth images.
 """
+import multiprocessing.pool
 import numpy as np
 import src.rotation_utils as ru
 import src.utils as utils
@@ -63,34 +64,112 @@ def make_geocentric(XYZ, sensor_height, camera_elevation_degree):
   XYZ[...,2] = XYZ[...,2] + sensor_height
   return XYZ
 
-def bin_points(XYZ_cms, map_size, z_bins, xy_resolution):
-  """Bins points into xy-z bins
-  XYZ_cms is ... x H x W x3
-  Outputs is ... x map_size x map_size x (len(z_bins)+1)
+def _bin_indices(XYZ_cms, map_size, z_bins, xy_resolution, first_frame, ind,
+                 isvalid, coord, coord_bin, below):
+  """Computes the bins of the points of the frames XYZ_cms (N x H x W x 3).
+  Writes into ind the index of the bin of each point among the bins of all
+  frames of the batch, XYZ_cms[0] being frame first_frame of the batch, and
+  into isvalid whether the point falls in the map. coord, coord_bin and below
+  are scratch buffers. All buffers are N x H x W.
   """
-  sh = XYZ_cms.shape
-  XYZ_cms = XYZ_cms.reshape([-1, sh[-3], sh[-2], sh[-1]])
   n_z_bins = len(z_bins)+1
   map_center = (map_size-1.)/2.
-  counts = []
-  isvalids = []
-  for XYZ_cm in XYZ_cms:
-    isnotnan = np.logical_not(np.isnan(XYZ_cm[:,:,0]))
-    X_bin = np.round(XYZ_cm[:,:,0] / xy_resolution + map_center).astype(np.int32)
-    Y_bin = np.round(XYZ_cm[:,:,1] / xy_resolution + map_center).astype(np.int32)
-    Z_bin = np.digitize(XYZ_cm[:,:,2], bins=z_bins).astype(np.int32)
+  np.isnan(XYZ_cms[...,0], out=isvalid)
+  np.logical_not(isvalid, out=isvalid)
+  frames = np.arange(first_frame, first_frame+ind.shape[0]).reshape([-1, 1, 1])
+  np.multiply(frames, map_size*map_size*n_z_bins, out=ind)
+  # Y bins are the rows of the map, X bins the columns.
+  for axis, stride in [(1, map_size*n_z_bins), (0, n_z_bins)]:
+    np.divide(XYZ_cms[...,axis], xy_resolution, out=coord)
+    np.add(coord, map_center, out=coord)
+    np.round(coord, out=coord)
+    coord_bin[...] = coord
+    np.logical_and(isvalid, coord_bin >= 0, out=isvalid)
+    np.logical_and(isvalid, coord_bin < map_size, out=isvalid)
+    np.multiply(coord_bin, stride, out=coord_bin)
+    np.add(ind, coord_bin, out=ind)
+  # np.digitize always returns one of the n_z_bins bins. For increasing bins,
+  # it is the number of bins that the point is not below (NaNs are above all).
+  if np.all(np.diff(z_bins) > 0):
+    np.add(ind, len(z_bins), out=ind)
+    for z_bin in z_bins:
+      np.less(XYZ_cms[...,2], z_bin, out=below)
+      np.subtract(ind, below, out=ind)
+  else:
+    np.add(ind, np.digitize(XYZ_cms[...,2], bins=z_bins), out=ind)
+  np.multiply(ind, isvalid, out=ind)
+
+class PointBinner(object):
+  """Bins batches of points into xy-z bins, as bin_points().
+
+  The bins of all the frames of a batch are counted with a single
+  np.bincount. The per point buffers are allocated once and reused as long as
+  the batch shape does not change, and with num_threads > 1 the bins of the
+  points are computed by a thread pool, splitting the batch by frames.
+  """
+  def __init__(self, map_size, z_bins, xy_resolution, num_threads=1):
+    self.map_size = map_size
+    self.z_bins = z_bins
+    self.xy_resolution = xy_resolution
+    self.n_z_bins = len(z_bins)+1
+    self.num_threads = num_threads
+    self.pool = None
+    if num_threads > 1:
+      self.pool = multiprocessing.pool.ThreadPool(num_threads)
+    self._buffers = None
+
+  def _get_buffers(self, shape, dtype):
+    if self._buffers is None or self._buffers[0].shape != shape or \
+        self._buffers[2].dtype != dtype:
+      self._buffers = (np.zeros(shape, dtype=np.int64),
+                       np.zeros(shape, dtype=bool),
+                       np.zeros(shape, dtype=dtype),
+                       np.zeros(shape, dtype=np.int32),
+                       np.zeros(shape, dtype=bool))
+    return self._buffers
 
-    isvalid = np.array([X_bin >= 0, X_bin < map_size, Y_bin >= 0, Y_bin < map_size,
-                        Z_bin >= 0, Z_bin < n_z_bins, isnotnan])
-    isvalid = np.all(isvalid, axis=0)
+  def _bin_frames(self, args):
+    XYZ_cms, start, end = args
+    buffers = [b[start:end] for b in self._buffers]
+    _bin_indices(XYZ_cms[start:end], self.map_size, self.z_bins,
+                 self.xy_resolution, start, *buffers)
 
-    ind = (Y_bin * map_size + X_bin) * n_z_bins + Z_bin
-    ind[np.logical_not(isvalid)] = 0
-    count = np.bincount(ind.ravel(), isvalid.ravel().astype(np.int32),
-                         minlength=map_size*map_size*n_z_bins)
-    count = np.reshape(count, [map_size, map_size, n_z_bins])
-    counts.append(count)
-    isvalids.append(isvalid)
-  counts = np.array(counts).reshape(list(sh[:-3]) + [map_size, map_size, n_z_bins])
-  isvalids = np.array(isvalids).reshape(list(sh[:-3]) + [sh[-3], sh[-2], 1])
+  def bin_points(self, XYZ_cms):
+    """Bins points into xy-z bins
+    XYZ_cms is ... x H x W x3
+    Outputs is ... x map_size x map_size x (len(z_bins)+1)
+    The returned isvalids are overwritten by the next call.
+    """
+    sh = XYZ_cms.shape
+    XYZ_cms = XYZ_cms.reshape([-1, sh[-3], sh[-2], sh[-1]])
+    n = XYZ_cms.shape[0]
+    ind, isvalid, _, _, _ = self._get_buffers(
+        XYZ_cms.shape[:3], np.result_type(XYZ_cms.dtype, self.xy_resolution))
+    bounds = np.linspace(0, n, min(self.num_threads, n)+1).astype(np.int64)
+    tasks = [(XYZ_cms, bounds[i], bounds[i+1]) for i in range(len(bounds)-1)]
+    if self.pool is not None and len(tasks) > 1:
+      self.pool.map(self._bin_frames, tasks)
+    else:
+      for task in tasks:
+        self._bin_frames(task)
+    map_bins = self.map_size*self.map_size*self.n_z_bins
+    counts = np.bincount(ind.ravel(), isvalid.ravel(), minlength=n*map_bins)
+    counts = counts.reshape(list(sh[:-3]) + [self.map_size, self.map_size,
+                                             self.n_z_bins])
+    isvalids = isvalid.reshape(list(sh[:-3]) + [sh[-3], sh[-2], 1])
+    return counts, isvalids
+
+  def close(self):
+    if self.pool is not None:
+      self.pool.close()
+      self.pool.join()
+      self.pool = None
+
+def bin_points(XYZ_cms, map_size, z_bins, xy_resolution):
+  """Bins points into xy-z bins
+  XYZ_cms is ... x H x W x3
+  Outputs is ... x map_size x map_size x (len(z_bins)+1)
+  """
+  counts, isvalids = PointBinner(map_size, z_bins,
+                                 xy_resolution).bin_points(XYZ_cms)
   return counts, isvalids
@@ -20,6 +20,9 @@ import numpy as np
 import networkx as nx
 import itertools
 import logging
+import collections
+import hashlib
+import os
 from datasets.nav_env import get_path_ids
 import graph_tool as gt
 import graph_tool.topology
@@ -53,6 +56,151 @@ def get_distance_node_list(gtG, source_nodes, direction, weights=None):
     dist = dist-1
   return dist
 
+_INF_DIST = np.iinfo(np.int32).max
+
+def _bfs_csr(gtG, direction):
+  """Returns the CSR adjacency (indptr, indices) that is followed by a breadth
+  first search from the source nodes: outgoing edges for direction 'from' and
+  incoming edges for direction 'to'."""
+  num_nodes = gtG.num_vertices()
+  se = np.array([[int(e.source()), int(e.target())] for e in gtG.edges()],
+                dtype=np.int64).reshape((-1, 2))
+  if not gtG.is_directed():
+    se = np.concatenate((se, se[:,::-1]), axis=0)
+  if direction == 'to':
+    se = se[:,::-1]
+  se = se[np.argsort(se[:,0], kind='mergesort'),:]
+  indptr = np.zeros((num_nodes+1,), dtype=np.int64)
+  indptr[1:] = np.cumsum(np.bincount(se[:,0], minlength=num_nodes))
+  return indptr, se[:,1].copy()
+
+def _multi_source_bfs(indptr, indices, source_nodes):
+  """Level synchronous breadth first search from all source nodes at once.
+  Returns the int32 number of hops to the nearest source node, _INF_DIST for
+  nodes that can not be reached."""
+  dist = np.empty((indptr.size-1,), dtype=np.int32); dist[...] = _INF_DIST
+  frontier = np.unique(np.asarray(source_nodes, dtype=np.int64))
+  d = 0
+  while frontier.size > 0:
+    dist[frontier] = d
+    d = d+1
+    starts = indptr[frontier]
+    cnts = indptr[frontier+1] - starts
+    offsets = np.cumsum(cnts) - cnts
+    edge_ids = np.repeat(starts - offsets, cnts) + np.arange(np.sum(cnts))
+    frontier = np.unique(indices[edge_ids])
+    frontier = frontier[dist[frontier] == _INF_DIST]
+  return dist
+
+class DistanceOracle(object):
+  """Caches the breadth first search distance fields of a graph.
+
+  Distances to (or from) a set of goal nodes are computed with a vectorized
+  multi source breadth first search over the edges of the graph. Recently used
+  distance fields are kept in memory, and if cache_dir is set they are also
+  saved to cache_dir/name/<hash of the graph>/ as .npy files in the narrowest
+  unsigned dtype that holds them, and memory-mapped when needed again. Fields
+  therefore only need to be computed once per building, across runs.
+
+  distance_to_nodes() returns the same distances as get_distance_node_list()
+  without weights, and distance_field() the same distances as
+  gt.topology.shortest_distance(), without the predecessor map.
+  """
+  def __init__(self, gtG, cache_dir=None, name='graph', max_cached=256):
+    self.num_nodes = gtG.num_vertices()
+    self.max_cached = max_cached
+    self.cache_dir = None
+    self._csr = {}
+    for direction in ['to', 'from']:
+      self._csr[direction] = _bfs_csr(gtG, direction)
+    if cache_dir is not None:
+      indptr, indices = self._csr['from']
+      graph_hash = hashlib.sha1(indptr.tobytes() + indices.tobytes())
+      graph_hash = graph_hash.hexdigest()[:16]
+      self.cache_dir = os.path.join(cache_dir, name, graph_hash)
+      if not os.path.exists(self.cache_dir):
+        os.makedirs(self.cache_dir)
+    self._fields = collections.OrderedDict()
+    self.hits = 0; self.disk_hits = 0; self.misses = 0;
+
+  def _cache_file(self, key):
+    direction, source_nodes = key
+    source_hash = hashlib.sha1(np.array(source_nodes, dtype=np.int64).tobytes())
+    return os.path.join(self.cache_dir, '{:s}_{:s}.npy'.format(
+      direction, source_hash.hexdigest()))
+
+  def _load(self, key):
+    # Stored with dtype max for unreachable nodes.
+    stored = np.load(self._cache_file(key), mmap_mode='r')
+    dist = stored.astype(np.int32)
+    dist[stored == np.iinfo(stored.dtype).max] = _INF_DIST
+    return dist
+
+  def _save(self, key, dist):
+    finite_dist = dist[dist != _INF_DIST]
+    max_d = np.max(finite_dist) if finite_dist.size > 0 else 0
+    for dtype in [np.uint8, np.uint16, np.uint32]:
+      if max_d < np.iinfo(dtype).max:
+        break
+    stored = dist.astype(dtype)
+    stored[dist == _INF_DIST] = np.iinfo(dtype).max
+    file_name = self._cache_file(key)
+    tmp_file_name = '{:s}.{:d}.tmp.npy'.format(file_name[:-4], os.getpid())
+    np.save(tmp_file_name, stored)
+    os.rename(tmp_file_name, file_name)
+
+  def _get(self, source_nodes, direction):
+    """Returns the cached int32 distance field, which must not be modified."""
+    assert(direction in ['to', 'from']), 'direction must be to or from.'
+    key = (direction, tuple(np.unique(np.asarray(source_nodes)).tolist()))
+    dist = self._fields.pop(key, None)
+    if dist is not None:
+      self.hits += 1
+    elif self.cache_dir is not None and os.path.exists(self._cache_file(key)):
+      self.disk_hits += 1
+      dist = self._load(key)
+    else:
+      self.misses += 1
+      indptr, indices = self._csr[direction]
+      dist = _multi_source_bfs(indptr, indices, key[1])
+      if self.cache_dir is not None:
+        self._save(key, dist)
+    self._fields[key] = dist
+    if len(self._fields) > self.max_cached:
+      self._fields.popitem(last=False)
+    return dist
+
+  def distance_to_nodes(self, source_nodes, direction):
+    """Distance of every node to (or from) the nearest source node, with
+    _INF_DIST-1 for unreachable nodes, as get_distance_node_list()."""
+    dist = self._get(source_nodes, direction).copy()
+    dist[dist == _INF_DIST] = _INF_DIST-1
+    return dist
+
+  def distance_field(self, source_node, direction, max_dist=None):
+    """Distance of every node to (or from) source_node, with _INF_DIST for
+    nodes that are unreachable or further than max_dist, as
+    gt.topology.shortest_distance()."""
+    dist = self._get([source_node], direction).copy()
+    if max_dist is not None:
+      dist[dist > max_dist] = _INF_DIST
+    return dist
+
+def _shortest_distance(gtG, source_node, direction, max_dist=None,
+                       pred_map=False, distance_oracle=None):
+  """Returns the distances to (or from) source_node as a numpy array, and the
+  predecessor map if pred_map is True. Looks up the distances in
+  distance_oracle if one is given and no predecessor map is needed."""
+  if distance_oracle is not None and not pred_map:
+    return distance_oracle.distance_field(source_node, direction, max_dist), None
+  out = gt.topology.shortest_distance(
+      gt.GraphView(gtG, reversed=direction == 'to'),
+      source=gtG.vertex(source_node), target=None, max_dist=max_dist,
+      pred_map=pred_map)
+  if pred_map:
+    return np.array(out[0].get_array()), np.array(out[1].get_array())
+  return np.array(out.get_array()), None
+
 # Functions for semantically labelling nodes in the traversal graph.
 def generate_lattice(sz_x, sz_y):
   """Generates a lattice with sz_x vertices along x and sz_y vertices along y
@@ -345,17 +493,15 @@ def heuristic_fn_vec(n1, n2, n_ori, step_size):
   return (d + dt).reshape((-1,1))
 
 def get_hardness_distribution(gtG, max_dist, min_dist, rng, trials, bins, nodes,
-                              n_ori, step_size):
+                              n_ori, step_size, distance_oracle=None):
   heuristic_fn = lambda node_ids, node_id: \
     heuristic_fn_vec(nodes[node_ids, :], nodes[[node_id], :], n_ori, step_size)
   num_nodes = gtG.num_vertices()
   gt_dists = []; h_dists = [];
   for i in range(trials):
     end_node_id = rng.choice(num_nodes)
-    gt_dist = gt.topology.shortest_distance(gt.GraphView(gtG, reversed=True),
-                                            source=gtG.vertex(end_node_id),
-                                            target=None, max_dist=max_dist)
-    gt_dist = np.array(gt_dist.get_array())
+    gt_dist, _ = _shortest_distance(gtG, end_node_id, 'to', max_dist=max_dist,
+                                    distance_oracle=distance_oracle)
     ind = np.where(np.logical_and(gt_dist <= max_dist, gt_dist >= min_dist))[0]
     gt_dist = gt_dist[ind]
     h_dist = heuristic_fn(ind, end_node_id)[:,0]
@@ -372,7 +518,8 @@ def get_hardness_distribution(gtG, max_dist, min_dist, rng, trials, bins, nodes,
 def rng_next_goal_rejection_sampling(start_node_ids, batch_size, gtG, rng,
                                      max_dist, min_dist, max_dist_to_compute,
                                      sampling_d, target_d,
-                                     nodes, n_ori, step_size, bins, M):
+                                     nodes, n_ori, step_size, bins, M,
+                                     distance_oracle=None):
   sample_start_nodes = start_node_ids is None
   dists = []; pred_maps = []; end_node_ids = []; start_node_ids_ = [];
   hardnesss = []; gt_dists = [];
@@ -385,10 +532,9 @@ def rng_next_goal_rejection_sampling(start_node_ids, batch_size, gtG, rng,
       else:
         start_node_id = start_node_ids[i]
 
-      gt_dist = gt.topology.shortest_distance(
-          gt.GraphView(gtG, reversed=False), source=start_node_id, target=None,
-          max_dist=max_dist)
-      gt_dist = np.array(gt_dist.get_array())
+      gt_dist, _ = _shortest_distance(gtG, start_node_id, 'from',
+                                      max_dist=max_dist,
+                                      distance_oracle=distance_oracle)
       ind = np.where(np.logical_and(gt_dist <= max_dist, gt_dist >= min_dist))[0]
       ind = rng.permutation(ind)
       gt_dist = gt_dist[ind]*1.
@@ -405,11 +551,9 @@ def rng_next_goal_rejection_sampling(start_node_ids, batch_size, gtG, rng,
         done = True
 
     # Compute distance from end node to all nodes, to return.
-    dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=True), source=end_node_id, target=None,
-        max_dist=max_dist_to_compute, pred_map=True)
-    dist = np.array(dist.get_array())
-    pred_map = np.array(pred_map.get_array())
+    dist, pred_map = _shortest_distance(
+        gtG, end_node_id, 'to', max_dist=max_dist_to_compute,
+        pred_map=distance_oracle is None, distance_oracle=distance_oracle)
 
     hardnesss.append(hardness); dists.append(dist); pred_maps.append(pred_map);
     start_node_ids_.append(start_node_id); end_node_ids.append(end_node_id);
@@ -420,7 +564,8 @@ def rng_next_goal_rejection_sampling(start_node_ids, batch_size, gtG, rng,
 
 def rng_next_goal(start_node_ids, batch_size, gtG, rng, max_dist,
                   max_dist_to_compute, node_room_ids, nodes=None,
-                  compute_path=False, dists_from_start_node=None):
+                  compute_path=False, dists_from_start_node=None,
+                  distance_oracle=None):
   # Compute the distance field from the starting location, and then pick a
   # destination in another room if possible otherwise anywhere outside this
   # room.
@@ -429,10 +574,9 @@ def rng_next_goal(start_node_ids, batch_size, gtG, rng, max_dist,
     room_id = node_room_ids[start_node_ids[i]]
     # Compute distances.
     if dists_from_start_node == None:
-      dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=False), source=gtG.vertex(start_node_ids[i]),
-        target=None, max_dist=max_dist_to_compute, pred_map=True)
-      dist = np.array(dist.get_array())
+      dist, _ = _shortest_distance(gtG, start_node_ids[i], 'from',
+                                   max_dist=max_dist_to_compute,
+                                   distance_oracle=distance_oracle)
     else:
       dist = dists_from_start_node[i]
 
@@ -455,11 +599,10 @@ def rng_next_goal(start_node_ids, batch_size, gtG, rng, max_dist,
       logging.error('Did not find any good nodes.')
 
     # Compute distance to this new goal for doing distance queries.
-    dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=True), source=gtG.vertex(end_node_id),
-        target=None, max_dist=max_dist_to_compute, pred_map=True)
-    dist = np.array(dist.get_array())
-    pred_map = np.array(pred_map.get_array())
+    dist, pred_map = _shortest_distance(
+        gtG, end_node_id, 'to', max_dist=max_dist_to_compute,
+        pred_map=compute_path or distance_oracle is None,
+        distance_oracle=distance_oracle)
 
     dists.append(dist)
     pred_maps.append(pred_map)
@@ -474,7 +617,8 @@ def rng_next_goal(start_node_ids, batch_size, gtG, rng, max_dist,
 
 
 def rng_room_to_room(batch_size, gtG, rng, max_dist, max_dist_to_compute,
-                     node_room_ids, nodes=None, compute_path=False):
+                     node_room_ids, nodes=None, compute_path=False,
+                     distance_oracle=None):
   # Sample one of the rooms, compute the distance field. Pick a destination in
   # another room if possible otherwise anywhere outside this room.
   dists = []; pred_maps = []; paths = []; start_node_ids = []; end_node_ids = [];
@@ -485,11 +629,10 @@ def rng_room_to_room(batch_size, gtG, rng, max_dist, max_dist_to_compute,
     end_node_ids.append(end_node_id)
 
     # Compute distances.
-    dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=True), source=gtG.vertex(end_node_id),
-        target=None, max_dist=max_dist_to_compute, pred_map=True)
-    dist = np.array(dist.get_array())
-    pred_map = np.array(pred_map.get_array())
+    dist, pred_map = _shortest_distance(
+        gtG, end_node_id, 'to', max_dist=max_dist_to_compute,
+        pred_map=compute_path or distance_oracle is None,
+        distance_oracle=distance_oracle)
     dists.append(dist)
     pred_maps.append(pred_map)
 
@@ -523,7 +666,8 @@ def rng_room_to_room(batch_size, gtG, rng, max_dist, max_dist_to_compute,
 
 
 def rng_target_dist_field(batch_size, gtG, rng, max_dist, max_dist_to_compute,
-                          nodes=None, compute_path=False):
+                          nodes=None, compute_path=False,
+                          distance_oracle=None):
   # Sample a single node, compute distance to all nodes less than max_dist,
   # sample nodes which are a particular distance away.
   dists = []; pred_maps = []; paths = []; start_node_ids = []
@@ -531,11 +675,10 @@ def rng_target_dist_field(batch_size, gtG, rng, max_dist, max_dist_to_compute,
                             replace=False).tolist()
 
   for i in range(batch_size):
-    dist, pred_map = gt.topology.shortest_distance(
-        gt.GraphView(gtG, reversed=True), source=gtG.vertex(end_node_ids[i]),
-        target=None, max_dist=max_dist_to_compute, pred_map=True)
-    dist = np.array(dist.get_array())
-    pred_map = np.array(pred_map.get_array())
+    dist, pred_map = _shortest_distance(
+        gtG, end_node_ids[i], 'to', max_dist=max_dist_to_compute,
+        pred_map=compute_path or distance_oracle is None,
+        distance_oracle=distance_oracle)
     dists.append(dist)
     pred_maps.append(pred_map)
 
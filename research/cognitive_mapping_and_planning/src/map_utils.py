@@ -35,7 +35,9 @@ def _get_xy_bounding_box(vertex, padding):
 def _project_to_map(map, vertex, wt=None, ignore_points_outside_map=False):
   """Projects points to map, returns how many points are present at each
   location."""
-  num_points = np.zeros((map.size[1], map.size[0]))
+  if wt is not None:
+    assert(wt.shape[0] == vertex.shape[0]), \
+      'number of weights should be same as vertices.'
   vertex_ = vertex[:, :2] - map.origin
   vertex_ = np.round(vertex_ / map.resolution).astype(np.int)
   if ignore_points_outside_map:
@@ -44,13 +46,16 @@ def _project_to_map(map, vertex, wt=None, ignore_points_outside_map=False):
                       axis=0)
     vertex_ = vertex_[good_ind, :]
     if wt is not None:
-      wt = wt[good_ind, :]
-  if wt is None:
-    np.add.at(num_points, (vertex_[:, 1], vertex_[:, 0]), 1)
-  else:
-    assert(wt.shape[0] == vertex.shape[0]), \
-      'number of weights should be same as vertices.'
-    np.add.at(num_points, (vertex_[:, 1], vertex_[:, 0]), wt)
+      wt = wt[good_ind]
+  # A single bincount sums the weights of each location in the same order as
+  # np.add.at would, with negative indices also wrapping around.
+  size = np.asarray(map.size)
+  if np.any(vertex_ >= size) or np.any(vertex_ < -size):
+    raise IndexError('Points are outside the map.')
+  ind = np.mod(vertex_[:, 1], size[1]) * size[0] + np.mod(vertex_[:, 0], size[0])
+  num_points = np.bincount(ind, weights=wt, minlength=size[0]*size[1])
+  num_points = num_points.reshape((size[1], size[0])).astype(np.float64,
+                                                              copy=False)
   return num_points
 
 def make_map(padding, resolution, vertex=None, sc=1.):
@@ -94,11 +94,20 @@ _DATASETS_INFORMATION = {
 # Default file pattern of TFRecord of TensorFlow Example.
 _FILE_PATTERN = '%s-*'
 
+# To evaluate Cityscapes results on the evaluation server, the labels used
+# during training should be mapped to the labels for evaluation.
+_CITYSCAPES_TRAIN_ID_TO_EVAL_ID = [7, 8, 11, 12, 13, 17, 19, 20, 21, 22,
+                                   23, 24, 25, 26, 27, 28, 31, 32, 33]
+
 
 def get_cityscapes_dataset_name():
   return 'cityscapes'
 
 
+def get_cityscapes_train_id_to_eval_id():
+  return _CITYSCAPES_TRAIN_ID_TO_EVAL_ID
+
+
 def get_dataset(dataset_name, split_name, dataset_dir):
   """Gets an instance of slim Dataset.
 
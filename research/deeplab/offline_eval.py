@@ -0,0 +1,236 @@
+# Copyright 2018 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Evaluates raw segmentation predictions saved by vis.py.
+
+Run vis.py with --also_save_raw_predictions, then
+
+  python deeplab/offline_eval.py \
+    --dataset=cityscapes \
+    --dataset_dir=${PATH_TO_TFRECORDS} \
+    --raw_predictions_dir=${VIS_LOGDIR}/raw_segmentation_results \
+    --gt_cache_dir=${PATH_TO_CACHE}
+
+Unlike eval.py, no model is run: each worker process reads one TFRecord shard
+of the split, loads the matching predictions, and accumulates a confusion
+matrix, which are summed into the confusion matrix of the split. The mIoU,
+the frequency weighted IoU and the IoU of each class are reported.
+
+With --gt_cache_dir, the decoded ground truth labels of each shard are cached
+as a .npz file, so evaluating the predictions of other checkpoints does not
+decode the labels again.
+"""
+import io
+import multiprocessing
+import os.path
+import numpy as np
+import PIL.Image as img
+import tensorflow as tf
+from deeplab.datasets import segmentation_dataset
+from deeplab.utils import confusion_matrix
+
+flags = tf.app.flags
+
+FLAGS = flags.FLAGS
+
+flags.DEFINE_string('dataset', 'pascal_voc_seg',
+                    'Name of the segmentation dataset.')
+
+flags.DEFINE_string('eval_split', 'val',
+                    'Which split of the dataset used for evaluation')
+
+flags.DEFINE_string('dataset_dir', None, 'Where the dataset reside.')
+
+flags.DEFINE_string('raw_predictions_dir', None,
+                    'Where vis.py saved the raw predictions.')
+
+flags.DEFINE_string('gt_cache_dir', None,
+                    'Where to cache the decoded ground truth labels. No cache '
+                    'is used if not set.')
+
+flags.DEFINE_integer('num_processes', 8,
+                     'Number of processes evaluating the shards.')
+
+flags.DEFINE_string('report_file', None,
+                    'If set, the per-class report is also written there.')
+
+# The key of the label in the TFRecords, see build_data.py.
+_LABEL_KEY = 'image/segmentation/class/encoded'
+
+# The key of the filename in the TFRecords.
+_FILENAME_KEY = 'image/filename'
+
+
+def _decode_png(data):
+  return np.array(img.open(io.BytesIO(data)))
+
+
+def _read_shard_labels(shard):
+  """Reads and decodes the ground truth labels of a TFRecord shard.
+
+  Args:
+    shard: Path of the TFRecord shard.
+
+  Returns:
+    filenames: List of the image filenames.
+    labels: List of 2-D uint8 numpy arrays.
+  """
+  filenames = []
+  labels = []
+  for record in tf.python_io.tf_record_iterator(shard):
+    example = tf.train.Example.FromString(record)
+    features = example.features.feature
+    filenames.append(
+        features[_FILENAME_KEY].bytes_list.value[0].decode('utf-8'))
+    labels.append(_decode_png(features[_LABEL_KEY].bytes_list.value[0]))
+  return filenames, labels
+
+
+def _load_shard_labels(shard, cache_dir):
+  """Returns the labels of a shard, from the cache if it is up to date.
+
+  The labels are cached as one flat array, with the shape of each label, and
+  with the size and modification time of the shard to detect changes.
+  """
+  if not cache_dir:
+    return _read_shard_labels(shard)
+  stat = tf.gfile.Stat(shard)
+  source = np.array([stat.length, stat.mtime_nsec], dtype=np.int64)
+  cache_file = os.path.join(cache_dir, os.path.basename(shard) + '.npz')
+  if tf.gfile.Exists(cache_file):
+    with tf.gfile.Open(cache_file, 'rb') as f:
+      cache = np.load(f)
+      if np.array_equal(cache['source'], source):
+        shapes = cache['shapes']
+        flat_labels = cache['labels']
+        offsets = np.cumsum(np.prod(shapes, axis=1))
+        return list(cache['filenames']), [
+            label.reshape(shape) for label, shape in
+            zip(np.split(flat_labels, offsets[:-1]), shapes)]
+
+  filenames, labels = _read_shard_labels(shard)
+  temp_file = cache_file + '.tmp'
+  with tf.gfile.Open(temp_file, 'wb') as f:
+    np.savez(f, source=source, filenames=np.array(filenames),
+             shapes=np.array([label.shape for label in labels],
+                             dtype=np.int64).reshape(-1, 2),
+             labels=(np.concatenate([label.ravel() for label in labels])
+                     if labels else np.zeros(0, np.uint8)))
+  tf.gfile.Rename(temp_file, cache_file, overwrite=True)
+  return filenames, labels
+
+
+def _evaluate_shard(args):
+  """Computes the confusion matrix of the predictions of a shard.
+
+  Args:
+    args: Tuple (shard, raw_predictions_dir, num_classes, ignore_label,
+      eval_id_to_train_id, gt_cache_dir). eval_id_to_train_id is None, or a
+      numpy array mapping the saved predictions back to train ids.
+
+  Returns:
+    Tuple (confusion matrix, number of evaluated images, list of filenames
+    without prediction).
+  """
+  (shard, raw_predictions_dir, num_classes, ignore_label,
+   eval_id_to_train_id, gt_cache_dir) = args
+  filenames, labels = _load_shard_labels(shard, gt_cache_dir)
+  shard_confusion_matrix = np.zeros((num_classes, num_classes), np.int64)
+  missing = []
+  for filename, label in zip(filenames, labels):
+    prediction_file = '%s/%s.png' % (raw_predictions_dir, filename)
+    if not tf.gfile.Exists(prediction_file):
+      missing.append(filename)
+      continue
+    with tf.gfile.Open(prediction_file, 'rb') as f:
+      prediction = _decode_png(f.read())
+    if eval_id_to_train_id is not None:
+      prediction = eval_id_to_train_id[prediction]
+    try:
+      shard_confusion_matrix += confusion_matrix.compute_confusion_matrix(
+          label, prediction, num_classes, ignore_label)
+    except ValueError as e:
+      raise ValueError('%s: %s' % (prediction_file, e))
+  return shard_confusion_matrix, len(filenames) - len(missing), missing
+
+
+def _format_report(split_confusion_matrix):
+  """Returns the metrics of a confusion matrix as text lines."""
+  iou = confusion_matrix.per_class_iou(split_confusion_matrix)
+  frequency = confusion_matrix.class_frequencies(split_confusion_matrix)
+  lines = ['class      IoU  frequency']
+  for i in range(len(iou)):
+    lines.append('%5d  %7.4f  %9.4f' % (i, iou[i], frequency[i]))
+  lines.append('mIoU: %.4f' % confusion_matrix.mean_iou(
+      split_confusion_matrix))
+  lines.append('Frequency weighted IoU: %.4f' %
+               confusion_matrix.frequency_weighted_iou(split_confusion_matrix))
+  lines.append('Pixel accuracy: %.4f' %
+               confusion_matrix.pixel_accuracy(split_confusion_matrix))
+  return lines
+
+
+def main(unused_argv):
+  tf.logging.set_verbosity(tf.logging.INFO)
+  dataset = segmentation_dataset.get_dataset(
+      FLAGS.dataset, FLAGS.eval_split, dataset_dir=FLAGS.dataset_dir)
+  shards = sorted(tf.gfile.Glob(dataset.data_sources))
+  if not shards:
+    raise ValueError('No TFRecords match %s' % dataset.data_sources)
+
+  # vis.py saves Cityscapes predictions with the evaluation ids.
+  eval_id_to_train_id = None
+  if dataset.name == segmentation_dataset.get_cityscapes_dataset_name():
+    eval_id_to_train_id = np.full(256, dataset.num_classes, dtype=np.int64)
+    eval_id_to_train_id[
+        segmentation_dataset.get_cityscapes_train_id_to_eval_id()] = np.arange(
+            dataset.num_classes)
+
+  if FLAGS.gt_cache_dir:
+    tf.gfile.MakeDirs(FLAGS.gt_cache_dir)
+
+  tf.logging.info('Evaluating %d shards of the %s set with %d processes.',
+                  len(shards), FLAGS.eval_split, FLAGS.num_processes)
+  pool = multiprocessing.Pool(FLAGS.num_processes)
+  split_confusion_matrix = np.zeros(
+      (dataset.num_classes, dataset.num_classes), np.int64)
+  num_images = 0
+  missing = []
+  tasks = [(shard, FLAGS.raw_predictions_dir, dataset.num_classes,
+            dataset.ignore_label, eval_id_to_train_id, FLAGS.gt_cache_dir)
+           for shard in shards]
+  for shard_confusion_matrix, shard_num_images, shard_missing in (
+      pool.imap_unordered(_evaluate_shard, tasks)):
+    split_confusion_matrix += shard_confusion_matrix
+    num_images += shard_num_images
+    missing.extend(shard_missing)
+  pool.close()
+  pool.join()
+
+  if missing:
+    tf.logging.warning('No prediction for %d images, e.g. %s', len(missing),
+                       missing[0])
+  tf.logging.info('Evaluated %d images.', num_images)
+  report = _format_report(split_confusion_matrix)
+  for line in report:
+    tf.logging.info(line)
+  if FLAGS.report_file:
+    with tf.gfile.Open(FLAGS.report_file, 'w') as f:
+      f.write('\n'.join(report) + '\n')
+
+
+if __name__ == '__main__':
+  flags.mark_flag_as_required('dataset_dir')
+  flags.mark_flag_as_required('raw_predictions_dir')
+  tf.app.run()
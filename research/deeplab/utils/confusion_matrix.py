@@ -0,0 +1,97 @@
+# Copyright 2018 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Computes semantic segmentation metrics from confusion matrices.
+
+Entry [i, j] of a confusion matrix counts the pixels whose ground truth label
+is i and whose predicted label is j. Confusion matrices of disjoint sets of
+images can be summed, so they can be computed in parallel and merged.
+"""
+
+import numpy as np
+
+
+def compute_confusion_matrix(labels, predictions, num_classes, ignore_label):
+  """Computes the confusion matrix of a prediction.
+
+  Args:
+    labels: Integer numpy array of ground truth labels.
+    predictions: Integer numpy array of predicted labels, with the same shape
+      as labels.
+    num_classes: Number of semantic classes.
+    ignore_label: Pixels with this ground truth label are not counted.
+
+  Returns:
+    An int64 numpy array of shape [num_classes, num_classes].
+
+  Raises:
+    ValueError: If the shapes of labels and predictions differ, or if they
+      contain labels outside [0, num_classes).
+  """
+  if labels.shape != predictions.shape:
+    raise ValueError('Labels of shape %s do not match predictions of shape %s.'
+                     % (labels.shape, predictions.shape))
+  valid = labels != ignore_label
+  labels = labels[valid].astype(np.int64)
+  predictions = predictions[valid].astype(np.int64)
+  if labels.size and (min(labels.min(), predictions.min()) < 0 or
+                      max(labels.max(), predictions.max()) >= num_classes):
+    raise ValueError('Labels must be in [0, %d).' % num_classes)
+  return np.bincount(labels * num_classes + predictions,
+                     minlength=num_classes**2).reshape(num_classes,
+                                                       num_classes)
+
+
+def per_class_iou(confusion_matrix):
+  """Computes the intersection-over-union of each class.
+
+  Args:
+    confusion_matrix: Numpy array of shape [num_classes, num_classes].
+
+  Returns:
+    A float64 numpy array with the IoU of each class, which is NaN for classes
+    that appear neither in the ground truth nor in the predictions.
+  """
+  intersection = np.diag(confusion_matrix).astype(np.float64)
+  union = (confusion_matrix.sum(axis=0) + confusion_matrix.sum(axis=1) -
+           intersection)
+  iou = np.full(len(intersection), np.nan)
+  np.divide(intersection, union, out=iou, where=union > 0)
+  return iou
+
+
+def mean_iou(confusion_matrix):
+  """Computes the mean IoU over the classes that appear, as tf.metrics does."""
+  iou = per_class_iou(confusion_matrix)
+  valid = ~np.isnan(iou)
+  return iou[valid].mean() if valid.any() else 0.0
+
+
+def frequency_weighted_iou(confusion_matrix):
+  """Computes the IoU of each class weighted by its ground truth frequency."""
+  frequency = class_frequencies(confusion_matrix)
+  return np.nansum(frequency * per_class_iou(confusion_matrix))
+
+
+def class_frequencies(confusion_matrix):
+  """Returns the fraction of counted pixels that belong to each class."""
+  counts = confusion_matrix.sum(axis=1).astype(np.float64)
+  total = counts.sum()
+  return counts / total if total else counts
+
+
+def pixel_accuracy(confusion_matrix):
+  """Returns the fraction of counted pixels that are correctly predicted."""
+  total = confusion_matrix.sum()
+  return np.trace(confusion_matrix) / float(total) if total else 0.0
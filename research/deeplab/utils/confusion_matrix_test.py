@@ -0,0 +1,71 @@
+# Copyright 2018 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for confusion_matrix.py."""
+
+import numpy as np
+import tensorflow as tf
+
+from deeplab.utils import confusion_matrix
+
+
+class ConfusionMatrixTest(tf.test.TestCase):
+
+  def testComputeConfusionMatrix(self):
+    """Test the counts and that ignored pixels are skipped."""
+    labels = np.array([[0, 1, 1], [2, 255, 2]])
+    predictions = np.array([[0, 1, 2], [2, 0, 0]])
+    expected_result = np.array([[1, 0, 0],
+                                [0, 1, 1],
+                                [1, 0, 1]])
+    self.assertTrue(np.array_equal(
+        expected_result,
+        confusion_matrix.compute_confusion_matrix(
+            labels, predictions, num_classes=3, ignore_label=255)))
+
+  def testUnExpectedLabelValueForComputeConfusionMatrix(self):
+    """Raise ValueError when a prediction exceeds the number of classes."""
+    with self.assertRaises(ValueError):
+      confusion_matrix.compute_confusion_matrix(
+          np.array([[0, 1]]), np.array([[0, 3]]), num_classes=3,
+          ignore_label=255)
+
+  def testMetricsMatchTensorFlowMeanIoU(self):
+    """Test the metrics against tf.metrics.mean_iou on random labels."""
+    np.random.seed(0)
+    labels = np.random.randint(0, 4, size=(2, 16, 16))
+    predictions = np.random.randint(0, 4, size=(2, 16, 16))
+    merged_confusion_matrix = sum(
+        confusion_matrix.compute_confusion_matrix(
+            labels[i], predictions[i], num_classes=5, ignore_label=255)
+        for i in range(2))
+
+    miou, update_op = tf.metrics.mean_iou(
+        labels.ravel(), predictions.ravel(), num_classes=5)
+    with self.test_session() as sess:
+      sess.run(tf.local_variables_initializer())
+      sess.run(update_op)
+      self.assertAllClose(sess.run(miou),
+                          confusion_matrix.mean_iou(merged_confusion_matrix))
+
+    iou = confusion_matrix.per_class_iou(merged_confusion_matrix)
+    self.assertTrue(np.isnan(iou[4]))
+    frequency = np.bincount(labels.ravel(), minlength=5) / float(labels.size)
+    self.assertAllClose(np.sum(frequency[:4] * iou[:4]),
+                        confusion_matrix.frequency_weighted_iou(
+                            merged_confusion_matrix))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -33,6 +33,10 @@ _DATASET_MAX_ENTRIES = {
     _PASCAL: 256,
 }
 
+# Colormaps and palettes of each dataset, computed on first use.
+_COLORMAPS = {}
+_PALETTES = {}
+
 
 def create_cityscapes_label_colormap():
   """Creates a label colormap used in CITYSCAPES segmentation benchmark.
@@ -122,6 +126,34 @@ def create_label_colormap(dataset=_PASCAL):
     raise ValueError('Unsupported dataset.')
 
 
+def _cached_label_colormap(dataset):
+  """Returns a read-only colormap of the dataset, computed once."""
+  if dataset not in _COLORMAPS:
+    colormap = create_label_colormap(dataset)
+    colormap.flags.writeable = False
+    _COLORMAPS[dataset] = colormap
+  return _COLORMAPS[dataset]
+
+
+def get_label_palette(dataset=_PASCAL):
+  """Returns the colormap of the dataset as a PIL image palette.
+
+  Saving a label as a single-channel image with this palette displays the same
+  colors as label_to_color_image(), without building an RGB array.
+
+  Args:
+    dataset: The colormap used in the dataset.
+
+  Returns:
+    A list of [r0, g0, b0, r1, g1, b1, ...] colors of each label, with
+    values in [0, 255].
+  """
+  if dataset not in _PALETTES:
+    _PALETTES[dataset] = [
+        int(value) for value in _cached_label_colormap(dataset).flatten()]
+  return _PALETTES[dataset]
+
+
 def label_to_color_image(label, dataset=_PASCAL):
   """Adds color defined by the dataset colormap to the label.
 
@@ -144,5 +176,5 @@ def label_to_color_image(label, dataset=_PASCAL):
   if np.max(label) >= _DATASET_MAX_ENTRIES[dataset]:
     raise ValueError('label value too large.')
 
-  colormap = create_label_colormap(dataset)
+  colormap = _cached_label_colormap(dataset)
   return colormap[label]
@@ -66,6 +66,14 @@ class VisualizationUtilTest(tf.test.TestCase):
       get_dataset_colormap.label_to_color_image(
           label, get_dataset_colormap.get_pascal_name())
 
+  def testLabelPaletteMatchesColormap(self):
+    """Test that the palette holds the colors of the colormap."""
+    for dataset in [get_dataset_colormap.get_pascal_name(),
+                    get_dataset_colormap.get_cityscapes_name()]:
+      colormap = get_dataset_colormap.create_label_colormap(dataset)
+      palette = get_dataset_colormap.get_label_palette(dataset)
+      self.assertEqual(colormap.flatten().tolist(), palette)
+
   def testGetColormapForUnsupportedDataset(self):
     with self.assertRaises(ValueError):
       get_dataset_colormap.create_label_colormap('unsupported_dataset')
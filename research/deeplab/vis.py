@@ -90,6 +90,10 @@ flags.DEFINE_integer('max_number_of_iterations', 0,
                      'Maximum number of visualization iterations. Will loop '
                      'indefinitely upon nonpositive values.')
 
+flags.DEFINE_integer('num_writer_threads', 4,
+                     'Number of threads saving the visualization images while '
+                     'the next batches are computed.')
+
 # The folder where semantic segmentation predictions are saved.
 _SEMANTIC_PREDICTION_SAVE_FOLDER = 'segmentation_results'
 
@@ -102,11 +106,6 @@ _IMAGE_FORMAT = '%06d_image'
 # The format to save prediction
 _PREDICTION_FORMAT = '%06d_prediction'
 
-# To evaluate Cityscapes results on the evaluation server, the labels used
-# during training should be mapped to the labels for evaluation.
-_CITYSCAPES_TRAIN_ID_TO_EVAL_ID = [7, 8, 11, 12, 13, 17, 19, 20, 21, 22,
-                                   23, 24, 25, 26, 27, 28, 31, 32, 33]
-
 
 def _convert_train_id_to_eval_id(prediction, train_id_to_eval_id):
   """Converts the predicted label for evaluation.
@@ -122,20 +121,22 @@ def _convert_train_id_to_eval_id(prediction, train_id_to_eval_id):
   Returns:
     Semantic segmentation prediction whose labels have been changed.
   """
-  converted_prediction = prediction.copy()
-  for train_id, eval_id in enumerate(train_id_to_eval_id):
-    converted_prediction[prediction == train_id] = eval_id
+  # Labels not in train_id_to_eval_id map to themselves.
+  lookup_table = np.arange(
+      max(len(train_id_to_eval_id), np.max(prediction) + 1),
+      dtype=prediction.dtype)
+  lookup_table[:len(train_id_to_eval_id)] = train_id_to_eval_id
+  return lookup_table[prediction]
 
-  return converted_prediction
 
-
-def _process_batch(sess, original_images, semantic_predictions, image_names,
-                   image_heights, image_widths, image_id_offset, save_dir,
-                   raw_save_dir, train_id_to_eval_id=None):
+def _process_batch(sess, writer, original_images, semantic_predictions,
+                   image_names, image_heights, image_widths, image_id_offset,
+                   save_dir, raw_save_dir, train_id_to_eval_id=None):
   """Evaluates one single batch qualitatively.
 
   Args:
     sess: TensorFlow session.
+    writer: save_annotation.AnnotationWriter saving the images.
     original_images: One batch of original images.
     semantic_predictions: One batch of semantic segmentation predictions.
     image_names: Image names.
@@ -162,15 +163,15 @@ def _process_batch(sess, original_images, semantic_predictions, image_names,
     crop_semantic_prediction = semantic_prediction[:image_height, :image_width]
 
     # Save image.
-    save_annotation.save_annotation(
+    writer.save_annotation(
         original_image, save_dir, _IMAGE_FORMAT % (image_id_offset + i),
         add_colormap=False)
 
     # Save prediction.
-    save_annotation.save_annotation(
+    writer.save_annotation(
         crop_semantic_prediction, save_dir,
         _PREDICTION_FORMAT % (image_id_offset + i), add_colormap=True,
-        colormap_type=FLAGS.colormap_type)
+        colormap_type=FLAGS.colormap_type, use_palette=True)
 
     if FLAGS.also_save_raw_predictions:
       image_filename = image_names[i]
@@ -179,7 +180,7 @@ def _process_batch(sess, original_images, semantic_predictions, image_names,
         crop_semantic_prediction = _convert_train_id_to_eval_id(
             crop_semantic_prediction,
             train_id_to_eval_id)
-      save_annotation.save_annotation(
+      writer.save_annotation(
           crop_semantic_prediction, raw_save_dir, image_filename,
           add_colormap=False)
 
@@ -192,7 +193,8 @@ def main(unused_argv):
   train_id_to_eval_id = None
   if dataset.name == segmentation_dataset.get_cityscapes_dataset_name():
     tf.logging.info('Cityscapes requires converting train_id to eval_id.')
-    train_id_to_eval_id = _CITYSCAPES_TRAIN_ID_TO_EVAL_ID
+    train_id_to_eval_id = (
+        segmentation_dataset.get_cityscapes_train_id_to_eval_id())
 
   # Prepare for visualization.
   tf.gfile.MakeDirs(FLAGS.vis_logdir)
@@ -271,46 +273,49 @@ def main(unused_argv):
     num_batches = int(math.ceil(
         dataset.num_samples / float(FLAGS.vis_batch_size)))
     last_checkpoint = None
-
-    # Loop to visualize the results when new checkpoint is created.
-    num_iters = 0
-    while (FLAGS.max_number_of_iterations <= 0 or
-           num_iters < FLAGS.max_number_of_iterations):
-      num_iters += 1
-      last_checkpoint = slim.evaluation.wait_for_new_checkpoint(
-          FLAGS.checkpoint_dir, last_checkpoint)
-      start = time.time()
-      tf.logging.info(
-          'Starting visualization at ' + time.strftime('%Y-%m-%d-%H:%M:%S',
-                                                       time.gmtime()))
-      tf.logging.info('Visualizing with model %s', last_checkpoint)
-
-      with sv.managed_session(FLAGS.master,
-                              start_standard_services=False) as sess:
-        sv.start_queue_runners(sess)
-        sv.saver.restore(sess, last_checkpoint)
-
-        image_id_offset = 0
-        for batch in range(num_batches):
-          tf.logging.info('Visualizing batch %d / %d', batch + 1, num_batches)
-          _process_batch(sess=sess,
-                         original_images=samples[common.ORIGINAL_IMAGE],
-                         semantic_predictions=predictions,
-                         image_names=samples[common.IMAGE_NAME],
-                         image_heights=samples[common.HEIGHT],
-                         image_widths=samples[common.WIDTH],
-                         image_id_offset=image_id_offset,
-                         save_dir=save_dir,
-                         raw_save_dir=raw_save_dir,
-                         train_id_to_eval_id=train_id_to_eval_id)
-          image_id_offset += FLAGS.vis_batch_size
-
-      tf.logging.info(
-          'Finished visualization at ' + time.strftime('%Y-%m-%d-%H:%M:%S',
-                                                       time.gmtime()))
-      time_to_next_eval = start + FLAGS.eval_interval_secs - time.time()
-      if time_to_next_eval > 0:
-        time.sleep(time_to_next_eval)
+    with save_annotation.AnnotationWriter(
+        FLAGS.num_writer_threads) as writer:
+      # Loop to visualize the results when new checkpoint is created.
+      num_iters = 0
+      while (FLAGS.max_number_of_iterations <= 0 or
+             num_iters < FLAGS.max_number_of_iterations):
+        num_iters += 1
+        last_checkpoint = slim.evaluation.wait_for_new_checkpoint(
+            FLAGS.checkpoint_dir, last_checkpoint)
+        start = time.time()
+        tf.logging.info(
+            'Starting visualization at ' + time.strftime('%Y-%m-%d-%H:%M:%S',
+                                                         time.gmtime()))
+        tf.logging.info('Visualizing with model %s', last_checkpoint)
+
+        with sv.managed_session(FLAGS.master,
+                                start_standard_services=False) as sess:
+          sv.start_queue_runners(sess)
+          sv.saver.restore(sess, last_checkpoint)
+
+          image_id_offset = 0
+          for batch in range(num_batches):
+            tf.logging.info('Visualizing batch %d / %d', batch + 1, num_batches)
+            _process_batch(sess=sess,
+                           writer=writer,
+                           original_images=samples[common.ORIGINAL_IMAGE],
+                           semantic_predictions=predictions,
+                           image_names=samples[common.IMAGE_NAME],
+                           image_heights=samples[common.HEIGHT],
+                           image_widths=samples[common.WIDTH],
+                           image_id_offset=image_id_offset,
+                           save_dir=save_dir,
+                           raw_save_dir=raw_save_dir,
+                           train_id_to_eval_id=train_id_to_eval_id)
+            image_id_offset += FLAGS.vis_batch_size
+          writer.wait()
+
+        tf.logging.info(
+            'Finished visualization at ' + time.strftime('%Y-%m-%d-%H:%M:%S',
+                                                         time.gmtime()))
+        time_to_next_eval = start + FLAGS.eval_interval_secs - time.time()
+        if time_to_next_eval > 0:
+          time.sleep(time_to_next_eval)
 
 
 if __name__ == '__main__':
@@ -212,6 +212,102 @@ def smoothed_sens(counts, noise_eps, l, beta):
   return smoothed_sensitivity
 
 
+def compute_q_noisy_max_batch(counts, noise_eps):
+  """Vectorized compute_q_noisy_max over the rows of a counts matrix.
+
+  Args:
+    counts: a matrix of scores, one row per query
+    noise_eps: privacy parameter for noisy_max
+  Returns:
+    q: the probability that outcome is different from true winner, for
+      each query.
+  """
+  counts = np.asarray(counts)
+  rows = np.arange(counts.shape[0])
+  winners = np.argmax(counts, axis=1)
+  gaps = -(noise_eps * (counts - counts[rows, winners][:, np.newaxis]))
+  terms = (gaps + 2.0) / (4.0 * np.exp(gaps))
+  terms[rows, winners] = 0.0
+  # Sum the terms in the same order as compute_q_noisy_max.
+  q = np.zeros(counts.shape[0])
+  for j in xrange(counts.shape[1]):
+    q += terms[:, j]
+  return np.minimum(q, 1.0 - (1.0/counts.shape[1]))
+
+
+def logmgf_exact_batch(q, priv_eps, l):
+  """Vectorized logmgf_exact, broadcasting q against l.
+
+  Args:
+    q: array of pr of non-optimal outcome
+    priv_eps: eps parameter for DP
+    l: array of moments to compute.
+  Returns:
+    Upper bounds on logmgf
+  """
+  q, l = np.broadcast_arrays(np.asarray(q, dtype=np.float64),
+                             np.asarray(l, dtype=np.float64))
+  with np.errstate(all="ignore"):
+    t_one = (1-q) * np.power((1-q) / (1 - math.exp(priv_eps) * q), l)
+    t_two = q * np.exp(priv_eps * l)
+    t = t_one + t_two
+    log_t = np.log(t)
+  use_t = np.logical_and(q < 0.5, t > 0)
+  log_t = np.where(use_t, log_t, priv_eps * l)
+  return np.minimum(np.minimum(0.5 * priv_eps * priv_eps * l * (l + 1), log_t),
+                    priv_eps * l)
+
+
+def logmgf_from_counts_batch(counts, noise_eps, l_list):
+  """Vectorized logmgf_from_counts for all the rows of counts and all moments.
+
+  Returns:
+    a matrix with one row per row of counts and one column per moment.
+  """
+  q = compute_q_noisy_max_batch(counts, noise_eps)
+  return logmgf_exact_batch(q[:, np.newaxis], 2.0 * noise_eps,
+                            np.asarray(l_list)[np.newaxis, :])
+
+
+def smoothed_sens_batch(counts, noise_eps, l_list, beta):
+  """Vectorized smoothed_sens for all moments l in l_list.
+
+  The sensitivities at all distances k are computed at once, and then
+  combined as smoothed_sens does, stopping at the first zero sensitivity.
+
+  Args:
+    counts: array of scors
+    noise_eps: noise parameter
+    l_list: moments of interest
+    beta: smoothness parameter
+  Returns:
+    smooth_sensitivity: a beta smooth upper bound for each moment
+  """
+  l_list = np.asarray(l_list, dtype=np.float64)
+  if np.any(0.5 * noise_eps * l_list > 1):
+    print("l too large to compute sensitivity")
+  max_k = int(max(counts))
+  ks = np.arange(max_k + 1)
+  # Row k is counts_sorted after moving k votes from the top to the second
+  # count, for k up to max_k + 1.
+  counts_sorted = np.array(sorted(counts, reverse=True))
+  shifted = np.tile(counts_sorted, (max_k + 2, 1))
+  shifted[:, 0] -= np.arange(max_k + 2)
+  shifted[:, 1] += np.arange(max_k + 2)
+  vals = logmgf_from_counts_batch(shifted, noise_eps, l_list)
+  sens = vals[1:] - vals[:-1]
+  sens[:, 0.5 * noise_eps * l_list > 1] = 0
+  sens[counts[0] < counts[1] + ks] = 0
+  if max_k == 0:
+    return sens[0]
+  # Only the distances up to the first zero sensitivity after k = 0 count.
+  is_zero = sens[1:] == 0.0
+  after_zero = (np.cumsum(is_zero, axis=0) - is_zero) > 0
+  smoothed = np.exp(-beta * ks[1:])[:, np.newaxis] * sens[1:]
+  smoothed[after_zero] = -np.inf
+  return np.maximum(sens[0], np.max(smoothed, axis=0))
+
+
 def main(unused_argv):
   ##################################################################
   # If we are reproducing results from paper https://arxiv.org/abs/1610.05755,
@@ -237,10 +333,9 @@ def main(unused_argv):
   else:
     # In this case, the input is the raw predictions. Transform
     num_teachers, n = input_mat.shape
-    counts_mat = np.zeros((n, 10)).astype(np.int32)
-    for i in range(n):
-      for j in range(num_teachers):
-        counts_mat[i, input_mat[j, i]] += 1
+    counts_mat = np.bincount(
+        (np.arange(n)[np.newaxis, :] * 10 + input_mat).ravel(),
+        minlength=n * 10).reshape((n, 10)).astype(np.int32)
   n = counts_mat.shape[0]
   num_examples = min(n, FLAGS.max_examples)
 
@@ -256,13 +351,18 @@ def main(unused_argv):
   total_ss_nm = np.array([0.0 for _ in l_list])
   noise_eps = FLAGS.noise_eps
 
+  # All the moments of all the queries at once.
+  log_mgf_nm = logmgf_from_counts_batch(counts_mat[indices], noise_eps, l_list)
+  total_log_mgf_nm += np.sum(log_mgf_nm, axis=0)
+  # Many queries have the same counts, so their smoothed sensitivities are
+  # only computed once.
+  smoothed_sens_of_counts = {}
   for i in indices:
-    total_log_mgf_nm += np.array(
-        [logmgf_from_counts(counts_mat[i], noise_eps, l)
-         for l in l_list])
-    total_ss_nm += np.array(
-        [smoothed_sens(counts_mat[i], noise_eps, l, beta)
-         for l in l_list])
+    key = tuple(counts_mat[i])
+    if key not in smoothed_sens_of_counts:
+      smoothed_sens_of_counts[key] = smoothed_sens_batch(
+          counts_mat[i], noise_eps, l_list, beta)
+    total_ss_nm += smoothed_sens_of_counts[key]
   delta = FLAGS.delta
 
   # We want delta = exp(alpha - eps l).
@@ -291,8 +391,8 @@ def main(unused_argv):
   # Data independent bound, as mechanism is
   # 2*noise_eps DP.
   data_ind_log_mgf = np.array([0.0 for _ in l_list])
-  data_ind_log_mgf += num_examples * np.array(
-      [logmgf_exact(1.0, 2.0 * noise_eps, l) for l in l_list])
+  data_ind_log_mgf += num_examples * logmgf_exact_batch(1.0, 2.0 * noise_eps,
+                                                        l_list)
 
   data_ind_eps_list = (data_ind_log_mgf - math.log(delta)) / l_list
   print("Data independent bound = " + str(min(data_ind_eps_list)) + ".")
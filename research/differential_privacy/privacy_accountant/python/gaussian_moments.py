@@ -39,10 +39,22 @@ delta. The example code would be:
 To verify that the I1 >= I2 (see comments in GaussianMomentsAccountant in
 accountant.py for the context), run the same loop above with verify=True
 passed to compute_log_moment.
+
+compute_log_moments(q, sigma, T, lmbds) computes the log moments of all the
+orders lmbds at once, optionally looking them up in a MomentCache. To compute
+eps for a grid of sampling ratios and noise sigmas, with the moments computed
+by several processes and cached in a file across runs:
+
+  python gaussian_moments.py --q=0.01,0.02 --sigma=1,2,4 --steps=10000 \
+      --target_delta=1e-5 --cache_file=/tmp/moments.json
 """
 from __future__ import print_function
 
+import argparse
+import json
 import math
+import multiprocessing
+import os
 import sys
 
 import numpy as np
@@ -149,6 +161,127 @@ def compute_b(sigma, q, lmbd, verbose=False):
   return _to_np_float64(b_lambda)
 
 
+#########################
+# VECTORIZED ARITHMETIC #
+#########################
+
+
+def _binomial_table(max_lmbd):
+  """Returns the table of (i choose j) for i, j in [0, max_lmbd]."""
+  i = np.arange(max_lmbd + 1)
+  return scipy.special.binom(i[:, np.newaxis], i[np.newaxis, :])
+
+
+def _differential_moments(sigma, s, max_lmbd):
+  """Computes, for all i <= max_lmbd, the sum over j <= i of
+  (i choose j) * (-1)^(i-j) * exp((j * j - s * j) / (2 * sigma^2)).
+
+  The terms are summed in the same order as in compute_a. Returns an array of
+  max_lmbd + 1 values.
+  """
+  i = np.arange(max_lmbd + 1)
+  signs = (-1.0) ** (i[:, np.newaxis] - i[np.newaxis, :])
+  terms = (_binomial_table(max_lmbd) * signs *
+           np.exp((i * i - s * i) / (2.0 * (sigma ** 2))))
+  # Only the terms with j <= i are summed, the others may be nan.
+  return np.diagonal(np.cumsum(terms, axis=1))
+
+
+def compute_a_batch(sigma, q, max_lmbd):
+  """Computes compute_a(sigma, q, lmbd) for all lmbd in [0, max_lmbd] at once.
+
+  Args:
+    sigma: the noise sigma.
+    q: the sampling ratio.
+    max_lmbd: the largest moment order.
+  Returns:
+    an np.float64 array of max_lmbd + 1 values, which are np.inf where the
+    moment overflows.
+  """
+  i = np.arange(max_lmbd + 1)
+  coefs = _binomial_table(max_lmbd) * (q ** i)
+  with np.errstate(over="ignore", invalid="ignore"):
+    first_term = np.diagonal(np.cumsum(
+        coefs * _differential_moments(sigma, 1.0, max_lmbd), axis=1))
+    second_term = np.diagonal(np.cumsum(
+        coefs * _differential_moments(sigma, -1.0, max_lmbd), axis=1))
+    a_lambda = (1.0 - q) * first_term + q * second_term
+  a_lambda[0] = 1.0
+  a_lambda[np.logical_not(np.isfinite(a_lambda))] = np.inf
+  return a_lambda
+
+
+class MomentCache(object):
+  """Persistent cache of the moments compute_a(sigma, q, lmbd).
+
+  The moments of all the orders up to the largest order requested so far are
+  stored for each (q, sigma), so a moment is keyed by (q, sigma, lmbd). If
+  path is given, the cache is loaded from and saved to that JSON file.
+  """
+
+  def __init__(self, path=None):
+    self._path = path
+    self._moments = {}
+    if path is not None and os.path.exists(path):
+      with open(path) as f:
+        for key, moments in json.load(f).items():
+          q, sigma = key.split(",")
+          self._moments[(float(q), float(sigma))] = np.array(moments)
+
+  def lookup(self, q, sigma, max_lmbd):
+    """Returns the moments of orders [0, max_lmbd], or None if not cached."""
+    moments = self._moments.get((q, sigma))
+    if moments is None or len(moments) <= max_lmbd:
+      return None
+    return moments[:max_lmbd + 1]
+
+  def insert(self, q, sigma, moments):
+    self._moments[(q, sigma)] = moments
+
+  def get(self, q, sigma, max_lmbd):
+    """Returns the moments of orders [0, max_lmbd], computing them if needed."""
+    moments = self.lookup(q, sigma, max_lmbd)
+    if moments is None:
+      moments = compute_a_batch(sigma, q, max_lmbd)
+      self.insert(q, sigma, moments)
+    return moments
+
+  def save(self):
+    if self._path is None:
+      return
+    with open(self._path + ".tmp", "w") as f:
+      json.dump({"%r,%r" % (float(q), float(sigma)): moments.tolist()
+                 for (q, sigma), moments in self._moments.items()}, f)
+    os.rename(self._path + ".tmp", self._path)
+
+
+def compute_log_moments(q, sigma, steps, lmbds, cache=None):
+  """Compute the log moments of Gaussian mechanism for all moment orders.
+
+  Vectorized and cached version of compute_log_moment without verification.
+
+  Args:
+    q: the sampling ratio.
+    sigma: the noise sigma.
+    steps: the number of steps.
+    lmbds: the moment orders.
+    cache: if not None, the MomentCache to look the moments up in.
+  Returns:
+    an np.float64 array with the log moment of each order, could be np.inf.
+  """
+  lmbd_ints = np.ceil(np.asarray(lmbds)).astype(np.int64)
+  max_lmbd = int(np.max(lmbd_ints)) if lmbd_ints.size else 0
+  if cache is None:
+    moments = compute_a_batch(sigma, q, max_lmbd)
+  else:
+    moments = cache.get(q, sigma, max_lmbd)
+  moments = moments[lmbd_ints]
+  log_moments = np.full(moments.shape, np.inf)
+  finite = np.isfinite(moments)
+  log_moments[finite] = np.log(moments[finite]) * steps
+  return log_moments
+
+
 ###########################
 # MULTIPRECISION ROUTINES #
 ###########################
@@ -324,3 +457,92 @@ def get_privacy_spent(log_moments, target_eps=None, target_delta=None):
     return (target_eps, _compute_delta(log_moments, target_eps))
   else:
     return (_compute_eps(log_moments, target_delta), target_delta)
+
+
+def _sweep_moments(args):
+  """Computes the moments of one (q, sigma) of a sweep, in a worker process."""
+  q, sigma, max_lmbd = args
+  return q, sigma, compute_a_batch(sigma, q, max_lmbd)
+
+
+def sweep(qs, sigmas, steps, max_lmbd, target_eps=None, target_delta=None,
+          num_processes=None, cache=None):
+  """Compute the privacy spent for all the (q, sigma) in a grid.
+
+  The moments that are not in the cache are computed by a pool of processes.
+
+  Args:
+    qs: the sampling ratios.
+    sigmas: the noise sigmas.
+    steps: the number of steps.
+    max_lmbd: the moment orders used are 1 to max_lmbd.
+    target_eps: as in get_privacy_spent.
+    target_delta: as in get_privacy_spent.
+    num_processes: the number of processes, defaults to the number of CPUs.
+    cache: if not None, the MomentCache to look the moments up in and to add
+      the new moments to.
+  Returns:
+    a list of (q, sigma, eps, delta) tuples.
+  """
+  if cache is None:
+    cache = MomentCache()
+  grid = [(q, sigma) for q in qs for sigma in sigmas]
+  tasks = [(q, sigma, max_lmbd) for q, sigma in grid
+           if cache.lookup(q, sigma, max_lmbd) is None]
+  if tasks:
+    pool = multiprocessing.Pool(num_processes)
+    for q, sigma, moments in pool.imap_unordered(_sweep_moments, tasks):
+      cache.insert(q, sigma, moments)
+    pool.close()
+    pool.join()
+
+  lmbds = np.arange(1, max_lmbd + 1)
+  results = []
+  for q, sigma in grid:
+    log_moments = compute_log_moments(q, sigma, steps, lmbds, cache=cache)
+    eps, delta = get_privacy_spent(list(zip(lmbds, log_moments)),
+                                   target_eps=target_eps,
+                                   target_delta=target_delta)
+    results.append((q, sigma, eps, delta))
+  return results
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description="Computes the privacy spent for a grid of sampling ratios "
+      "and noise sigmas.")
+  parser.add_argument("--q", required=True,
+                      help="Comma separated list of sampling ratios.")
+  parser.add_argument("--sigma", required=True,
+                      help="Comma separated list of noise sigmas.")
+  parser.add_argument("--steps", type=int, required=True,
+                      help="Number of steps.")
+  parser.add_argument("--max_lmbd", type=int, default=32,
+                      help="Largest moment order.")
+  parser.add_argument("--target_eps", type=float, default=None,
+                      help="Compute delta for this epsilon.")
+  parser.add_argument("--target_delta", type=float, default=None,
+                      help="Compute epsilon for this delta.")
+  parser.add_argument("--num_processes", type=int, default=None,
+                      help="Number of processes, defaults to the number of "
+                      "CPUs.")
+  parser.add_argument("--cache_file", default=None,
+                      help="JSON file caching the moments across runs.")
+  args = parser.parse_args()
+  if (args.target_eps is None) == (args.target_delta is None):
+    parser.error("Exactly one of --target_eps and --target_delta is needed.")
+
+  cache = MomentCache(args.cache_file)
+  results = sweep([float(q) for q in args.q.split(",")],
+                  [float(sigma) for sigma in args.sigma.split(",")],
+                  args.steps, args.max_lmbd, target_eps=args.target_eps,
+                  target_delta=args.target_delta,
+                  num_processes=args.num_processes, cache=cache)
+  cache.save()
+  print("%-12s %-12s %-14s %-14s" % ("q", "sigma", "eps", "delta"))
+  for q, sigma, eps, delta in results:
+    print("%-12g %-12g %-14g %-14g" % (q, sigma, eps, delta))
+
+
+if __name__ == "__main__":
+  main()
@@ -209,3 +209,211 @@ class CaptionGenerator(object):
       complete_captions = partial_captions
 
     return complete_captions.extract(sort=True)
+
+  def _top_words(self, softmax):
+    """Returns the beam_size most probable words of each row of softmax.
+
+    Ties are broken in favor of smaller word ids, as in beam_search().
+
+    Args:
+      softmax: A numpy array of shape [num_rows, vocab_size].
+
+    Returns:
+      words: An int numpy array of shape [num_rows, k] containing the word ids
+        of each row in descending order of probability, where
+        k = min(beam_size, vocab_size).
+      probs: A numpy array of shape [num_rows, k] containing the corresponding
+        probabilities.
+    """
+    num_rows, vocab_size = softmax.shape
+    k = min(self.beam_size, vocab_size)
+    # The k-th largest probability of each row.
+    kth = -np.partition(-softmax, k - 1, axis=1)[:, k - 1:k]
+    # Select every word above the k-th largest probability, plus the smallest
+    # word ids among the words equal to it.
+    greater = softmax > kth
+    equal = softmax == kth
+    num_needed = k - np.sum(greater, axis=1, keepdims=True)
+    selected = greater | (equal & (np.cumsum(equal, axis=1) <= num_needed))
+    words = np.nonzero(selected)[1].reshape(num_rows, k)
+    probs = softmax[np.arange(num_rows)[:, np.newaxis], words]
+    order = np.argsort(-probs, axis=1, kind="mergesort")
+    rows = np.arange(num_rows)[:, np.newaxis]
+    return words[rows, order], probs[rows, order]
+
+  def beam_search_batch(self, sess, encoded_images):
+    """Runs beam search caption generation on a batch of images.
+
+    All images and beams are advanced together: each step runs a single
+    inference_step() over the live beams of every image, and the bookkeeping
+    for the whole batch is done with numpy arrays rather than per-caption
+    Python objects. The captions are the same as those of beam_search(),
+    except that ties between exactly equal scores are broken in favor of the
+    higher ranked beam and then the more probable word.
+
+    Args:
+      sess: TensorFlow Session object.
+      encoded_images: A list of encoded image strings.
+
+    Returns:
+      A list with one entry per image, each a list of Caption sorted by
+      descending score.
+    """
+    batch_size = len(encoded_images)
+    beam_size = self.beam_size
+    max_length = self.max_caption_length
+
+    # The initial state of each image.
+    initial_states = np.concatenate(
+        [self.model.feed_image(sess, image) for image in encoded_images])
+
+    # Partial captions, stored in beam_size slots per image sorted by
+    # descending score. All partial captions have the same length.
+    partial_valid = np.zeros([batch_size, beam_size], dtype=np.bool_)
+    partial_valid[:, 0] = True
+    partial_sentences = np.zeros([batch_size, beam_size, max_length],
+                                 dtype=np.int64)
+    partial_sentences[:, :, 0] = self.vocab.start_id
+    partial_metadata = np.empty([batch_size, beam_size, max_length],
+                                dtype=object)
+    partial_metadata[:, :, 0] = ""
+    partial_states = np.zeros([batch_size, beam_size] +
+                              list(initial_states.shape[1:]),
+                              dtype=initial_states.dtype)
+    partial_states[:, 0] = initial_states
+    partial_logprobs = np.zeros([batch_size, beam_size])
+    partial_length = 1
+
+    # Complete captions, stored in beam_size slots per image sorted by
+    # descending score.
+    complete_valid = np.zeros([batch_size, beam_size], dtype=np.bool_)
+    complete_sentences = np.zeros_like(partial_sentences)
+    complete_metadata = np.empty_like(partial_metadata)
+    complete_states = np.zeros_like(partial_states)
+    complete_logprobs = np.zeros([batch_size, beam_size])
+    complete_scores = np.full([batch_size, beam_size], -np.inf)
+    complete_lengths = np.zeros([batch_size, beam_size], dtype=np.int64)
+
+    has_metadata = True
+    for _ in range(max_length - 1):
+      # Run a single inference step over the live beams of all images.
+      image_index, slot_index = np.nonzero(partial_valid)
+      input_feed = partial_sentences[image_index, slot_index,
+                                     partial_length - 1]
+      state_feed = partial_states[image_index, slot_index]
+      softmax, new_states, metadata = self.model.inference_step(
+          sess, input_feed, state_feed)
+      has_metadata = bool(metadata)
+
+      # Candidate extensions of every live beam, in the order
+      # [image, slot, word rank].
+      words, probs = self._top_words(softmax)
+      num_words = words.shape[1]
+      row_of = np.zeros([batch_size, beam_size], dtype=np.int64)
+      row_of[image_index, slot_index] = np.arange(len(image_index))
+      valid = probs >= 1e-12  # Avoid log(0).
+      logprobs = partial_logprobs[image_index, slot_index][:, np.newaxis]
+      logprobs = logprobs + np.log(np.where(valid, probs, 1.0))
+      is_end = words == self.vocab.end_id
+
+      cand_words = np.zeros([batch_size, beam_size, num_words], dtype=np.int64)
+      cand_words[image_index, slot_index] = words
+      cand_logprobs = np.zeros([batch_size, beam_size, num_words])
+      cand_logprobs[image_index, slot_index] = logprobs
+      cand_partial = np.zeros([batch_size, beam_size, num_words],
+                              dtype=np.bool_)
+      cand_partial[image_index, slot_index] = valid & ~is_end
+      cand_complete = np.zeros_like(cand_partial)
+      cand_complete[image_index, slot_index] = valid & is_end
+      cand_words = cand_words.reshape(batch_size, -1)
+      cand_logprobs = cand_logprobs.reshape(batch_size, -1)
+      cand_partial = cand_partial.reshape(batch_size, -1)
+      cand_complete = cand_complete.reshape(batch_size, -1)
+      cand_slots = np.arange(beam_size * num_words) // num_words
+      batch_rows = np.arange(batch_size)[:, np.newaxis]
+
+      # Merge new complete captions into the existing ones, which take
+      # precedence on ties.
+      length = partial_length + 1
+      cand_scores = cand_logprobs
+      if self.length_normalization_factor > 0:
+        cand_scores = cand_scores / length**self.length_normalization_factor
+      merged_scores = np.concatenate(
+          [np.where(complete_valid, complete_scores, -np.inf),
+           np.where(cand_complete, cand_scores, -np.inf)], axis=1)
+      top = np.argsort(-merged_scores, axis=1, kind="mergesort")[:, :beam_size]
+      from_cand = top >= beam_size
+      cand_index = np.maximum(top - beam_size, 0)
+      old_index = np.minimum(top, beam_size - 1)
+      cand_parent = cand_slots[cand_index]
+      cand_rows = row_of[batch_rows, cand_parent]
+
+      new_sentences = partial_sentences[batch_rows, cand_parent]
+      new_sentences[:, :, partial_length] = cand_words[batch_rows, cand_index]
+      new_metadata = partial_metadata[batch_rows, cand_parent]
+      if has_metadata:
+        new_metadata[:, :, partial_length] = np.asarray(
+            metadata, dtype=object)[cand_rows]
+      fc = from_cand[:, :, np.newaxis]
+      complete_sentences = np.where(
+          fc, new_sentences, complete_sentences[batch_rows, old_index])
+      complete_metadata = np.where(
+          fc, new_metadata, complete_metadata[batch_rows, old_index])
+      complete_states = np.where(
+          from_cand.reshape(from_cand.shape + (1,) * (new_states.ndim - 1)),
+          new_states[cand_rows], complete_states[batch_rows, old_index])
+      complete_logprobs = np.where(
+          from_cand, cand_logprobs[batch_rows, cand_index],
+          complete_logprobs[batch_rows, old_index])
+      complete_lengths = np.where(from_cand, length,
+                                  complete_lengths[batch_rows, old_index])
+      complete_scores = merged_scores[batch_rows, top]
+      complete_valid = np.isfinite(complete_scores)
+
+      # Select the new partial captions.
+      scores = np.where(cand_partial, cand_logprobs, -np.inf)
+      top = np.argsort(-scores, axis=1, kind="mergesort")[:, :beam_size]
+      parent = cand_slots[top]
+      rows = row_of[batch_rows, parent]
+      partial_valid = np.isfinite(scores[batch_rows, top])
+      partial_sentences = partial_sentences[batch_rows, parent]
+      partial_sentences[:, :, partial_length] = cand_words[batch_rows, top]
+      partial_metadata = partial_metadata[batch_rows, parent]
+      if has_metadata:
+        partial_metadata[:, :, partial_length] = np.asarray(
+            metadata, dtype=object)[rows]
+      partial_states = new_states[rows]
+      partial_logprobs = cand_logprobs[batch_rows, top]
+      partial_length = length
+
+      if not np.any(partial_valid):
+        # We have run out of partial candidates; happens when beam_size = 1.
+        break
+
+    results = []
+    for i in range(batch_size):
+      # As in beam_search(), never output a mixture of complete and partial
+      # captions.
+      captions = []
+      if np.any(complete_valid[i]):
+        for j in np.nonzero(complete_valid[i])[0]:
+          length = complete_lengths[i, j]
+          captions.append(Caption(
+              sentence=complete_sentences[i, j, :length].tolist(),
+              state=complete_states[i, j],
+              logprob=complete_logprobs[i, j],
+              score=complete_scores[i, j],
+              metadata=(complete_metadata[i, j, :length].tolist()
+                        if has_metadata else None)))
+      else:
+        for j in np.nonzero(partial_valid[i])[0]:
+          captions.append(Caption(
+              sentence=partial_sentences[i, j, :partial_length].tolist(),
+              state=partial_states[i, j],
+              logprob=partial_logprobs[i, j],
+              score=partial_logprobs[i, j],
+              metadata=(partial_metadata[i, j, :partial_length].tolist()
+                        if has_metadata else None)))
+      results.append(captions)
+
+    return results
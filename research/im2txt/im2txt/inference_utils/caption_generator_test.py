@@ -123,6 +123,17 @@ class CaptionGeneratorTest(tf.test.TestCase):
     self.assertEqual(expected_sentences, actual_sentences)
     self.assertAllClose(expected_probabilities, actual_probabilities)
 
+    # Batched beam search generates the same captions for every image.
+    batch_captions = generator.beam_search_batch(
+        sess=None, encoded_images=[None, None, None])
+    self.assertEqual(3, len(batch_captions))
+    for actual_captions in batch_captions:
+      actual_sentences = [c.sentence for c in actual_captions]
+      actual_probabilities = [math.exp(c.logprob) for c in actual_captions]
+
+      self.assertEqual(expected_sentences, actual_sentences)
+      self.assertAllClose(expected_probabilities, actual_probabilities)
+
   def testBeamSize(self):
     # Beam size = 1.
     expected = [([0, 4, 10, 1], 0.16)]
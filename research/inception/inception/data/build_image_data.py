@@ -61,20 +61,23 @@ contains the following fields:
     e.g. 'dog'
 
 If your data set involves bounding boxes, please look at build_imagenet_data.py.
+
+The images are converted by a pool of processes (see image_conversion.py).
+Shards that already exist in the output directory are skipped, so an
+interrupted run can be resumed, and --dry_run measures the conversion
+throughput without writing anything.
 """
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from datetime import datetime
 import os
 import random
-import sys
-import threading
 
-import numpy as np
 import tensorflow as tf
 
+from inception.data import image_conversion
+
 tf.app.flags.DEFINE_string('train_directory', '/tmp/',
                            'Training data directory')
 tf.app.flags.DEFINE_string('validation_directory', '/tmp/',
@@ -88,7 +91,20 @@ tf.app.flags.DEFINE_integer('validation_shards', 2,
                             'Number of shards in validation TFRecord files.')
 
 tf.app.flags.DEFINE_integer('num_threads', 2,
-                            'Number of threads to preprocess the images.')
+                            'Number of processes to preprocess the images.')
+tf.app.flags.DEFINE_string('image_coder', 'tensorflow',
+                           'Library used to decode and re-encode the images, '
+                           'one of: %s.' %
+                           ', '.join(sorted(image_conversion.IMAGE_CODERS)))
+tf.app.flags.DEFINE_boolean('resume', True,
+                            'Whether to skip the shards that already exist '
+                            'in the output directory.')
+tf.app.flags.DEFINE_boolean('dry_run', False,
+                            'If true, convert the images without writing any '
+                            'shards and report the throughput.')
+tf.app.flags.DEFINE_integer('dry_run_images', 10000,
+                            'Number of images of each data set to convert in '
+                            'a dry run, or 0 for all of them.')
 
 # The labels file contains a list of valid labels are held in this file.
 # Assumes that the file contains entries as such:
@@ -146,34 +162,6 @@ def _convert_to_example(filename, image_buffer, label, text, height, width):
   return example
 
 
-class ImageCoder(object):
-  """Helper class that provides TensorFlow image coding utilities."""
-
-  def __init__(self):
-    # Create a single Session to run all image coding calls.
-    self._sess = tf.Session()
-
-    # Initializes function that converts PNG to JPEG data.
-    self._png_data = tf.placeholder(dtype=tf.string)
-    image = tf.image.decode_png(self._png_data, channels=3)
-    self._png_to_jpeg = tf.image.encode_jpeg(image, format='rgb', quality=100)
-
-    # Initializes function that decodes RGB JPEG data.
-    self._decode_jpeg_data = tf.placeholder(dtype=tf.string)
-    self._decode_jpeg = tf.image.decode_jpeg(self._decode_jpeg_data, channels=3)
-
-  def png_to_jpeg(self, image_data):
-    return self._sess.run(self._png_to_jpeg,
-                          feed_dict={self._png_data: image_data})
-
-  def decode_jpeg(self, image_data):
-    image = self._sess.run(self._decode_jpeg,
-                           feed_dict={self._decode_jpeg_data: image_data})
-    assert len(image.shape) == 3
-    assert image.shape[2] == 3
-    return image
-
-
 def _is_png(filename):
   """Determine if a file contains a PNG format image.
 
@@ -191,7 +179,7 @@ def _process_image(filename, coder):
 
   Args:
     filename: string, path to an image file e.g., '/path/to/example.JPG'.
-    coder: instance of ImageCoder to provide TensorFlow image coding utils.
+    coder: image coder, e.g. an image_conversion.TFImageCoder.
   Returns:
     image_buffer: string, JPEG encoding of RGB image.
     height: integer, image height in pixels.
@@ -206,86 +194,32 @@ def _process_image(filename, coder):
     print('Converting PNG to JPEG for %s' % filename)
     image_data = coder.png_to_jpeg(image_data)
 
-  # Decode the RGB JPEG.
-  image = coder.decode_jpeg(image_data)
-
-  # Check that image converted to RGB
-  assert len(image.shape) == 3
-  height = image.shape[0]
-  width = image.shape[1]
-  assert image.shape[2] == 3
+  # Decode the JPEG, converting it to RGB if it is e.g. grayscale.
+  image_data, height, width = coder.rgb_jpeg_and_size(image_data)
 
   return image_data, height, width
 
 
-def _process_image_files_batch(coder, thread_index, ranges, name, filenames,
-                               texts, labels, num_shards):
-  """Processes and saves list of images as TFRecord in 1 thread.
+def _convert_image(coder, filename, text, label):
+  """Builds the Example proto of an image file in a worker process.
 
   Args:
-    coder: instance of ImageCoder to provide TensorFlow image coding utils.
-    thread_index: integer, unique batch to run index is within [0, len(ranges)).
-    ranges: list of pairs of integers specifying ranges of each batches to
-      analyze in parallel.
-    name: string, unique identifier specifying the data set
-    filenames: list of strings; each string is a path to an image file
-    texts: list of strings; each string is human readable, e.g. 'dog'
-    labels: list of integer; each integer identifies the ground truth
-    num_shards: integer number of shards for this data set.
+    coder: image coder, e.g. an image_conversion.TFImageCoder.
+    filename: string, path to an image file, e.g., '/path/to/example.JPG'
+    text: string, unique human-readable, e.g. 'dog'
+    label: integer, identifier for the ground truth for the network
+  Returns:
+    Example proto, or None if the image could not be decoded.
   """
-  # Each thread produces N shards where N = int(num_shards / num_threads).
-  # For instance, if num_shards = 128, and the num_threads = 2, then the first
-  # thread would produce shards [0, 64).
-  num_threads = len(ranges)
-  assert not num_shards % num_threads
-  num_shards_per_batch = int(num_shards / num_threads)
-
-  shard_ranges = np.linspace(ranges[thread_index][0],
-                             ranges[thread_index][1],
-                             num_shards_per_batch + 1).astype(int)
-  num_files_in_thread = ranges[thread_index][1] - ranges[thread_index][0]
-
-  counter = 0
-  for s in range(num_shards_per_batch):
-    # Generate a sharded version of the file name, e.g. 'train-00002-of-00010'
-    shard = thread_index * num_shards_per_batch + s
-    output_filename = '%s-%.5d-of-%.5d' % (name, shard, num_shards)
-    output_file = os.path.join(FLAGS.output_directory, output_filename)
-    writer = tf.python_io.TFRecordWriter(output_file)
-
-    shard_counter = 0
-    files_in_shard = np.arange(shard_ranges[s], shard_ranges[s + 1], dtype=int)
-    for i in files_in_shard:
-      filename = filenames[i]
-      label = labels[i]
-      text = texts[i]
-
-      try:
-        image_buffer, height, width = _process_image(filename, coder)
-      except Exception as e:
-        print(e)
-        print('SKIPPED: Unexpected error while decoding %s.' % filename)
-        continue
-
-      example = _convert_to_example(filename, image_buffer, label,
-                                    text, height, width)
-      writer.write(example.SerializeToString())
-      shard_counter += 1
-      counter += 1
-
-      if not counter % 1000:
-        print('%s [thread %d]: Processed %d of %d images in thread batch.' %
-              (datetime.now(), thread_index, counter, num_files_in_thread))
-        sys.stdout.flush()
-
-    writer.close()
-    print('%s [thread %d]: Wrote %d images to %s' %
-          (datetime.now(), thread_index, shard_counter, output_file))
-    sys.stdout.flush()
-    shard_counter = 0
-  print('%s [thread %d]: Wrote %d images to %d shards.' %
-        (datetime.now(), thread_index, counter, num_files_in_thread))
-  sys.stdout.flush()
+  try:
+    image_buffer, height, width = _process_image(filename, coder)
+  except Exception as e:
+    print(e)
+    print('SKIPPED: Unexpected error while decoding %s.' % filename)
+    return None
+
+  return _convert_to_example(filename, image_buffer, label,
+                             text, height, width)
 
 
 def _process_image_files(name, filenames, texts, labels, num_shards):
@@ -301,35 +235,14 @@ def _process_image_files(name, filenames, texts, labels, num_shards):
   assert len(filenames) == len(texts)
   assert len(filenames) == len(labels)
 
-  # Break all images into batches with a [ranges[i][0], ranges[i][1]].
-  spacing = np.linspace(0, len(filenames), FLAGS.num_threads + 1).astype(np.int)
-  ranges = []
-  for i in range(len(spacing) - 1):
-    ranges.append([spacing[i], spacing[i + 1]])
-
-  # Launch a thread for each batch.
-  print('Launching %d threads for spacings: %s' % (FLAGS.num_threads, ranges))
-  sys.stdout.flush()
-
-  # Create a mechanism for monitoring when all threads are finished.
-  coord = tf.train.Coordinator()
-
-  # Create a generic TensorFlow-based utility for converting all image codings.
-  coder = ImageCoder()
-
-  threads = []
-  for thread_index in range(len(ranges)):
-    args = (coder, thread_index, ranges, name, filenames,
-            texts, labels, num_shards)
-    t = threading.Thread(target=_process_image_files_batch, args=args)
-    t.start()
-    threads.append(t)
-
-  # Wait for all the threads to terminate.
-  coord.join(threads)
-  print('%s: Finished writing all %d images in data set.' %
-        (datetime.now(), len(filenames)))
-  sys.stdout.flush()
+  items = list(zip(filenames, texts, labels))
+  if FLAGS.dry_run and FLAGS.dry_run_images:
+    items = items[:FLAGS.dry_run_images]
+  image_conversion.convert_to_shards(
+      name, items, _convert_image, num_shards, FLAGS.output_directory,
+      num_processes=FLAGS.num_threads,
+      coder_class=image_conversion.IMAGE_CODERS[FLAGS.image_coder],
+      resume=FLAGS.resume, dry_run=FLAGS.dry_run)
 
 
 def _find_image_files(data_dir, labels_file):
@@ -417,11 +330,6 @@ def _process_dataset(name, directory, num_shards, labels_file):
 
 
 def main(unused_argv):
-  assert not FLAGS.train_shards % FLAGS.num_threads, (
-      'Please make the FLAGS.num_threads commensurate with FLAGS.train_shards')
-  assert not FLAGS.validation_shards % FLAGS.num_threads, (
-      'Please make the FLAGS.num_threads commensurate with '
-      'FLAGS.validation_shards')
   print('Saving results to %s' % FLAGS.output_directory)
 
   # Run it!
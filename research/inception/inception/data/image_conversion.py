@@ -0,0 +1,265 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Converts images into sharded TFRecord files with a pool of processes.
+
+Each worker process owns its own image coder, so decoding and re-encoding
+images is not serialized by the GIL or by a shared TensorFlow session. A
+worker writes whole shards: a shard is first written to a temporary file
+and renamed once complete, so that an interrupted conversion can be resumed
+by skipping the shards that already exist.
+
+The scripts using this module supply a function that converts one image
+into a tf.train.Example, e.g.
+
+  def _convert_image(coder, filename, label):
+    image_buffer, height, width = _process_image(filename, coder)
+    return _convert_to_example(filename, image_buffer, label, height, width)
+
+  image_conversion.convert_to_shards(
+      'train', zip(filenames, labels), _convert_image, num_shards=1024,
+      output_directory='/tmp/', num_processes=16)
+
+Image coders are classes providing png_to_jpeg(), cmyk_to_rgb() and
+rgb_jpeg_and_size(); see IMAGE_CODERS for the available ones. All coders
+produce the same image buffers for RGB JPEG input, and buffers with the same
+dimensions and nearly the same pixels otherwise.
+
+Identical copies of this module are used by slim/datasets/build_imagenet_data.py
+and inception/inception/data/build_image_data.py. slim and inception are
+separate Bazel workspaces that are installed and run independently, so
+neither can import the other's copy; changes must be made to both.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from datetime import datetime
+import io
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+
+class TFImageCoder(object):
+  """Image coder built on TensorFlow ops.
+
+  Every image is fully decoded, which validates it. Each coder runs its own
+  single-threaded session, since the parallelism comes from running one coder
+  per process.
+  """
+
+  def __init__(self):
+    graph = tf.Graph()
+    with graph.as_default():
+      # Initializes function that converts PNG to JPEG data.
+      self._png_data = tf.placeholder(dtype=tf.string)
+      image = tf.image.decode_png(self._png_data, channels=3)
+      self._png_to_jpeg = tf.image.encode_jpeg(image, format='rgb',
+                                               quality=100)
+
+      # Initializes function that converts CMYK JPEG data to RGB JPEG data.
+      self._cmyk_data = tf.placeholder(dtype=tf.string)
+      image = tf.image.decode_jpeg(self._cmyk_data, channels=0)
+      self._cmyk_to_rgb = tf.image.encode_jpeg(image, format='rgb',
+                                               quality=100)
+
+      # Initializes functions that decode JPEG data, and that re-encode JPEG
+      # data in other color spaces, e.g. grayscale, as RGB.
+      self._jpeg_data = tf.placeholder(dtype=tf.string)
+      self._decode_jpeg = tf.image.decode_jpeg(self._jpeg_data, channels=0)
+      image = tf.image.decode_jpeg(self._jpeg_data, channels=3)
+      self._jpeg_to_rgb = tf.image.encode_jpeg(image, format='rgb',
+                                               quality=100)
+
+    config = tf.ConfigProto(intra_op_parallelism_threads=1,
+                            inter_op_parallelism_threads=1)
+    self._sess = tf.Session(graph=graph, config=config)
+
+  def png_to_jpeg(self, image_data):
+    return self._sess.run(self._png_to_jpeg,
+                          feed_dict={self._png_data: image_data})
+
+  def cmyk_to_rgb(self, image_data):
+    return self._sess.run(self._cmyk_to_rgb,
+                          feed_dict={self._cmyk_data: image_data})
+
+  def rgb_jpeg_and_size(self, image_data):
+    """Returns RGB JPEG data of a JPEG image, and its height and width."""
+    image = self._sess.run(self._decode_jpeg,
+                           feed_dict={self._jpeg_data: image_data})
+    assert len(image.shape) == 3
+    if image.shape[2] != 3:
+      image_data = self._sess.run(self._jpeg_to_rgb,
+                                  feed_dict={self._jpeg_data: image_data})
+    return image_data, image.shape[0], image.shape[1]
+
+
+class PILImageCoder(object):
+  """Image coder built on Pillow.
+
+  rgb_jpeg_and_size() reads the dimensions of RGB JPEG data from its header
+  without decoding the pixels, which is much faster than TFImageCoder but does
+  not detect corrupt image data. PNG images and JPEG images in other color
+  spaces are decoded and re-encoded as RGB JPEG at quality 100.
+  """
+
+  def __init__(self):
+    from PIL import Image  # pylint: disable=g-import-not-at-top
+    self._image = Image
+
+  def _to_rgb_jpeg(self, image_data):
+    image = self._image.open(io.BytesIO(image_data)).convert('RGB')
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=100)
+    return output.getvalue()
+
+  def png_to_jpeg(self, image_data):
+    return self._to_rgb_jpeg(image_data)
+
+  def cmyk_to_rgb(self, image_data):
+    return self._to_rgb_jpeg(image_data)
+
+  def rgb_jpeg_and_size(self, image_data):
+    """Returns RGB JPEG data of a JPEG image, and its height and width."""
+    image = self._image.open(io.BytesIO(image_data))
+    assert image.format == 'JPEG', 'Not a JPEG image: %s' % image.format
+    if image.mode != 'RGB':
+      image_data = self._to_rgb_jpeg(image_data)
+    width, height = image.size
+    return image_data, height, width
+
+
+# Image coders by name. Other coders can be registered here.
+IMAGE_CODERS = {
+    'tensorflow': TFImageCoder,
+    'pil': PILImageCoder,
+}
+
+# Coder and conversion function of a worker process, set by _init_worker.
+_coder = None
+_convert_fn = None
+
+
+def _init_worker(coder_class, convert_fn):
+  global _coder, _convert_fn
+  _coder = coder_class()
+  _convert_fn = convert_fn
+
+
+def _temp_filename(output_file):
+  # The prefix keeps partial shards out of '<name>-*' file patterns.
+  return os.path.join(os.path.dirname(output_file),
+                      '_tmp_' + os.path.basename(output_file))
+
+
+def _write_shard(task):
+  """Converts the items of one shard and writes them, in a worker process.
+
+  Args:
+    task: tuple (output_file, items, dry_run). If dry_run is True, the
+      examples are built but not written.
+
+  Returns:
+    Tuple (output_file, number of examples, total size of the serialized
+    examples in bytes).
+  """
+  output_file, items, dry_run = task
+  writer = None
+  if not dry_run:
+    writer = tf.python_io.TFRecordWriter(_temp_filename(output_file))
+  num_examples = 0
+  num_bytes = 0
+  for item in items:
+    example = _convert_fn(_coder, *item)
+    if example is None:
+      continue
+    serialized = example.SerializeToString()
+    num_examples += 1
+    num_bytes += len(serialized)
+    if writer:
+      writer.write(serialized)
+  if writer:
+    writer.close()
+    tf.gfile.Rename(_temp_filename(output_file), output_file, overwrite=True)
+  return output_file, num_examples, num_bytes
+
+
+def convert_to_shards(name, items, convert_fn, num_shards, output_directory,
+                      num_processes, coder_class=TFImageCoder, resume=True,
+                      dry_run=False):
+  """Converts images into TFRecord shards of Example protos.
+
+  Shard s, named e.g. 'train-00002-of-00010', holds the examples of items
+  [s * len(items) / num_shards, (s + 1) * len(items) / num_shards), in order.
+
+  Args:
+    name: string, unique identifier specifying the data set.
+    items: list of tuples; each tuple holds the arguments after the coder of
+      convert_fn for one image.
+    convert_fn: function convert_fn(coder, *item) returning the Example proto
+      of an item, or None to skip the item. It is run in the worker processes,
+      so it must be defined at the top level of a module.
+    num_shards: integer number of shards for this data set.
+    output_directory: string, directory in which to write the shards.
+    num_processes: integer number of worker processes.
+    coder_class: class of the image coder passed to convert_fn, e.g. one of
+      IMAGE_CODERS.
+    resume: boolean, whether to skip the shards that already exist.
+    dry_run: boolean, if True, the examples are built but not written, and
+      only the conversion throughput is reported.
+  """
+  items = list(items)
+  spacing = np.linspace(0, len(items), num_shards + 1).astype(int)
+  tasks = []
+  for shard in range(num_shards):
+    output_filename = '%s-%.5d-of-%.5d' % (name, shard, num_shards)
+    output_file = os.path.join(output_directory, output_filename)
+    if resume and not dry_run and tf.gfile.Exists(output_file):
+      continue
+    tasks.append((output_file, items[spacing[shard]:spacing[shard + 1]],
+                  dry_run))
+  num_items = sum(len(task[1]) for task in tasks)
+  print('%s: Converting %d images into %d of %d %s shards with %d processes.' %
+        (datetime.now(), num_items, len(tasks), num_shards, name,
+         num_processes))
+  sys.stdout.flush()
+
+  pool = multiprocessing.Pool(num_processes, initializer=_init_worker,
+                              initargs=(coder_class, convert_fn))
+  start_time = time.time()
+  counter = 0
+  total_bytes = 0
+  for i, (output_file, num_examples, num_bytes) in enumerate(
+      pool.imap_unordered(_write_shard, tasks)):
+    counter += num_examples
+    total_bytes += num_bytes
+    elapsed = time.time() - start_time
+    print('%s: %s %d images %s %s (%d of %d shards, %.1f images/sec).' %
+          (datetime.now(), 'Converted' if dry_run else 'Wrote', num_examples,
+           'of' if dry_run else 'to', output_file, i + 1, len(tasks),
+           counter / elapsed))
+    sys.stdout.flush()
+  pool.close()
+  pool.join()
+
+  elapsed = max(time.time() - start_time, 1e-6)
+  print('%s: Finished converting %d images in %.1f sec: %.1f images/sec, '
+        '%.1f MB/sec.' % (datetime.now(), counter, elapsed, counter / elapsed,
+                          total_bytes / elapsed / 2**20))
+  sys.stdout.flush()
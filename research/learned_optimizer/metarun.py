@@ -229,11 +229,44 @@ def register_optimizers():
   return opts
 
 
+def create_optimizer_spec():
+  """Returns the Spec of the optimizer selected by the flags."""
+  # get the optimizer class and arguments
+  optimizer_cls = register_optimizers()[FLAGS.optimizer]
+
+  assert len(HRNN_CELL_SIZES) in [1, 2, 3]
+  optimizer_args = (HRNN_CELL_SIZES,)
+
+  optimizer_kwargs = {
+      "init_lr_range": (FLAGS.min_lr, FLAGS.max_lr),
+      "learnable_decay": FLAGS.learnable_decay,
+      "dynamic_output_scale": FLAGS.dynamic_output_scale,
+      "cell_cls": getattr(tf.contrib.rnn, FLAGS.cell_cls),
+      "use_attention": FLAGS.use_attention,
+      "use_log_objective": FLAGS.use_log_objective,
+      "num_gradient_scales": FLAGS.num_gradient_scales,
+      "zero_init_lr_weights": FLAGS.zero_init_lr_weights,
+      "use_log_means_squared": FLAGS.use_log_means_squared,
+      "use_relative_lr": FLAGS.use_relative_lr,
+      "use_extreme_indicator": FLAGS.use_extreme_indicator,
+      "max_log_lr": FLAGS.max_log_lr,
+      "obj_train_max_multiplier": FLAGS.objective_training_max_multiplier,
+      "use_problem_lr_mean": FLAGS.use_problem_lr_mean,
+      "use_gradient_shortcut": FLAGS.use_gradient_shortcut,
+      "use_second_derivatives": FLAGS.use_second_derivatives,
+      "use_lr_shortcut": FLAGS.use_lr_shortcut,
+      "use_grad_products": FLAGS.use_grad_products,
+      "use_multiple_scale_decays": FLAGS.use_multiple_scale_decays,
+      "use_numerator_epsilon": FLAGS.use_numerator_epsilon,
+      "learnable_inp_decay": FLAGS.learnable_inp_decay,
+      "learnable_rnn_init": FLAGS.learnable_rnn_init,
+  }
+  return problem_spec.Spec(optimizer_cls, optimizer_args, optimizer_kwargs)
+
+
 def main(unused_argv):
   """Runs the main script."""
 
-  opts = register_optimizers()
-
   # Choose a set of problems to optimize. By default this includes quadratics,
   # 2-dimensional bowls, 2-class softmax problems, and non-noisy optimization
   # test problems (e.g. Rosenbrock, Beale)
@@ -324,38 +357,7 @@ def main(unused_argv):
                                              FLAGS.cell_size,
                                              FLAGS.num_cells))
 
-  # get the optimizer class and arguments
-  optimizer_cls = opts[FLAGS.optimizer]
-
-  assert len(HRNN_CELL_SIZES) in [1, 2, 3]
-  optimizer_args = (HRNN_CELL_SIZES,)
-
-  optimizer_kwargs = {
-      "init_lr_range": (FLAGS.min_lr, FLAGS.max_lr),
-      "learnable_decay": FLAGS.learnable_decay,
-      "dynamic_output_scale": FLAGS.dynamic_output_scale,
-      "cell_cls": getattr(tf.contrib.rnn, FLAGS.cell_cls),
-      "use_attention": FLAGS.use_attention,
-      "use_log_objective": FLAGS.use_log_objective,
-      "num_gradient_scales": FLAGS.num_gradient_scales,
-      "zero_init_lr_weights": FLAGS.zero_init_lr_weights,
-      "use_log_means_squared": FLAGS.use_log_means_squared,
-      "use_relative_lr": FLAGS.use_relative_lr,
-      "use_extreme_indicator": FLAGS.use_extreme_indicator,
-      "max_log_lr": FLAGS.max_log_lr,
-      "obj_train_max_multiplier": FLAGS.objective_training_max_multiplier,
-      "use_problem_lr_mean": FLAGS.use_problem_lr_mean,
-      "use_gradient_shortcut": FLAGS.use_gradient_shortcut,
-      "use_second_derivatives": FLAGS.use_second_derivatives,
-      "use_lr_shortcut": FLAGS.use_lr_shortcut,
-      "use_grad_products": FLAGS.use_grad_products,
-      "use_multiple_scale_decays": FLAGS.use_multiple_scale_decays,
-      "use_numerator_epsilon": FLAGS.use_numerator_epsilon,
-      "learnable_inp_decay": FLAGS.learnable_inp_decay,
-      "learnable_rnn_init": FLAGS.learnable_rnn_init,
-  }
-  optimizer_spec = problem_spec.Spec(
-      optimizer_cls, optimizer_args, optimizer_kwargs)
+  optimizer_spec = create_optimizer_spec()
 
   # make log directory
   tf.gfile.MakeDirs(logdir)
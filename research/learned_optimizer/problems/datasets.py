@@ -20,6 +20,7 @@ from __future__ import division
 from __future__ import print_function
 
 from collections import namedtuple
+import os
 
 import numpy as np
 from sklearn.datasets import make_classification
@@ -214,5 +215,30 @@ def random_mlp(n_features, n_samples, random_seed=None, n_layers=6, width=20):
   return Dataset(x.astype("float32"), y.astype("int32"))
 
 
+def save(dataset, filename):
+  """Writes a dataset to a .npz file, which can be read back with load().
+
+  Args:
+    dataset: A Dataset namedtuple
+    filename: path of the file to write
+  """
+  with open(filename + ".tmp", "wb") as f:
+    np.savez(f, data=dataset.data, labels=dataset.labels)
+  os.rename(filename + ".tmp", filename)
+
+
+def load(filename):
+  """Reads a dataset written by save().
+
+  Args:
+    filename: path of the .npz file
+
+  Returns:
+    dataset: A Dataset namedtuple containing the data and labels
+  """
+  with np.load(filename) as arrays:
+    return Dataset(arrays["data"], arrays["labels"])
+
+
 EMPTY_DATASET = Dataset(np.array([], dtype="float32"),
                         np.array([], dtype="int32"))
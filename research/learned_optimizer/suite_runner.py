@@ -0,0 +1,368 @@
+# Copyright 2017 Google, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Evaluates an optimizer on whole problem sets, on CPU worker processes.
+
+Each worker process runs entire problem sets (the problems returned by one
+function of problem_sets). All the problems of a set share one graph and one
+session: the optimizer is built and its checkpoint restored once, then each
+problem adds its parameters and train op to the graph and is run to the end,
+one problem after the other.
+
+The problems of each set, with their datasets, are written to
+--dataset_cache_dir by the first run and read back by the later ones, which
+then skip generating the datasets and all see the same data (some problem
+sets draw their datasets without a seed). The cache of a set is keyed by the
+source code of its problem_sets function and of the datasets module, so that
+editing them invalidates it.
+
+The report has one line per problem, with its objective values, how fast it
+converged and how long it took to build and to run. The optimizer is selected
+with the flags of metarun.py, e.g.
+
+python suite_runner.py --optimizer=HierarchicalRNN \
+  --checkpoint_dir=/tmp/lol/HierarchicalRNN_GRUCell_20_2 \
+  --dataset_cache_dir=/tmp/lol/datasets --report_file=/tmp/lol/report.tsv
+"""
+
+from __future__ import print_function
+
+import hashlib
+import inspect
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from six.moves import cPickle as pickle
+import tensorflow as tf
+
+import metarun
+from learned_optimizer.optimizer import trainable_optimizer
+from learned_optimizer.problems import datasets
+from learned_optimizer.problems import problem_sets
+
+tf.app.flags.DEFINE_string("problem_sets",
+                           "quadratic_problems_noisy,"
+                           "quadratic_problems_large,"
+                           "bowl_problems,"
+                           "bowl_problems_noisy,"
+                           "softmax_2_class_problems,"
+                           "softmax_2_class_problems_noisy,"
+                           "optimization_test_problems,"
+                           "optimization_test_problems_noisy,"
+                           "fully_connected_random_2_class_problems,"
+                           "matmul_problems,"
+                           "log_objective_problems,"
+                           "rescale_problems,"
+                           "norm_problems,"
+                           "norm_problems_noisy,"
+                           "sum_problems,"
+                           "sum_problems_noisy,"
+                           "sparse_gradient_problems,"
+                           "sparse_gradient_problems_mlp",
+                           """Comma separated names of the problem_sets
+                              functions to evaluate. The default is the
+                              training set of metarun.py.""")
+tf.app.flags.DEFINE_string("checkpoint_dir", "",
+                           """Directory of the optimizer checkpoints. If empty,
+                              the optimizer parameters are initialized.""")
+tf.app.flags.DEFINE_integer("num_iterations", 1000,
+                            """Number of optimizer steps on each problem.""")
+tf.app.flags.DEFINE_integer("num_workers", multiprocessing.cpu_count(),
+                            """Number of worker processes.""")
+tf.app.flags.DEFINE_integer("num_threads_per_worker", 1,
+                            """Number of TensorFlow threads of each worker.""")
+tf.app.flags.DEFINE_string("dataset_cache_dir", "",
+                           """Directory caching the problem sets and their
+                              datasets, keyed by their source code. If empty,
+                              the datasets are generated by every run.""")
+tf.app.flags.DEFINE_string("report_file", "",
+                           """File where to write the report. If empty, the
+                              report is only printed.""")
+
+FLAGS = tf.app.flags.FLAGS
+
+REPORT_COLUMNS = ("problem_set", "index", "problem", "num_params",
+                  "initial_objective", "final_objective", "best_objective",
+                  "iters_to_90pct", "diverged", "build_secs", "run_secs",
+                  "ms_per_iter")
+
+
+def _problem_set_cache_dir(name):
+  """Returns the cache directory of a set, named after its source code.
+
+  The directory name holds a hash of the source of the problem set function
+  and of the datasets module, so editing either makes the set regenerated
+  instead of read from a stale cache.
+  """
+  source = inspect.getsource(getattr(problem_sets, name))
+  source += inspect.getsource(datasets)
+  digest = hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+  return os.path.join(FLAGS.dataset_cache_dir, "{}-{}".format(name, digest))
+
+
+def _get_problem_set(name):
+  """Returns the problems of a set, with their datasets cached on disk.
+
+  A cached set is read back without calling its problem_sets function, so its
+  datasets are not generated again. The cache holds a pickle of the problem
+  specs and batch sizes, and one .npz file per dataset.
+  """
+  if not FLAGS.dataset_cache_dir:
+    return getattr(problem_sets, name)()
+
+  cache_dir = _problem_set_cache_dir(name)
+  problems_file = os.path.join(cache_dir, "problems.pkl")
+  if os.path.exists(problems_file):
+    with open(problems_file, "rb") as f:
+      problems = pickle.load(f)
+    return [(spec,
+             datasets.load(os.path.join(cache_dir, "{:02d}.npz".format(index)))
+             if has_dataset else None,
+             batch_size)
+            for index, (spec, has_dataset, batch_size) in enumerate(problems)]
+
+  problems_and_data = getattr(problem_sets, name)()
+  tf.gfile.MakeDirs(cache_dir)
+  for index, (_, dataset, _) in enumerate(problems_and_data):
+    if dataset is not None:
+      datasets.save(dataset,
+                    os.path.join(cache_dir, "{:02d}.npz".format(index)))
+  # The problems file is written last, so that it marks a complete cache.
+  with open(problems_file + ".tmp", "wb") as f:
+    pickle.dump([(spec, dataset is not None, batch_size)
+                 for spec, dataset, batch_size in problems_and_data], f,
+                protocol=pickle.HIGHEST_PROTOCOL)
+  os.rename(problems_file + ".tmp", problems_file)
+  return problems_and_data
+
+
+def _optimizer_variables(variables):
+  return [v for v in variables
+          if v.op.name.startswith(trainable_optimizer.OPTIMIZER_SCOPE + "/")]
+
+
+def _convergence(objective_values):
+  """Summarizes the objective values of a run.
+
+  Args:
+    objective_values: the objective value of each iteration
+
+  Returns:
+    A dict with the initial, final and best objective values, the number of
+    iterations until the objective first covered 90% of its decrease to the
+    best value, and whether the objective became non-finite.
+  """
+  values = np.asarray(objective_values, dtype=np.float64)
+  finite = np.isfinite(values)
+  best = np.min(values[finite]) if np.any(finite) else np.nan
+  target = values[0] - 0.9 * (values[0] - best)
+  reached = np.flatnonzero(values <= target)
+  return {
+      "initial_objective": values[0],
+      "final_objective": values[-1],
+      "best_objective": best,
+      "iters_to_90pct": reached[0] if len(reached) else -1,
+      "diverged": not np.all(finite),
+  }
+
+
+class _ProblemSetRunner(object):
+  """Runs the problems of a set in a single graph and session.
+
+  The optimizer is built once, and its variables are restored (or initialized)
+  as soon as they are created, which for the RNN optimizers is when they are
+  first applied to a problem. The other variables are initialized again before
+  each problem: the optimizers reuse some of them, e.g. the global state of
+  HierarchicalRNN, across the problems of a graph.
+  """
+
+  def __init__(self, optimizer_spec, checkpoint):
+    self._graph = tf.Graph()
+    with self._graph.as_default():
+      self._optimizer = optimizer_spec.build()
+    config = tf.ConfigProto(
+        device_count={"GPU": 0},
+        intra_op_parallelism_threads=FLAGS.num_threads_per_worker,
+        inter_op_parallelism_threads=FLAGS.num_threads_per_worker)
+    self._sess = tf.Session(graph=self._graph, config=config)
+    self._checkpoint = checkpoint
+    self._ready_optimizer_vars = set()
+    self._done_vars = set()
+
+  def close(self):
+    self._sess.close()
+
+  def _prepare_optimizer_variables(self):
+    """Restores or initializes the optimizer variables created so far."""
+    new_vars = [v for v in _optimizer_variables(tf.global_variables())
+                if v not in self._ready_optimizer_vars]
+    if not new_vars:
+      return
+    if self._checkpoint:
+      tf.train.Saver(var_list=new_vars).restore(self._sess, self._checkpoint)
+    else:
+      self._sess.run(tf.variables_initializer(new_vars))
+    self._ready_optimizer_vars.update(new_vars)
+
+  def run(self, spec, dataset, batch_size, num_iter):
+    """Runs the optimizer on one problem, as metaopt.test_optimizer does.
+
+    Args:
+      spec: the Spec of the problem
+      dataset: the dataset to train the problem against, or None
+      batch_size: the number of samples per batch, or None for full batches
+      num_iter: the number of iterations of the optimizer to run
+
+    Returns:
+      objective_values: the objective value of each iteration
+      num_params: the number of parameters of the problem
+      build_secs: the time to build and initialize the problem
+      run_secs: the time of the iterations
+    """
+    start_time = time.time()
+    if dataset is None:
+      dataset = datasets.EMPTY_DATASET
+      batch_size = dataset.size
+    else:
+      batch_size = dataset.size if batch_size is None else batch_size
+
+    with self._graph.as_default():
+      problem = spec.build()
+      params = problem.init_variables()
+      data_placeholder = tf.placeholder(tf.float32)
+      labels_placeholder = tf.placeholder(tf.int32)
+      obj = problem.objective(params, data_placeholder, labels_placeholder)
+      gradients = problem.gradients(obj, params)
+
+      # initialize the parameters first; necessary for apply_gradients
+      self._sess.run(tf.variables_initializer(params))
+      train_op = self._optimizer.apply_gradients(zip(gradients, params))
+      if isinstance(train_op, (tuple, list)):
+        # LOL apply_gradients returns a tuple. Regular optimizers do not.
+        train_op, real_params = train_op
+        obj = problem.objective(real_params, data_placeholder,
+                                labels_placeholder)
+
+      self._prepare_optimizer_variables()
+      vars_to_initialize = [
+          v for v in tf.global_variables()
+          if v not in self._done_vars and v not in self._ready_optimizer_vars]
+      self._sess.run(tf.variables_initializer(vars_to_initialize))
+      problem.init_fn(self._sess)
+      self._done_vars.update(params)
+      self._done_vars.update(
+          self._optimizer.get_slot(p, name) for p in params
+          for name in self._optimizer.get_slot_names()
+          if self._optimizer.get_slot(p, name) is not None)
+
+    num_params = sum(np.prod(p.get_shape().as_list()) for p in params)
+    batch_inds = dataset.batch_indices(num_iter, batch_size)
+    build_time = time.time()
+
+    objective_values = []
+    for batch in batch_inds:
+      feed = {data_placeholder: dataset.data[batch],
+              labels_placeholder: dataset.labels[batch]}
+      objective_values.append(self._sess.run([train_op, obj],
+                                             feed_dict=feed)[1])
+
+    return (objective_values, num_params, build_time - start_time,
+            time.time() - build_time)
+
+
+def _run_problem_set(name):
+  """Runs all the problems of a set, in a worker process.
+
+  Args:
+    name: name of the problem_sets function
+
+  Returns:
+    The name, the seconds to build the optimizer and the report rows of the
+    problems of the set.
+  """
+  start_time = time.time()
+  checkpoint = (tf.train.latest_checkpoint(FLAGS.checkpoint_dir)
+                if FLAGS.checkpoint_dir else None)
+  runner = _ProblemSetRunner(metarun.create_optimizer_spec(), checkpoint)
+  setup_secs = time.time() - start_time
+
+  rows = []
+  try:
+    for index, (spec, dataset, batch_size) in enumerate(
+        _get_problem_set(name)):
+      objective_values, num_params, build_secs, run_secs = runner.run(
+          spec, dataset, batch_size, FLAGS.num_iterations)
+      row = {
+          "problem_set": name,
+          "index": index,
+          "problem": spec.callable.__name__,
+          "num_params": num_params,
+          "build_secs": build_secs,
+          "run_secs": run_secs,
+          "ms_per_iter": 1000. * run_secs / max(len(objective_values), 1),
+      }
+      row.update(_convergence(objective_values))
+      rows.append(row)
+  finally:
+    runner.close()
+  return name, setup_secs, rows
+
+
+def _format_row(row):
+  return "\t".join(
+      "{:.6g}".format(row[column]) if isinstance(row[column], float)
+      else str(row[column]) for column in REPORT_COLUMNS)
+
+
+def main(unused_argv):
+  """Runs the problem sets and writes the report."""
+  names = [name for name in FLAGS.problem_sets.split(",") if name]
+  for name in names:
+    if not hasattr(problem_sets, name):
+      raise ValueError("Unknown problem set: {}".format(name))
+  if FLAGS.dataset_cache_dir:
+    tf.gfile.MakeDirs(FLAGS.dataset_cache_dir)
+
+  start_time = time.time()
+  rows_by_name = {}
+  pool = multiprocessing.Pool(min(FLAGS.num_workers, len(names)))
+  for name, setup_secs, rows in pool.imap_unordered(_run_problem_set, names):
+    rows_by_name[name] = rows
+    print("{}: {} problems in {:.1f} sec ({:.1f} sec optimizer setup), "
+          "{}/{} sets done".format(
+              name, len(rows),
+              setup_secs + sum(r["build_secs"] + r["run_secs"] for r in rows),
+              setup_secs, len(rows_by_name), len(names)))
+  pool.close()
+  pool.join()
+
+  report = "\n".join(
+      ["\t".join(REPORT_COLUMNS)] +
+      [_format_row(row) for name in names for row in rows_by_name[name]])
+  print(report)
+  print("Evaluated {} problems in {:.1f} sec".format(
+      sum(len(rows) for rows in rows_by_name.values()),
+      time.time() - start_time))
+  if FLAGS.report_file:
+    with tf.gfile.Open(FLAGS.report_file, "w") as f:
+      f.write(report + "\n")
+
+  return 0
+
+
+if __name__ == "__main__":
+  tf.app.run()
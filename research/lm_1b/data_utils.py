@@ -15,6 +15,7 @@
 
 """A library for loading 1B word benchmark dataset."""
 
+import collections
 import random
 
 import numpy as np
@@ -93,9 +94,22 @@ class Vocabulary(object):
 class CharsVocabulary(Vocabulary):
   """Vocabulary containing character-level information."""
 
-  def __init__(self, filename, max_word_length):
+  def __init__(self, filename, max_word_length, max_oov_cache_size=100000):
+    """Initialize vocabulary.
+
+    Args:
+      filename: Vocabulary file name.
+      max_word_length: Number of char ids of each word.
+      max_oov_cache_size: Number of out of vocabulary words whose char ids
+        are kept in a LRU cache.
+    """
     super(CharsVocabulary, self).__init__(filename)
     self._max_word_length = max_word_length
+    self._max_oov_cache_size = max_oov_cache_size
+    self._oov_char_ids = collections.OrderedDict()
+    self._num_vocab_words = 0
+    self._num_oov_hits = 0
+    self._num_oov_misses = 0
     chars_set = set()
 
     for word in self._id_to_word:
@@ -149,16 +163,91 @@ class CharsVocabulary(Vocabulary):
       code[j] = ord(cur_word[j])
     return code
 
+  def _oov_word_to_char_ids(self, word):
+    """Returns the char ids of an out of vocabulary word, from the cache."""
+    code = self._oov_char_ids.pop(word, None)
+    if code is None:
+      self._num_oov_misses += 1
+      code = self._convert_word_to_char_ids(word)
+      code.flags.writeable = False
+      if self._max_oov_cache_size <= 0:
+        return code
+      if len(self._oov_char_ids) >= self._max_oov_cache_size:
+        self._oov_char_ids.popitem(last=False)
+    else:
+      self._num_oov_hits += 1
+    self._oov_char_ids[word] = code
+    return code
+
   def word_to_char_ids(self, word):
     if word in self._word_to_id:
+      self._num_vocab_words += 1
       return self._word_char_ids[self._word_to_id[word]]
     else:
-      return self._convert_word_to_char_ids(word)
+      return self._oov_word_to_char_ids(word)
 
   def encode_chars(self, sentence):
-    chars_ids = [self.word_to_char_ids(cur_word)
-                 for cur_word in sentence.split()]
-    return np.vstack([self.bos_chars] + chars_ids + [self.eos_chars])
+    return self.encode_chars_batch([sentence])[0]
+
+  def encode_chars_flat(self, sentences):
+    """Convert sentences to the char ids of their words, in a single array.
+
+    Args:
+      sentences: list of sentences.
+
+    Returns:
+      char_ids: [num_words, max_word_length] array with the char ids of all
+        the words of the sentences, each sentence with <S> and </S> added.
+      offsets: array of len(sentences) + 1 offsets of the sentences in
+        char_ids.
+    """
+    sentence_words = [sentence.split() for sentence in sentences]
+    offsets = np.zeros([len(sentences) + 1], np.int64)
+    offsets[1:] = np.cumsum([len(words) + 2 for words in sentence_words])
+    char_ids = np.empty([offsets[-1], self.max_word_length], np.int32)
+    char_ids[offsets[:-1]] = self.bos_chars
+    char_ids[offsets[1:] - 1] = self.eos_chars
+
+    # Gather the char ids of the words in the vocabulary all at once.
+    words = [word for words in sentence_words for word in words]
+    rows = np.delete(np.arange(offsets[-1]),
+                     np.concatenate([offsets[:-1], offsets[1:] - 1]))
+    word_ids = np.array([self._word_to_id.get(word, -1) for word in words],
+                        dtype=np.int64)
+    in_vocab = word_ids >= 0
+    char_ids[rows[in_vocab]] = self._word_char_ids[word_ids[in_vocab]]
+    self._num_vocab_words += np.sum(in_vocab)
+    for row, word_id, word in zip(rows, word_ids, words):
+      if word_id < 0:
+        char_ids[row] = self._oov_word_to_char_ids(word)
+    return char_ids, offsets
+
+  def encode_chars_batch(self, sentences):
+    """Convert sentences to char ids as encode_chars, into a single buffer.
+
+    Returns:
+      list of [num_words + 2, max_word_length] arrays, which are views of the
+      same buffer.
+    """
+    if not sentences:
+      return []
+    char_ids, offsets = self.encode_chars_flat(sentences)
+    return np.split(char_ids, offsets[1:-1])
+
+  @property
+  def oov_cache_stats(self):
+    """Counts of the char id lookups since the vocabulary was loaded.
+
+    Returns:
+      dict with the number of words found in the vocabulary, of out of
+      vocabulary words found and not found in the cache, and the hit rate
+      of the cache.
+    """
+    num_oov = self._num_oov_hits + self._num_oov_misses
+    return {'vocab_words': int(self._num_vocab_words),
+            'oov_hits': self._num_oov_hits,
+            'oov_misses': self._num_oov_misses,
+            'oov_hit_rate': self._num_oov_hits / float(max(num_oov, 1))}
 
 
 def get_batch(generator, batch_size, num_steps, max_word_length, pad=False):
@@ -214,6 +303,154 @@ def get_batch(generator, batch_size, num_steps, max_word_length, pad=False):
     yield inputs, char_inputs, global_word_ids, targets, weights
 
 
+# Below this number of chunks of a shard in a batch, copying the chunks one by
+# one is faster than gathering them.
+_MIN_CHUNKS_TO_GATHER = 4
+
+
+def _get_binary_batch(sentences, batch_size, num_steps, max_word_length,
+                      pad=False):
+  """Read batches of input from binary shards.
+
+  Yields the same batches as get_batch() would for the same sentences, but
+  the sentences are given as (shard, sentence index) pairs of BinaryShards.
+  Only the position in each stream is tracked in Python, the batch is then
+  filled with one gather from each shard.
+  """
+  # Each stream is [shard, sentence index, position, end of the sentence].
+  cur_stream = [None] * batch_size
+
+  inputs = np.zeros([batch_size, num_steps], np.int32)
+  char_inputs = np.zeros([batch_size, num_steps, max_word_length], np.int32)
+  global_word_ids = np.zeros([batch_size, num_steps], np.int32)
+  targets = np.zeros([batch_size, num_steps], np.int32)
+  weights = np.ones([batch_size, num_steps], np.float32)
+
+  no_more_data = False
+  while True:
+    inputs[:] = 0
+    char_inputs[:] = 0
+    global_word_ids[:] = 0
+    targets[:] = 0
+    weights[:] = 0.0
+
+    # The (row, column, position, sentence index, length) of the chunks of
+    # each shard.
+    chunks = {}
+    for i in range(batch_size):
+      cur_pos = 0
+
+      while cur_pos < num_steps:
+        if cur_stream[i] is None or cur_stream[i][3] - cur_stream[i][2] <= 1:
+          try:
+            shard, index = next(sentences)
+          except StopIteration:
+            # No more data, exhaust current streams and quit
+            no_more_data = True
+            break
+          cur_stream[i] = [shard, index, shard.sentence_starts[index],
+                           shard.sentence_starts[index + 1]]
+
+        shard, index, position, end = cur_stream[i]
+        how_many = min(end - position - 1, num_steps - cur_pos)
+        chunks.setdefault(shard, []).append(
+            (i, cur_pos, position, index, how_many))
+
+        cur_pos += how_many
+        cur_stream[i][2] = position + how_many
+
+        if pad:
+          break
+
+    for shard, shard_chunks in chunks.items():
+      if len(shard_chunks) < _MIN_CHUNKS_TO_GATHER:
+        for i, cur_pos, position, index, how_many in shard_chunks:
+          next_pos = cur_pos + how_many
+          inputs[i, cur_pos:next_pos] = shard.word_ids[
+              position:position + how_many]
+          targets[i, cur_pos:next_pos] = shard.word_ids[
+              position + 1:position + how_many + 1]
+          char_inputs[i, cur_pos:next_pos] = shard.char_ids[
+              position:position + how_many]
+          global_word_ids[i, cur_pos:next_pos] = np.arange(
+              position - index, position - index + how_many)
+          weights[i, cur_pos:next_pos] = 1.0
+        continue
+
+      rows, cols, positions, indices, lengths = np.array(shard_chunks).T
+      # Offsets of each word within its chunk.
+      steps = np.arange(np.sum(lengths)) - np.repeat(
+          np.cumsum(lengths) - lengths, lengths)
+      rows = np.repeat(rows, lengths)
+      cols = np.repeat(cols, lengths) + steps
+      positions = np.repeat(positions, lengths) + steps
+      inputs[rows, cols] = shard.word_ids[positions]
+      targets[rows, cols] = shard.word_ids[positions + 1]
+      char_inputs[rows, cols] = shard.char_ids[positions]
+      # The global word ids of a shard skip the <BOS> of each sentence.
+      global_word_ids[rows, cols] = positions - np.repeat(indices, lengths)
+      weights[rows, cols] = 1.0
+
+    if no_more_data and np.sum(weights) == 0:
+      # There is no more data and this is an empty batch. Done!
+      break
+    yield inputs, char_inputs, global_word_ids, targets, weights
+
+
+_BINARY_SUFFIXES = ('.word_ids.npy', '.char_ids.npy', '.offsets.npy')
+
+
+def write_binary_shard(shard_name, vocab, output_prefix):
+  """Converts a text shard to binary shard files.
+
+  The word ids of all the sentences, with their <BOS> and <EOS>, are written
+  back to back to output_prefix.word_ids.npy, the char ids of the words to
+  output_prefix.char_ids.npy, as uint8 when possible, and the offset of each
+  sentence in them to output_prefix.offsets.npy.
+
+  Args:
+    shard_name: text file path.
+    vocab: CharsVocabulary.
+    output_prefix: path prefix of the binary files.
+
+  Returns:
+    The number of sentences.
+  """
+  with tf.gfile.Open(shard_name) as f:
+    sentences = f.readlines()
+  word_ids = [vocab.encode(sentence) for sentence in sentences]
+  char_ids, offsets = vocab.encode_chars_flat(sentences)
+  word_ids = np.concatenate(word_ids) if word_ids else np.zeros([0], np.int32)
+  if not char_ids.size or (char_ids.min() >= 0 and char_ids.max() < 256):
+    char_ids = char_ids.astype(np.uint8)
+  # Write the offsets last, as BinaryShard finds the shards through them.
+  for suffix, array in zip(_BINARY_SUFFIXES, [word_ids, char_ids, offsets]):
+    with tf.gfile.Open(output_prefix + suffix + '.tmp', 'wb') as f:
+      np.save(f, array)
+    tf.gfile.Rename(output_prefix + suffix + '.tmp', output_prefix + suffix,
+                    overwrite=True)
+  tf.logging.info('Wrote %d sentences and %d words to %s', len(sentences),
+                  len(word_ids), output_prefix)
+  return len(sentences)
+
+
+class BinaryShard(object):
+  """Memory-mapped binary shard written by write_binary_shard."""
+
+  def __init__(self, prefix):
+    self.prefix = prefix
+    # Plain arrays over the memory maps are faster to index.
+    self.word_ids, self.char_ids, self.offsets = [
+        np.asarray(np.load(prefix + suffix, mmap_mode='r'))
+        for suffix in _BINARY_SUFFIXES]
+    # The offsets as Python ints, for the batcher.
+    self.sentence_starts = self.offsets.tolist()
+
+  @property
+  def num_sentences(self):
+    return len(self.offsets) - 1
+
+
 class LM1BDataset(object):
   """Utility class for 1B word benchmark dataset.
 
@@ -247,7 +484,7 @@ class LM1BDataset(object):
     tf.logging.info('Loading data from: %s', shard_name)
     with tf.gfile.Open(shard_name) as f:
       sentences = f.readlines()
-    chars_ids = [self.vocab.encode_chars(sentence) for sentence in sentences]
+    chars_ids = self.vocab.encode_chars_batch(sentences)
     ids = [self.vocab.encode(sentence) for sentence in sentences]
 
     global_word_ids = []
@@ -259,6 +496,7 @@ class LM1BDataset(object):
       current_idx += current_size
 
     tf.logging.info('Loaded %d words.', current_idx)
+    tf.logging.info('Char ids lookups: %s', self.vocab.oov_cache_stats)
     tf.logging.info('Finished loading')
     return zip(ids, chars_ids, global_word_ids)
 
@@ -277,3 +515,46 @@ class LM1BDataset(object):
   @property
   def vocab(self):
     return self._vocab
+
+
+class BinaryLM1BDataset(LM1BDataset):
+  """Utility class for 1B word benchmark dataset in binary shards.
+
+  Reads the shards written by write_binary_shard, so the sentences are not
+  tokenized again at each epoch.
+  """
+
+  def __init__(self, filepattern, vocab):
+    """Initialize BinaryLM1BDataset reader.
+
+    Args:
+      filepattern: Pattern of the prefixes of the binary shards.
+      vocab: CharsVocabulary the shards were written with.
+    """
+    self._vocab = vocab
+    suffix = _BINARY_SUFFIXES[-1]
+    self._all_shards = [name[:-len(suffix)]
+                        for name in tf.gfile.Glob(filepattern + suffix)]
+    tf.logging.info('Found %d shards at %s', len(self._all_shards), filepattern)
+
+  def _load_shard(self, shard_name):
+    """Memory-map one shard.
+
+    Args:
+      shard_name: path prefix of the shard.
+
+    Returns:
+      list of (BinaryShard, sentence index) pairs.
+    """
+    tf.logging.info('Loading data from: %s', shard_name)
+    shard = BinaryShard(shard_name)
+    if shard.char_ids.shape[1] != self.vocab.max_word_length:
+      raise ValueError('%s has words of %d chars instead of %d.' % (
+          shard_name, shard.char_ids.shape[1], self.vocab.max_word_length))
+    tf.logging.info('Loaded %d words.',
+                    len(shard.word_ids) - shard.num_sentences)
+    return [(shard, index) for index in range(shard.num_sentences)]
+
+  def get_batch(self, batch_size, num_steps, pad=False, forever=True):
+    return _get_binary_batch(self._get_sentence(forever), batch_size,
+                             num_steps, self.vocab.max_word_length, pad=pad)
@@ -0,0 +1,79 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Compares the eval input throughput of text and binary shards.
+
+Reads one shard with LM1BDataset and its conversion with BinaryLM1BDataset,
+as "eval" mode of lm_1b_eval does, checks that the batches are the same, and
+reports the words per second of both.
+"""
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+
+import data_utils
+
+FLAGS = tf.flags.FLAGS
+tf.flags.DEFINE_string('vocab_file', '', 'Vocabulary file.')
+tf.flags.DEFINE_string('input_data', '', 'Text shard.')
+tf.flags.DEFINE_string('binary_input_data', '',
+                       'Binary shard written by "convert" mode of lm_1b_eval '
+                       'from FLAGS.input_data.')
+tf.flags.DEFINE_integer('batch_size', 1, 'Batch size.')
+tf.flags.DEFINE_integer('num_steps', 1, 'Number of time steps.')
+tf.flags.DEFINE_integer('max_word_length', 50, 'Maximum word length.')
+
+
+def _Benchmark(dataset):
+  """Reads all the batches of the dataset once.
+
+  Args:
+    dataset: LM1BDataset object.
+
+  Returns:
+    The batches, and the number of words read per second.
+  """
+  start = time.time()
+  batches = []
+  num_words = 0
+  for batch in dataset.get_batch(FLAGS.batch_size, FLAGS.num_steps,
+                                 forever=False):
+    # get_batch reuses its arrays.
+    batches.append([np.copy(array) for array in batch])
+    num_words += np.sum(batch[-1])
+  return batches, num_words / (time.time() - start)
+
+
+def main(unused_argv):
+  vocab = data_utils.CharsVocabulary(FLAGS.vocab_file, FLAGS.max_word_length)
+  text_batches, text_speed = _Benchmark(
+      data_utils.LM1BDataset(FLAGS.input_data, vocab))
+  binary_batches, binary_speed = _Benchmark(
+      data_utils.BinaryLM1BDataset(FLAGS.binary_input_data, vocab))
+
+  if len(text_batches) != len(binary_batches) or not all(
+      np.array_equal(a, b) for text_batch, binary_batch in zip(
+          text_batches, binary_batches) for a, b in zip(text_batch,
+                                                        binary_batch)):
+    sys.stderr.write('The text and binary batches differ.\n')
+  sys.stderr.write('Text:   %.0f words/sec\n' % text_speed)
+  sys.stderr.write('Binary: %.0f words/sec\n' % binary_speed)
+  sys.stderr.write('Char ids lookups: %s\n' % vocab.oov_cache_stats)
+
+
+if __name__ == '__main__':
+  tf.app.run()
@@ -28,7 +28,8 @@ import data_utils
 FLAGS = tf.flags.FLAGS
 # General flags.
 tf.flags.DEFINE_string('mode', 'eval',
-                       'One of [sample, eval, dump_emb, dump_lstm_emb]. '
+                       'One of [sample, eval, dump_emb, dump_lstm_emb, '
+                       'convert]. '
                        '"sample" mode samples future word predictions, using '
                        'FLAGS.prefix as prefix (prefix could be left empty). '
                        '"eval" mode calculates perplexity of the '
@@ -38,7 +39,10 @@ tf.flags.DEFINE_string('mode', 'eval',
                        'order as words in vocabulary. All words in vocabulary '
                        'are dumped.'
                        'dump_lstm_emb dumps lstm embeddings of FLAGS.sentence '
-                       'to FLAGS.save_dir.')
+                       'to FLAGS.save_dir. '
+                       '"convert" mode writes the FLAGS.input_data text files '
+                       'as binary shards to FLAGS.save_dir, to be evaluated '
+                       'with --binary_input.')
 tf.flags.DEFINE_string('pbtxt', '',
                        'GraphDef proto text file used to construct model '
                        'structure.')
@@ -63,6 +67,10 @@ tf.flags.DEFINE_string('input_data', '',
                        'Input data files for eval model.')
 tf.flags.DEFINE_integer('max_eval_steps', 1000000,
                         'Maximum mumber of steps to run "eval" mode.')
+tf.flags.DEFINE_bool('binary_input', False,
+                     'Whether FLAGS.input_data is the pattern of binary '
+                     'shards written by "convert" mode, instead of text '
+                     'files.')
 
 
 # For saving demo resources, use batch size 1 and step 1.
@@ -288,11 +296,29 @@ def _DumpSentenceEmbedding(sentence, vocab):
     sys.stderr.write('LSTM embedding step %d file saved\n' % i)
 
 
+def _ConvertShards(vocab):
+  """Write the text files of FLAGS.input_data as binary shards.
+
+  Args:
+    vocab: CharsVocabulary.
+  """
+  if not tf.gfile.Exists(FLAGS.save_dir):
+    tf.gfile.MakeDirs(FLAGS.save_dir)
+  for shard_name in sorted(tf.gfile.Glob(FLAGS.input_data)):
+    data_utils.write_binary_shard(
+        shard_name, vocab,
+        os.path.join(FLAGS.save_dir, os.path.basename(shard_name)))
+    sys.stderr.write('Converted %s\n' % shard_name)
+
+
 def main(unused_argv):
   vocab = data_utils.CharsVocabulary(FLAGS.vocab_file, MAX_WORD_LEN)
 
   if FLAGS.mode == 'eval':
-    dataset = data_utils.LM1BDataset(FLAGS.input_data, vocab)
+    if FLAGS.binary_input:
+      dataset = data_utils.BinaryLM1BDataset(FLAGS.input_data, vocab)
+    else:
+      dataset = data_utils.LM1BDataset(FLAGS.input_data, vocab)
     _EvalModel(dataset)
   elif FLAGS.mode == 'sample':
     _SampleModel(FLAGS.prefix, vocab)
@@ -300,6 +326,8 @@ def main(unused_argv):
     _DumpEmb(vocab)
   elif FLAGS.mode == 'dump_lstm_emb':
     _DumpSentenceEmbedding(FLAGS.sentence, vocab)
+  elif FLAGS.mode == 'convert':
+    _ConvertShards(vocab)
   else:
     raise Exception('Mode not supported.')
 
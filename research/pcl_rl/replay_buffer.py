@@ -70,7 +70,136 @@ class ReplayBuffer(object):
     pass
 
 
+class SegmentTree(object):
+  """Array-backed binary tree that reduces leaf values with an operation.
+
+  Leaves live in the second half of a flat array and every internal node holds
+  the reduction of its two children, so that updating k leaves and reducing
+  the whole array cost O(k log N).
+  """
+
+  def __init__(self, size, operation, neutral_element):
+    self.capacity = 1
+    while self.capacity < size:
+      self.capacity *= 2
+    self.operation = operation
+    self.neutral_element = neutral_element
+    self.values = np.full(2 * self.capacity, neutral_element, dtype=np.float64)
+
+  def __getitem__(self, idxs):
+    return self.values[self.capacity + np.asarray(idxs, dtype=np.int64)]
+
+  def __setitem__(self, idxs, values):
+    nodes = self.capacity + np.asarray(idxs, dtype=np.int64).ravel()
+    if not len(nodes):
+      return
+    self.values[nodes] = values
+    # All leaves are at the same depth; repeated parents are harmless.
+    while nodes[0] > 1:
+      nodes //= 2
+      self.values[nodes] = self.operation(self.values[2 * nodes],
+                                          self.values[2 * nodes + 1])
+
+  def reset(self, values):
+    """Sets leaves [0, len(values)) and the rest to the neutral element."""
+    self.values[self.capacity:] = self.neutral_element
+    self.values[self.capacity:self.capacity + len(values)] = values
+    level = self.capacity
+    while level > 1:
+      level //= 2
+      self.values[level:2 * level] = self.operation(
+          self.values[2 * level:4 * level:2],
+          self.values[2 * level + 1:4 * level:2])
+
+  def reduce(self):
+    return self.values[1]
+
+
+class SumTree(SegmentTree):
+
+  def __init__(self, size):
+    super(SumTree, self).__init__(size, np.add, 0.0)
+
+  def find_prefixsum_idx(self, prefixsums):
+    """Find the leaves at which the cumulative sums reach prefixsums.
+
+    Args:
+      prefixsums: Array of values in [0, self.reduce()).
+
+    Returns:
+      For each prefixsum, the smallest leaf index i with
+      sum(leaves[:i + 1]) > prefixsum.  Leaves with value 0 are never
+      returned while the total is positive.
+    """
+    prefixsums = np.array(prefixsums, dtype=np.float64)
+    nodes = np.ones(len(prefixsums), dtype=np.int64)
+    while self.capacity > 1 and nodes[0] < self.capacity:
+      left = 2 * nodes
+      left_sums = self.values[left]
+      # Rounding can leave prefixsum at the total; never descend into an
+      # empty subtree because of it.
+      go_right = (prefixsums >= left_sums) & (self.values[left + 1] > 0)
+      prefixsums -= left_sums * go_right
+      nodes = left + go_right
+    return nodes - self.capacity
+
+
+class MinTree(SegmentTree):
+
+  def __init__(self, size):
+    super(MinTree, self).__init__(size, np.minimum, np.inf)
+
+  def argmin(self):
+    """Index of a smallest leaf."""
+    node = 1
+    while node < self.capacity:
+      node *= 2
+      if self.values[node] != self.values[node // 2]:
+        node += 1
+    return node - self.capacity
+
+  def pop_n(self, n):
+    """Returns the indices of the n smallest leaves, smallest first."""
+    values = self.values
+    idxs = []
+    saved = []
+    for _ in xrange(n):
+      idx = self.argmin()
+      idxs.append(idx)
+      saved.append(values[self.capacity + idx])
+      # Exclude the leaf from the next searches.
+      node = self.capacity + idx
+      values[node] = np.inf
+      while node > 1:
+        node //= 2
+        values[node] = min(values[2 * node], values[2 * node + 1])
+    self[idxs] = saved
+    return idxs
+
+
+class MaxTree(SegmentTree):
+
+  def __init__(self, size):
+    super(MaxTree, self).__init__(size, np.maximum, -np.inf)
+
+
 class PrioritizedReplayBuffer(ReplayBuffer):
+  """Replay buffer sampling episodes with probability softmax(alpha * p).
+
+  Episodes are kept in a preallocated object array.  The unnormalized
+  sampling weights exp(alpha * (p - offset)) live in a sum tree, so sampling
+  a batch and updating priorities cost O(log N) per episode instead of
+  recomputing the distribution over the whole buffer.  The offset is only
+  moved, rebuilding the tree in one vectorized pass, when the largest
+  priority drifts far enough from it to risk overflow or underflow.
+
+  The first init_length episodes (see seed_buffer) always have the largest
+  priority of the other episodes, which is tracked with a max tree; a min
+  tree supports rank eviction.
+  """
+
+  # Largest |alpha * (p - offset)| tolerated before the weights are rebuilt.
+  MAX_EXPONENT = 30.0
 
   def __init__(self, max_size, alpha=0.2,
                eviction_strategy='rand'):
@@ -81,9 +210,16 @@ class PrioritizedReplayBuffer(ReplayBuffer):
     self.remove_idx = 0
 
     self.cur_size = 0
-    self.buffer = {}
+    self.buffer = np.empty(self.max_size, dtype=object)
     self.priorities = np.zeros(self.max_size)
     self.init_length = 0
+    self.seed_priority = None
+
+    self.weights = SumTree(self.max_size)
+    self.weight_offset = None
+    # Priorities of the stored episodes other than the seed episodes.
+    self.max_priority = MaxTree(self.max_size)
+    self.min_priority = MinTree(self.max_size)
 
   def __len__(self):
     return self.cur_size
@@ -91,30 +227,18 @@ class PrioritizedReplayBuffer(ReplayBuffer):
   def add(self, episodes, priorities, new_idxs=None):
     """Add episodes to buffer."""
     if new_idxs is None:
-      idx = 0
-      new_idxs = []
-      while self.cur_size < self.max_size and idx < len(episodes):
-        self.buffer[self.cur_size] = episodes[idx]
-        new_idxs.append(self.cur_size)
-        self.cur_size += 1
-        idx += 1
-
-      if idx < len(episodes):
-        remove_idxs = self.remove_n(len(episodes) - idx)
-        for remove_idx in remove_idxs:
-          self.buffer[remove_idx] = episodes[idx]
-          new_idxs.append(remove_idx)
-          idx += 1
+      num_new = min(self.max_size - self.cur_size, len(episodes))
+      new_idxs = list(xrange(self.cur_size, self.cur_size + num_new))
+      self.cur_size += num_new
+      if num_new < len(episodes):
+        new_idxs.extend(self.remove_n(len(episodes) - num_new))
     else:
       assert len(new_idxs) == len(episodes)
-      for new_idx, ep in zip(new_idxs, episodes):
-        self.buffer[new_idx] = ep
 
-    self.priorities[new_idxs] = priorities
-    self.priorities[0:self.init_length] = np.max(
-        self.priorities[self.init_length:])
-
-    assert len(self.buffer) == self.cur_size
+    new_idxs = np.asarray(new_idxs, dtype=np.int64)
+    for new_idx, ep in zip(new_idxs, episodes):
+      self.buffer[new_idx] = ep
+    self._set_priorities(new_idxs, priorities)
     return new_idxs
 
   def remove_n(self, n):
@@ -132,31 +256,92 @@ class PrioritizedReplayBuffer(ReplayBuffer):
           for i in xrange(n)]
       self.remove_idx = idxs[-1] + 1 - self.init_length
     elif self.eviction_strategy == 'rank':
-      # remove lowest-priority indices
-      idxs = np.argpartition(self.priorities, n)[:n]
+      # remove lowest-priority indices (seed episodes are never removed)
+      idxs = self.min_priority.pop_n(n)
 
     return idxs
 
+  def _set_priorities(self, idxs, priorities):
+    """Sets the priorities of idxs and updates the trees."""
+    self.priorities[idxs] = priorities
+    regular = idxs[idxs >= self.init_length]
+    self.max_priority[regular] = self.priorities[regular]
+    self.min_priority[regular] = self.priorities[regular]
+
+    max_priority = self.max_priority.reduce()
+    if self.init_length:
+      # Slots that are not filled yet count with priority 0.
+      if self.cur_size < self.max_size:
+        max_priority = max(max_priority, 0.0)
+      if (max_priority != self.seed_priority or
+          np.any(idxs < self.init_length)):
+        self.seed_priority = max_priority
+        self.priorities[0:self.init_length] = max_priority
+        idxs = np.concatenate([regular, np.arange(self.init_length)])
+
+    if (self.weight_offset is None or
+        abs(self.alpha * (max_priority - self.weight_offset)) >
+        self.MAX_EXPONENT):
+      if np.isfinite(max_priority):
+        self.weight_offset = max_priority
+      self.weights.reset(self._weights(np.arange(self.cur_size)))
+    else:
+      self.weights[idxs] = self._weights(idxs)
+
+  def _weights(self, idxs):
+    offset = self.weight_offset or 0.0
+    return np.exp(self.alpha * (self.priorities[idxs] - offset))
+
   def sampling_distribution(self):
-    p = self.priorities[:self.cur_size]
-    p = np.exp(self.alpha * (p - np.max(p)))
+    p = self.weights[np.arange(self.cur_size)]
     norm = np.sum(p)
     if norm > 0:
-      uniform = 0.0
-      p = p / norm * (1 - uniform) + 1.0 / self.cur_size * uniform
+      p = p / norm
     else:
       p = np.ones(self.cur_size) / self.cur_size
     return p
 
+  def _sample_idxs(self, n):
+    """Samples n distinct idxs with probability proportional to weights."""
+    if n > self.cur_size:
+      raise ValueError('Cannot take a batch of %d from %d episodes' %
+                       (n, self.cur_size))
+    # Draw with replacement, drop repeats and temporarily zero the weights of
+    # drawn episodes until n distinct ones are found.  This has the same
+    # distribution as drawing one episode at a time without replacement.
+    idxs = []
+    drawn = set()
+    saved_weights = [np.zeros(0)]
+    while len(idxs) < n:
+      total = self.weights.reduce()
+      if not total > 0:
+        self.weights[idxs] = np.concatenate(saved_weights)
+        raise ValueError('Fewer episodes with nonzero probability than %d' % n)
+      new_idxs = []
+      for idx in self.weights.find_prefixsum_idx(
+          np.random.uniform(size=n - len(idxs)) * total):
+        if idx not in drawn:
+          drawn.add(idx)
+          new_idxs.append(idx)
+      saved_weights.append(self.weights[new_idxs])
+      self.weights[new_idxs] = 0.0
+      idxs.extend(new_idxs)
+    self.weights[idxs] = np.concatenate(saved_weights)
+    return np.array(idxs, dtype=np.int64)
+
   def get_batch(self, n):
     """Get batch of episodes to train on."""
-    p = self.sampling_distribution()
-    idxs = np.random.choice(self.cur_size, size=int(n), replace=False, p=p)
+    n = int(n)
+    total = self.weights.reduce()
+    if total > 0:
+      idxs = self._sample_idxs(n)
+      p = self.weights[idxs] / total
+    else:
+      idxs = np.array(random.sample(xrange(self.cur_size), n), dtype=np.int64)
+      p = np.ones(n) / self.cur_size
     self.last_batch = idxs
-    return [self.buffer[idx] for idx in idxs], p[idxs]
+    return list(self.buffer[idxs]), p
 
   def update_last_batch(self, delta):
     """Update last batch idxs with new priority."""
-    self.priorities[self.last_batch] = np.abs(delta)
-    self.priorities[0:self.init_length] = np.max(
-        self.priorities[self.init_length:])
+    self._set_priorities(self.last_batch, np.abs(delta))
@@ -0,0 +1,89 @@
+# Copyright 2017 The TensorFlow Authors All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Throughput benchmark for PrioritizedReplayBuffer.
+
+Fills a buffer with dummy episodes and times the add / get_batch /
+update_last_batch cycle of a training step, next to the cost of sampling
+from the full softmax distribution as the dense implementation did.
+
+  python replay_buffer_benchmark.py --sizes 10000,100000,1000000
+"""
+
+import argparse
+import time
+
+import numpy as np
+from six.moves import xrange
+
+import replay_buffer
+
+
+def dense_get_batch(priorities, alpha, n):
+  """Samples a batch the way the dense buffer did, for comparison."""
+  p = np.exp(alpha * (priorities - np.max(priorities)))
+  p /= np.sum(p)
+  return np.random.choice(len(priorities), size=n, replace=False, p=p)
+
+
+def time_per_call(fn, num_iters):
+  start = time.time()
+  for _ in xrange(num_iters):
+    fn()
+  return (time.time() - start) / num_iters
+
+
+def benchmark(size, batch_size, alpha, eviction, num_iters):
+  buf = replay_buffer.PrioritizedReplayBuffer(
+      size, alpha=alpha, eviction_strategy=eviction)
+  buf.seed_buffer([None] * 10)
+  start = time.time()
+  for i in xrange(0, size, batch_size):
+    buf.add([None] * batch_size, np.random.randn(batch_size))
+  fill_time = time.time() - start
+
+  def step():
+    buf.get_batch(batch_size)
+    buf.update_last_batch(np.random.randn(batch_size))
+    buf.add([None] * batch_size, np.random.randn(batch_size))
+
+  step_time = time_per_call(step, num_iters)
+  dense_time = time_per_call(
+      lambda: dense_get_batch(buf.priorities, alpha, batch_size),
+      max(1, num_iters // 10))
+  print('size %8d: fill %6.2fs  step %8.3fms (%7.0f steps/s)  '
+        'dense sampling alone %8.3fms' %
+        (size, fill_time, 1000 * step_time, 1.0 / step_time,
+         1000 * dense_time))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--sizes', default='10000,100000,1000000',
+                      help='comma-separated buffer sizes')
+  parser.add_argument('--batch_size', type=int, default=100)
+  parser.add_argument('--alpha', type=float, default=0.5)
+  parser.add_argument('--eviction', default='rand',
+                      choices=['rand', 'fifo', 'rank'])
+  parser.add_argument('--num_iters', type=int, default=200)
+  args = parser.parse_args()
+
+  for size in [int(s) for s in args.sizes.split(',')]:
+    benchmark(size, args.batch_size, args.alpha, args.eviction,
+              args.num_iters)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,251 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Encodes a large text corpus into a memory-mapped matrix of skip-thoughts.
+
+The input file contains one sentence per line. The output directory contains:
+  embeddings.npy: A float32 .npy file of shape [num_sentences, thought_dim]
+    whose i-th row is the skip-thought vector of the i-th line. It can be read
+    with np.load(path, mmap_mode="r").
+  offsets.npy: An int64 array of shape [num_sentences + 1] whose i-th entry is
+    the byte offset of the i-th line in the input file.
+  done_chunks.txt: A "chunk_size <n>" line followed by the indices of the
+    chunks of n lines that have been encoded and flushed to embeddings.npy.
+
+The corpus is processed in chunks. Sentences are tokenized by a pool of worker
+processes (the next chunk is tokenized while the current one is encoded), and
+each chunk is encoded in batches of sentences of similar length. If the script
+is interrupted, running it again with the same flags skips the chunks that are
+already done. Resuming with a different --chunk_size is an error.
+
+Empty lines are encoded as zero vectors.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+import os.path
+import time
+
+
+import nltk
+import numpy as np
+import tensorflow as tf
+
+from skip_thoughts import configuration
+from skip_thoughts import encoder_manager
+from skip_thoughts import skip_thoughts_encoder
+
+FLAGS = tf.flags.FLAGS
+
+tf.flags.DEFINE_string("input_file", None,
+                       "Text file containing one sentence per line.")
+tf.flags.DEFINE_string("output_dir", None, "Output directory.")
+
+tf.flags.DEFINE_string("vocab_file", None,
+                       "Path to vocabulary file containing a list of newline-"
+                       "separated words where the word id is the "
+                       "corresponding 0-based index in the file.")
+tf.flags.DEFINE_string("embeddings_file", None,
+                       "Path to serialized numpy array of shape "
+                       "[vocab_size, embedding_dim].")
+tf.flags.DEFINE_string("checkpoint_path", None,
+                       "Checkpoint file or directory containing a checkpoint "
+                       "file.")
+tf.flags.DEFINE_boolean("bidirectional_encoder", False,
+                        "Whether the model has a bidirectional encoder.")
+
+tf.flags.DEFINE_integer("chunk_size", 100000,
+                        "Number of sentences per chunk. Progress is saved "
+                        "after each chunk.")
+tf.flags.DEFINE_integer("batch_size", 128, "Batch size for the encoder.")
+tf.flags.DEFINE_integer("num_tokenize_processes", 8,
+                        "Number of processes used to tokenize sentences.")
+tf.flags.DEFINE_boolean("use_norm", True,
+                        "Whether to normalize skip-thought vectors to unit L2 "
+                        "norm.")
+tf.flags.DEFINE_boolean("use_eos", False,
+                        "Whether to append the end-of-sentence word to each "
+                        "sentence.")
+
+tf.logging.set_verbosity(tf.logging.INFO)
+
+# Sentence detector of each tokenization process.
+_sentence_detector = None
+
+
+def _tokenize_line(line):
+  """Tokenizes a line of the input file in a worker process."""
+  global _sentence_detector
+  if _sentence_detector is None:
+    _sentence_detector = nltk.data.load("tokenizers/punkt/english.pickle")
+  return skip_thoughts_encoder.tokenize(
+      line.decode("utf-8").strip(), _sentence_detector)
+
+
+def _line_offsets(input_file):
+  """Returns the byte offsets of the lines of input_file.
+
+  Args:
+    input_file: Path to the input file.
+
+  Returns:
+    An int64 numpy array of shape [num_lines + 1], where the last entry is the
+    size of the file.
+  """
+  offsets = [0]
+  with tf.gfile.GFile(input_file, mode="rb") as f:
+    for line in f:
+      offsets.append(offsets[-1] + len(line))
+  return np.array(offsets, dtype=np.int64)
+
+
+def _read_lines(input_file, offsets, start, end):
+  """Reads lines [start, end) of input_file."""
+  with tf.gfile.GFile(input_file, mode="rb") as f:
+    f.seek(offsets[start])
+    data = f.read(offsets[end] - offsets[start])
+  return [data[offsets[i] - offsets[start]:offsets[i + 1] - offsets[start]]
+          for i in range(start, end)]
+
+
+def _load_done_chunks(filename, chunk_size):
+  """Returns the set of chunk indices recorded in filename.
+
+  Args:
+    filename: Path to the done_chunks.txt file.
+    chunk_size: Number of sentences per chunk of this run.
+
+  Returns:
+    The set of indices of the chunks that are done.
+
+  Raises:
+    ValueError: If the chunks were recorded with a different chunk size, in
+      which case their indices would refer to different sentences.
+  """
+  if not tf.gfile.Exists(filename):
+    return set()
+  with tf.gfile.GFile(filename, mode="r") as f:
+    lines = [line.split() for line in f if line.strip()]
+  if not lines:
+    return set()
+  if len(lines[0]) != 2 or lines[0][0] != "chunk_size":
+    raise ValueError("%s does not start with the chunk size." % filename)
+  if int(lines[0][1]) != chunk_size:
+    raise ValueError("%s was written with --chunk_size=%s; resume with the "
+                     "same chunk size or use a new --output_dir." %
+                     (filename, lines[0][1]))
+  return set(int(line[0]) for line in lines[1:])
+
+
+def main(unused_argv):
+  if not FLAGS.input_file:
+    raise ValueError("--input_file is required.")
+  if not FLAGS.output_dir:
+    raise ValueError("--output_dir is required.")
+
+  tf.gfile.MakeDirs(FLAGS.output_dir)
+  offsets_file = os.path.join(FLAGS.output_dir, "offsets.npy")
+  embeddings_file = os.path.join(FLAGS.output_dir, "embeddings.npy")
+  done_file = os.path.join(FLAGS.output_dir, "done_chunks.txt")
+
+  # Index the lines of the input file.
+  if tf.gfile.Exists(offsets_file):
+    offsets = np.load(offsets_file)
+  else:
+    tf.logging.info("Indexing lines of %s", FLAGS.input_file)
+    offsets = _line_offsets(FLAGS.input_file)
+    np.save(offsets_file, offsets)
+  num_sentences = len(offsets) - 1
+  tf.logging.info("Input contains %d sentences.", num_sentences)
+
+  # Start the tokenization processes before TensorFlow creates any threads.
+  pool = multiprocessing.Pool(FLAGS.num_tokenize_processes)
+
+  # Load the model.
+  model_config = configuration.model_config(
+      bidirectional_encoder=FLAGS.bidirectional_encoder)
+  manager = encoder_manager.EncoderManager()
+  manager.load_model(model_config, FLAGS.vocab_file, FLAGS.embeddings_file,
+                     FLAGS.checkpoint_path)
+  encoder = manager.encoders[0]
+  sess = manager.sessions[0]
+  thought_dim = sess.graph.get_tensor_by_name(
+      "encoder/thought_vectors:0").get_shape()[1].value
+
+  # Open (or create) the output matrix.
+  done_chunks = _load_done_chunks(done_file, FLAGS.chunk_size)
+  if tf.gfile.Exists(embeddings_file) and done_chunks:
+    embeddings = np.lib.format.open_memmap(embeddings_file, mode="r+")
+    if embeddings.shape != (num_sentences, thought_dim):
+      raise ValueError("Existing %s has shape %s, expected %s" %
+                       (embeddings_file, embeddings.shape,
+                        (num_sentences, thought_dim)))
+  else:
+    embeddings = np.lib.format.open_memmap(
+        embeddings_file, mode="w+", dtype=np.float32,
+        shape=(num_sentences, thought_dim))
+    with tf.gfile.GFile(done_file, mode="w") as f:
+      f.write("chunk_size %d\n" % FLAGS.chunk_size)
+
+  chunks = [i for i in range(0, num_sentences, FLAGS.chunk_size)
+            if i // FLAGS.chunk_size not in done_chunks]
+  tf.logging.info("Encoding %d chunks (%d already done).", len(chunks),
+                  len(done_chunks))
+
+  def _tokenize_chunk_async(start):
+    end = min(start + FLAGS.chunk_size, num_sentences)
+    lines = _read_lines(FLAGS.input_file, offsets, start, end)
+    return pool.map_async(_tokenize_line, lines, chunksize=256)
+
+  start_time = time.time()
+  num_encoded = 0
+  pending = _tokenize_chunk_async(chunks[0]) if chunks else None
+  for i, start in enumerate(chunks):
+    end = min(start + FLAGS.chunk_size, num_sentences)
+    tokenized = pending.get()
+    # Tokenize the next chunk while this one is encoded.
+    if i + 1 < len(chunks):
+      pending = _tokenize_chunk_async(chunks[i + 1])
+
+    nonempty = [j for j, words in enumerate(tokenized) if words]
+    vectors = np.zeros((end - start, thought_dim), dtype=np.float32)
+    if nonempty:
+      vectors[nonempty] = encoder.encode_tokenized(
+          sess, [tokenized[j] for j in nonempty],
+          use_norm=FLAGS.use_norm,
+          batch_size=FLAGS.batch_size,
+          use_eos=FLAGS.use_eos)
+    embeddings[start:end] = vectors
+    embeddings.flush()
+
+    # Only record the chunk as done once its vectors are on disk.
+    with tf.gfile.GFile(done_file, mode="a") as f:
+      f.write("%d\n" % (start // FLAGS.chunk_size))
+
+    num_encoded += end - start
+    elapsed = time.time() - start_time
+    tf.logging.info("Encoded chunk %d/%d (%d empty sentences): "
+                    "%.1f sentences/sec", i + 1, len(chunks),
+                    end - start - len(nonempty), num_encoded / elapsed)
+
+  pool.close()
+  manager.close()
+  tf.logging.info("Wrote %s", embeddings_file)
+
+
+if __name__ == "__main__":
+  tf.app.run()
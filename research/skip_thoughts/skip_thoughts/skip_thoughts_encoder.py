@@ -91,6 +91,24 @@ def _batch_and_pad(sequences):
   return np.array(batch_embeddings), np.array(batch_mask)
 
 
+def tokenize(item, sentence_detector):
+  """Tokenizes an input string into a list of words.
+
+  Args:
+    item: An input string.
+    sentence_detector: An NLTK sentence tokenizer, e.g. the Punkt tokenizer
+      loaded from "tokenizers/punkt/english.pickle".
+
+  Returns:
+    A list of words.
+  """
+  tokenized = []
+  for s in sentence_detector.tokenize(item):
+    tokenized.extend(nltk.tokenize.word_tokenize(s))
+
+  return tokenized
+
+
 class SkipThoughtsEncoder(object):
   """Skip-thoughts sentence encoder."""
 
@@ -184,11 +202,7 @@ class SkipThoughtsEncoder(object):
 
   def _tokenize(self, item):
     """Tokenizes an input string into a list of words."""
-    tokenized = []
-    for s in self._sentence_detector.tokenize(item):
-      tokenized.extend(nltk.tokenize.word_tokenize(s))
-
-    return tokenized
+    return tokenize(item, self._sentence_detector)
 
   def _word_to_embedding(self, w):
     """Returns the embedding of a word."""
@@ -205,14 +219,64 @@ class SkipThoughtsEncoder(object):
       embeddings: A list of word embedding sequences corresponding to the input
         strings.
     """
+    return self._preprocess_tokenized([self._tokenize(item) for item in data],
+                                      use_eos)
+
+  def _preprocess_tokenized(self, tokenized_data, use_eos):
+    """Preprocesses tokenized text for the encoder.
+
+    Args:
+      tokenized_data: A list of lists of words.
+      use_eos: Whether to append the end-of-sentence word to each sentence.
+
+    Returns:
+      embeddings: A list of word embedding sequences corresponding to the input
+        word lists.
+    """
     preprocessed_data = []
-    for item in data:
-      tokenized = self._tokenize(item)
+    for tokenized in tokenized_data:
       if use_eos:
-        tokenized.append(special_words.EOS)
+        tokenized = tokenized + [special_words.EOS]
       preprocessed_data.append([self._word_to_embedding(w) for w in tokenized])
     return preprocessed_data
 
+  def _encode_preprocessed(self, sess, data, verbose, batch_size):
+    """Encodes preprocessed sentences in batches of similar length.
+
+    Sentences are sorted by length before batching so that each batch is padded
+    only up to the length of its own longest sentence.
+
+    Args:
+      sess: TensorFlow Session.
+      data: A list of word embedding sequences.
+      verbose: Whether to log every batch.
+      batch_size: Batch size for the encoder.
+
+    Returns:
+      thought_vectors: A list of numpy arrays corresponding to the skip-thought
+        encodings of the sequences in 'data', in the original order.
+    """
+    thought_vectors = [None] * len(data)
+    order = np.argsort([len(seq) for seq in data], kind="mergesort")
+
+    batch_indices = np.arange(0, len(data), batch_size)
+    for batch, start_index in enumerate(batch_indices):
+      if verbose:
+        tf.logging.info("Batch %d / %d.", batch, len(batch_indices))
+
+      indices = order[start_index:start_index + batch_size]
+      embeddings, mask = _batch_and_pad([data[i] for i in indices])
+      feed_dict = {
+          "encode_emb:0": embeddings,
+          "encode_mask:0": mask,
+      }
+      batch_vectors = sess.run("encoder/thought_vectors:0",
+                               feed_dict=feed_dict)
+      for i, v in zip(indices, batch_vectors):
+        thought_vectors[i] = v
+
+    return thought_vectors
+
   def encode(self,
              sess,
              data,
@@ -236,23 +300,46 @@ class SkipThoughtsEncoder(object):
         encodings of sentences in 'data'.
     """
     data = self._preprocess(data, use_eos)
-    thought_vectors = []
+    thought_vectors = self._encode_preprocessed(sess, data, verbose,
+                                                batch_size)
 
-    batch_indices = np.arange(0, len(data), batch_size)
-    for batch, start_index in enumerate(batch_indices):
-      if verbose:
-        tf.logging.info("Batch %d / %d.", batch, len(batch_indices))
+    if use_norm:
+      thought_vectors = [v / np.linalg.norm(v) for v in thought_vectors]
 
-      embeddings, mask = _batch_and_pad(
-          data[start_index:start_index + batch_size])
-      feed_dict = {
-          "encode_emb:0": embeddings,
-          "encode_mask:0": mask,
-      }
-      thought_vectors.extend(
-          sess.run("encoder/thought_vectors:0", feed_dict=feed_dict))
+    return thought_vectors
+
+  def encode_tokenized(self,
+                       sess,
+                       tokenized_data,
+                       use_norm=True,
+                       verbose=False,
+                       batch_size=128,
+                       use_eos=False):
+    """Encodes a sequence of tokenized sentences as skip-thought vectors.
+
+    Like encode(), but takes sentences that have already been tokenized, e.g.
+    by tokenize() in worker processes.
+
+    Args:
+      sess: TensorFlow Session.
+      tokenized_data: A list of non-empty lists of words.
+      use_norm: Whether to normalize skip-thought vectors to unit L2 norm.
+      verbose: Whether to log every batch.
+      batch_size: Batch size for the encoder.
+      use_eos: Whether to append the end-of-sentence word to each input
+        sentence.
+
+    Returns:
+      thought_vectors: A float32 numpy array of shape
+        [len(tokenized_data), thought_vector_dim].
+    """
+    data = self._preprocess_tokenized(tokenized_data, use_eos)
+    thought_vectors = np.array(
+        self._encode_preprocessed(sess, data, verbose, batch_size),
+        dtype=np.float32)
 
     if use_norm:
-      thought_vectors = [v / np.linalg.norm(v) for v in thought_vectors]
+      thought_vectors /= np.linalg.norm(thought_vectors, axis=1,
+                                        keepdims=True)
 
     return thought_vectors
@@ -80,21 +80,24 @@ serialized Example proto. The Example proto contains the following fields:
 Note that the length of xmin is identical to the length of xmax, ymin and ymax
 for each example.
 
-Running this script using 16 threads may take around ~2.5 hours on a HP Z420.
+Running this script using 16 processes may take around ~2.5 hours on a HP Z420.
+
+The images are converted by a pool of processes (see image_conversion.py).
+Shards that already exist in the output directory are skipped, so an
+interrupted run can be resumed, and --dry_run measures the conversion
+throughput without writing anything.
 """
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
-from datetime import datetime
 import os
 import random
-import sys
-import threading
 
-import numpy as np
 import tensorflow as tf
 
+from datasets import image_conversion
+
 tf.app.flags.DEFINE_string('train_directory', '/tmp/',
                            'Training data directory')
 tf.app.flags.DEFINE_string('validation_directory', '/tmp/',
@@ -108,7 +111,20 @@ tf.app.flags.DEFINE_integer('validation_shards', 128,
                             'Number of shards in validation TFRecord files.')
 
 tf.app.flags.DEFINE_integer('num_threads', 8,
-                            'Number of threads to preprocess the images.')
+                            'Number of processes to preprocess the images.')
+tf.app.flags.DEFINE_string('image_coder', 'tensorflow',
+                           'Library used to decode and re-encode the images, '
+                           'one of: %s.' %
+                           ', '.join(sorted(image_conversion.IMAGE_CODERS)))
+tf.app.flags.DEFINE_boolean('resume', True,
+                            'Whether to skip the shards that already exist '
+                            'in the output directory.')
+tf.app.flags.DEFINE_boolean('dry_run', False,
+                            'If true, convert the images without writing any '
+                            'shards and report the throughput.')
+tf.app.flags.DEFINE_integer('dry_run_images', 10000,
+                            'Number of images of each data set to convert in '
+                            'a dry run, or 0 for all of them.')
 
 # The labels file contains a list of valid labels are held in this file.
 # Assumes that the file contains entries as such:
@@ -224,43 +240,6 @@ def _convert_to_example(filename, image_buffer, label, synset, human, bbox,
   return example
 
 
-class ImageCoder(object):
-  """Helper class that provides TensorFlow image coding utilities."""
-
-  def __init__(self):
-    # Create a single Session to run all image coding calls.
-    self._sess = tf.Session()
-
-    # Initializes function that converts PNG to JPEG data.
-    self._png_data = tf.placeholder(dtype=tf.string)
-    image = tf.image.decode_png(self._png_data, channels=3)
-    self._png_to_jpeg = tf.image.encode_jpeg(image, format='rgb', quality=100)
-
-    # Initializes function that converts CMYK JPEG data to RGB JPEG data.
-    self._cmyk_data = tf.placeholder(dtype=tf.string)
-    image = tf.image.decode_jpeg(self._cmyk_data, channels=0)
-    self._cmyk_to_rgb = tf.image.encode_jpeg(image, format='rgb', quality=100)
-
-    # Initializes function that decodes RGB JPEG data.
-    self._decode_jpeg_data = tf.placeholder(dtype=tf.string)
-    self._decode_jpeg = tf.image.decode_jpeg(self._decode_jpeg_data, channels=3)
-
-  def png_to_jpeg(self, image_data):
-    return self._sess.run(self._png_to_jpeg,
-                          feed_dict={self._png_data: image_data})
-
-  def cmyk_to_rgb(self, image_data):
-    return self._sess.run(self._cmyk_to_rgb,
-                          feed_dict={self._cmyk_data: image_data})
-
-  def decode_jpeg(self, image_data):
-    image = self._sess.run(self._decode_jpeg,
-                           feed_dict={self._decode_jpeg_data: image_data})
-    assert len(image.shape) == 3
-    assert image.shape[2] == 3
-    return image
-
-
 def _is_png(filename):
   """Determine if a file contains a PNG format image.
 
@@ -305,7 +284,7 @@ def _process_image(filename, coder):
 
   Args:
     filename: string, path to an image file e.g., '/path/to/example.JPG'.
-    coder: instance of ImageCoder to provide TensorFlow image coding utils.
+    coder: image coder, e.g. an image_conversion.TFImageCoder.
   Returns:
     image_buffer: string, JPEG encoding of RGB image.
     height: integer, image height in pixels.
@@ -324,88 +303,29 @@ def _process_image(filename, coder):
     print('Converting CMYK to RGB for %s' % filename)
     image_data = coder.cmyk_to_rgb(image_data)
 
-  # Decode the RGB JPEG.
-  image = coder.decode_jpeg(image_data)
-
-  # Check that image converted to RGB
-  assert len(image.shape) == 3
-  height = image.shape[0]
-  width = image.shape[1]
-  assert image.shape[2] == 3
+  # Decode the JPEG, converting it to RGB if it is e.g. grayscale.
+  image_data, height, width = coder.rgb_jpeg_and_size(image_data)
 
   return image_data, height, width
 
 
-def _process_image_files_batch(coder, thread_index, ranges, name, filenames,
-                               synsets, labels, humans, bboxes, num_shards):
-  """Processes and saves list of images as TFRecord in 1 thread.
+def _convert_image(coder, filename, synset, label, human, bbox):
+  """Builds the Example proto of an image file in a worker process.
 
   Args:
-    coder: instance of ImageCoder to provide TensorFlow image coding utils.
-    thread_index: integer, unique batch to run index is within [0, len(ranges)).
-    ranges: list of pairs of integers specifying ranges of each batches to
-      analyze in parallel.
-    name: string, unique identifier specifying the data set
-    filenames: list of strings; each string is a path to an image file
-    synsets: list of strings; each string is a unique WordNet ID
-    labels: list of integer; each integer identifies the ground truth
-    humans: list of strings; each string is a human-readable label
-    bboxes: list of bounding boxes for each image. Note that each entry in this
-      list might contain from 0+ entries corresponding to the number of bounding
-      box annotations for the image.
-    num_shards: integer number of shards for this data set.
+    coder: image coder, e.g. an image_conversion.TFImageCoder.
+    filename: string, path to an image file, e.g., '/path/to/example.JPG'
+    synset: string, unique WordNet ID specifying the label, e.g., 'n02323233'
+    label: integer, identifier for the ground truth for the network
+    human: string, human-readable label, e.g., 'red fox, Vulpes vulpes'
+    bbox: list of bounding boxes; each box is a list of integers
+      specifying [xmin, ymin, xmax, ymax].
+  Returns:
+    Example proto
   """
-  # Each thread produces N shards where N = int(num_shards / num_threads).
-  # For instance, if num_shards = 128, and the num_threads = 2, then the first
-  # thread would produce shards [0, 64).
-  num_threads = len(ranges)
-  assert not num_shards % num_threads
-  num_shards_per_batch = int(num_shards / num_threads)
-
-  shard_ranges = np.linspace(ranges[thread_index][0],
-                             ranges[thread_index][1],
-                             num_shards_per_batch + 1).astype(int)
-  num_files_in_thread = ranges[thread_index][1] - ranges[thread_index][0]
-
-  counter = 0
-  for s in xrange(num_shards_per_batch):
-    # Generate a sharded version of the file name, e.g. 'train-00002-of-00010'
-    shard = thread_index * num_shards_per_batch + s
-    output_filename = '%s-%.5d-of-%.5d' % (name, shard, num_shards)
-    output_file = os.path.join(FLAGS.output_directory, output_filename)
-    writer = tf.python_io.TFRecordWriter(output_file)
-
-    shard_counter = 0
-    files_in_shard = np.arange(shard_ranges[s], shard_ranges[s + 1], dtype=int)
-    for i in files_in_shard:
-      filename = filenames[i]
-      label = labels[i]
-      synset = synsets[i]
-      human = humans[i]
-      bbox = bboxes[i]
-
-      image_buffer, height, width = _process_image(filename, coder)
-
-      example = _convert_to_example(filename, image_buffer, label,
-                                    synset, human, bbox,
-                                    height, width)
-      writer.write(example.SerializeToString())
-      shard_counter += 1
-      counter += 1
-
-      if not counter % 1000:
-        print('%s [thread %d]: Processed %d of %d images in thread batch.' %
-              (datetime.now(), thread_index, counter, num_files_in_thread))
-        sys.stdout.flush()
-
-    writer.close()
-    print('%s [thread %d]: Wrote %d images to %s' %
-          (datetime.now(), thread_index, shard_counter, output_file))
-    sys.stdout.flush()
-    shard_counter = 0
-  print('%s [thread %d]: Wrote %d images to %d shards.' %
-        (datetime.now(), thread_index, counter, num_files_in_thread))
-  sys.stdout.flush()
+  image_buffer, height, width = _process_image(filename, coder)
+  return _convert_to_example(filename, image_buffer, label, synset, human,
+                             bbox, height, width)
 
 
 def _process_image_files(name, filenames, synsets, labels, humans,
@@ -428,36 +348,14 @@ def _process_image_files(name, filenames, synsets, labels, humans,
   assert len(filenames) == len(humans)
   assert len(filenames) == len(bboxes)
 
-  # Break all images into batches with a [ranges[i][0], ranges[i][1]].
-  spacing = np.linspace(0, len(filenames), FLAGS.num_threads + 1).astype(np.int)
-  ranges = []
-  threads = []
-  for i in xrange(len(spacing) - 1):
-    ranges.append([spacing[i], spacing[i+1]])
-
-  # Launch a thread for each batch.
-  print('Launching %d threads for spacings: %s' % (FLAGS.num_threads, ranges))
-  sys.stdout.flush()
-
-  # Create a mechanism for monitoring when all threads are finished.
-  coord = tf.train.Coordinator()
-
-  # Create a generic TensorFlow-based utility for converting all image codings.
-  coder = ImageCoder()
-
-  threads = []
-  for thread_index in xrange(len(ranges)):
-    args = (coder, thread_index, ranges, name, filenames,
-            synsets, labels, humans, bboxes, num_shards)
-    t = threading.Thread(target=_process_image_files_batch, args=args)
-    t.start()
-    threads.append(t)
-
-  # Wait for all the threads to terminate.
-  coord.join(threads)
-  print('%s: Finished writing all %d images in data set.' %
-        (datetime.now(), len(filenames)))
-  sys.stdout.flush()
+  items = list(zip(filenames, synsets, labels, humans, bboxes))
+  if FLAGS.dry_run and FLAGS.dry_run_images:
+    items = items[:FLAGS.dry_run_images]
+  image_conversion.convert_to_shards(
+      name, items, _convert_image, num_shards, FLAGS.output_directory,
+      num_processes=FLAGS.num_threads,
+      coder_class=image_conversion.IMAGE_CODERS[FLAGS.image_coder],
+      resume=FLAGS.resume, dry_run=FLAGS.dry_run)
 
 
 def _find_image_files(data_dir, labels_file):
@@ -680,11 +578,6 @@ def _build_bounding_box_lookup(bounding_box_file):
 
 
 def main(unused_argv):
-  assert not FLAGS.train_shards % FLAGS.num_threads, (
-      'Please make the FLAGS.num_threads commensurate with FLAGS.train_shards')
-  assert not FLAGS.validation_shards % FLAGS.num_threads, (
-      'Please make the FLAGS.num_threads commensurate with '
-      'FLAGS.validation_shards')
   print('Saving results to %s' % FLAGS.output_directory)
 
   # Build a map from synset to human-readable label.
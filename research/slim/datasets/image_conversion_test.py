@@ -0,0 +1,97 @@
+# Copyright 2016 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests that the image coders of image_conversion agree."""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import io
+
+import numpy as np
+from PIL import Image
+import tensorflow as tf
+
+from datasets import image_conversion
+
+_HEIGHT = 24
+_WIDTH = 40
+
+
+def _encode(mode, image_format):
+  """Returns a smooth random image in the given mode, encoded in a format."""
+  rng = np.random.RandomState(0)
+  pixels = rng.randint(64, 192, size=(_HEIGHT // 8, _WIDTH // 8, 3))
+  image = Image.fromarray(pixels.astype(np.uint8)).resize((_WIDTH, _HEIGHT))
+  output = io.BytesIO()
+  image.convert(mode).save(output, format=image_format, quality=95)
+  return output.getvalue()
+
+
+def _process_image(coder, image_data, is_png=False, is_cmyk=False):
+  """Converts image data like build_imagenet_data._process_image()."""
+  if is_png:
+    image_data = coder.png_to_jpeg(image_data)
+  elif is_cmyk:
+    image_data = coder.cmyk_to_rgb(image_data)
+  return coder.rgb_jpeg_and_size(image_data)
+
+
+def _decode(image_data):
+  image = Image.open(io.BytesIO(image_data))
+  return image.format, image.mode, np.asarray(image, dtype=np.float64)
+
+
+class ImageCodersTest(tf.test.TestCase):
+
+  def setUp(self):
+    self._coders = [image_conversion.TFImageCoder(),
+                    image_conversion.PILImageCoder()]
+
+  def _assertCodersAgree(self, image_data, compare_pixels=True, **kwargs):
+    outputs = [_process_image(coder, image_data, **kwargs)
+               for coder in self._coders]
+    decoded = []
+    for output, height, width in outputs:
+      self.assertEqual((_HEIGHT, _WIDTH), (height, width))
+      image_format, mode, pixels = _decode(output)
+      self.assertEqual(('JPEG', 'RGB'), (image_format, mode))
+      self.assertEqual((_HEIGHT, _WIDTH, 3), pixels.shape)
+      decoded.append(pixels)
+    if compare_pixels:
+      # The coders encode with different JPEG libraries and settings.
+      self.assertLess(np.mean(np.abs(decoded[0] - decoded[1])), 2.0)
+    return [output for output, _, _ in outputs]
+
+  def testRGBJpegIsUnchanged(self):
+    image_data = _encode('RGB', 'JPEG')
+    self.assertEqual([image_data, image_data],
+                     self._assertCodersAgree(image_data))
+
+  def testGrayscaleJpeg(self):
+    self._assertCodersAgree(_encode('L', 'JPEG'))
+
+  def testCMYKJpeg(self):
+    # Decoders disagree on whether CMYK JPEG data is inverted, so only the
+    # dimensions and color space are compared.
+    self._assertCodersAgree(_encode('CMYK', 'JPEG'), compare_pixels=False,
+                            is_cmyk=True)
+
+  def testPng(self):
+    self._assertCodersAgree(_encode('RGBA', 'PNG'), is_png=True)
+    self._assertCodersAgree(_encode('L', 'PNG'), is_png=True)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -12,36 +12,133 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # ==============================================================================
-"""Parser evaluation utils."""
+"""Parser evaluation utils.
+
+The token attributes of each corpus are extracted once into flat NumPy arrays
+(see SentenceColumns), and the metrics are computed with vectorized
+comparisons. The arrays of the gold corpora are cached, so that evaluating
+many checkpoints against the same gold corpus only deserializes it once.
+"""
 
 from __future__ import division
 
+import collections
+
+import numpy as np
 import tensorflow as tf
 
 from syntaxnet import sentence_pb2
 from syntaxnet.util import check
 
+# Token attributes of a corpus of sentences. Each field but texts and offsets
+# is an array with one entry per token of the corpus, and the tokens of
+# sentence i are those in [offsets[i], offsets[i + 1]).
+SentenceColumns = collections.namedtuple(
+    'SentenceColumns',
+    ['texts', 'offsets', 'tags', 'heads', 'labels', 'starts', 'ends'])
+
+# Number of gold corpora whose columns are cached.
+_GOLD_CACHE_SIZE = 4
+
+# Cached gold columns, keyed by the hash of the corpus, in order of use. The
+# values are (corpus as a tuple, SentenceColumns) pairs.
+_gold_cache = collections.OrderedDict()
+
+
+def extract_columns(corpus):
+  """Extracts the token attributes of a corpus of serialized sentences."""
+  texts = []
+  lengths = []
+  tags = []
+  heads = []
+  labels = []
+  starts = []
+  ends = []
+  sentence = sentence_pb2.Sentence()
+  for serialized in corpus:
+    sentence.ParseFromString(serialized)
+    tokens = sentence.token
+    texts.append(sentence.text)
+    lengths.append(len(tokens))
+    tags.extend([token.tag for token in tokens])
+    heads.extend([token.head for token in tokens])
+    labels.extend([token.label for token in tokens])
+    starts.extend([token.start for token in tokens])
+    ends.extend([token.end for token in tokens])
+  offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+  np.cumsum(lengths, out=offsets[1:])
+  return SentenceColumns(
+      texts=np.array(texts, dtype=object),
+      offsets=offsets,
+      tags=np.array(tags, dtype=object),
+      heads=np.array(heads, dtype=np.int64),
+      labels=np.array(labels, dtype=object),
+      starts=np.array(starts, dtype=np.int64),
+      ends=np.array(ends, dtype=np.int64))
+
+
+def _gold_columns(gold_corpus):
+  """Returns the columns of a gold corpus, extracting them if not cached."""
+  corpus = tuple(gold_corpus)
+  key = hash(corpus)
+  cached = _gold_cache.pop(key, None)
+  if cached is None or cached[0] != corpus:
+    cached = (corpus, extract_columns(corpus))
+  _gold_cache[key] = cached
+  while len(_gold_cache) > _GOLD_CACHE_SIZE:
+    _gold_cache.popitem(last=False)
+  return cached[1]
+
+
+def _check_texts_aligned(gold, annotated):
+  mismatches = np.flatnonzero(gold.texts != annotated.texts)
+  if len(mismatches):
+    i = mismatches[0]
+    check.Eq(gold.texts[i], annotated.texts[i], 'Text is not aligned')
+
+
+def _count_correct_parses(gold, annotated):
+  """Returns the number of tokens and of correct POS, UAS and LAS tokens."""
+  _check_texts_aligned(gold, annotated)
+  mismatches = np.flatnonzero(gold.offsets != annotated.offsets)
+  if len(mismatches):
+    i = mismatches[0] - 1
+    check.Eq(gold.offsets[i + 1] - gold.offsets[i],
+             annotated.offsets[i + 1] - annotated.offsets[i],
+             'Tokens are not aligned')
+
+  correct_heads = gold.heads == annotated.heads
+  return (len(gold.heads), np.count_nonzero(gold.tags == annotated.tags),
+          np.count_nonzero(correct_heads),
+          np.count_nonzero(correct_heads & (gold.labels == annotated.labels)))
+
+
+def count_parse_metrics(gold_corpus, annotated_corpus):
+  """Counts the tokens of a batch that are correct for POS/UAS/LAS.
+
+  Unlike calculate_parse_metrics(), the gold corpus is not cached, so that
+  the counts of many batches of a stream can be summed cheaply.
+
+  Args:
+    gold_corpus: List of serialized gold sentences.
+    annotated_corpus: List of serialized annotated sentences, aligned with
+      gold_corpus.
+
+  Returns:
+    Tuple of the number of tokens, and of tokens with correct tags, heads,
+    and heads and labels.
+  """
+  check.Eq(len(gold_corpus), len(annotated_corpus), 'Corpora are not aligned')
+  return _count_correct_parses(extract_columns(gold_corpus),
+                               extract_columns(annotated_corpus))
+
 
 def calculate_parse_metrics(gold_corpus, annotated_corpus):
   """Calculate POS/UAS/LAS accuracy based on gold and annotated sentences."""
   check.Eq(len(gold_corpus), len(annotated_corpus), 'Corpora are not aligned')
-  num_tokens = 0
-  num_correct_pos = 0
-  num_correct_uas = 0
-  num_correct_las = 0
-  for gold_str, annotated_str in zip(gold_corpus, annotated_corpus):
-    gold = sentence_pb2.Sentence()
-    annotated = sentence_pb2.Sentence()
-    gold.ParseFromString(gold_str)
-    annotated.ParseFromString(annotated_str)
-    check.Eq(gold.text, annotated.text, 'Text is not aligned')
-    check.Eq(len(gold.token), len(annotated.token), 'Tokens are not aligned')
-    tokens = zip(gold.token, annotated.token)
-    num_tokens += len(tokens)
-    num_correct_pos += sum(1 for x, y in tokens if x.tag == y.tag)
-    num_correct_uas += sum(1 for x, y in tokens if x.head == y.head)
-    num_correct_las += sum(1 for x, y in tokens
-                           if x.head == y.head and x.label == y.label)
+  num_tokens, num_correct_pos, num_correct_uas, num_correct_las = (
+      _count_correct_parses(_gold_columns(gold_corpus),
+                            extract_columns(annotated_corpus)))
 
   tf.logging.info('Total num documents: %d', len(annotated_corpus))
   tf.logging.info('Total num tokens: %d', num_tokens)
@@ -60,15 +157,36 @@ def parser_summaries(gold_corpus, annotated_corpus):
   return {'POS': pos, 'LAS': las, 'UAS': uas, 'eval_metric': las}
 
 
+def _unique_token_spans(columns):
+  """Returns the (sentence, start, end) spans of the tokens of a corpus.
+
+  Args:
+    columns: SentenceColumns of the corpus.
+
+  Returns:
+    int64 array of shape [num_tokens, 3] with one row per token span, sorted.
+
+  Raises:
+    ValueError: If a token ends before it starts, or a sentence contains two
+      tokens with the same span.
+  """
+  invalid = np.flatnonzero(columns.ends < columns.starts)
+  if len(invalid):
+    check.Ge(columns.ends[invalid[0]], columns.starts[invalid[0]])
+  sentences = np.repeat(np.arange(len(columns.texts)),
+                        np.diff(columns.offsets))
+  spans = np.stack([sentences, columns.starts, columns.ends], axis=1)
+  unique_spans = np.unique(spans, axis=0)
+  check.Eq(len(unique_spans), len(spans), 'Duplicate token')
+  return unique_spans
+
+
 def calculate_segmentation_metrics(gold_corpus, annotated_corpus):
   """Calculate precision/recall/f1 based on gold and annotated sentences."""
   check.Eq(len(gold_corpus), len(annotated_corpus), 'Corpora are not aligned')
-  num_gold_tokens = 0
-  num_test_tokens = 0
-  num_correct_tokens = 0
-  def token_span(token):
-    check.Ge(token.end, token.start)
-    return (token.start, token.end)
+  gold = _gold_columns(gold_corpus)
+  annotated = extract_columns(annotated_corpus)
+  _check_texts_aligned(gold, annotated)
 
   def ratio(numerator, denominator):
     check.Ge(numerator, 0)
@@ -80,23 +198,14 @@ def calculate_segmentation_metrics(gold_corpus, annotated_corpus):
     else:
       return float('inf')  # map x/0 to inf
 
-  for gold_str, annotated_str in zip(gold_corpus, annotated_corpus):
-    gold = sentence_pb2.Sentence()
-    annotated = sentence_pb2.Sentence()
-    gold.ParseFromString(gold_str)
-    annotated.ParseFromString(annotated_str)
-    check.Eq(gold.text, annotated.text, 'Text is not aligned')
-    gold_spans = set()
-    test_spans = set()
-    for token in gold.token:
-      check.NotIn(token_span(token), gold_spans, 'Duplicate token')
-      gold_spans.add(token_span(token))
-    for token in annotated.token:
-      check.NotIn(token_span(token), test_spans, 'Duplicate token')
-      test_spans.add(token_span(token))
-    num_gold_tokens += len(gold_spans)
-    num_test_tokens += len(test_spans)
-    num_correct_tokens += len(gold_spans.intersection(test_spans))
+  gold_spans = _unique_token_spans(gold)
+  test_spans = _unique_token_spans(annotated)
+  num_gold_tokens = len(gold_spans)
+  num_test_tokens = len(test_spans)
+  # Spans are unique within each corpus, so those in both appear twice.
+  _, counts = np.unique(np.concatenate([gold_spans, test_spans]), axis=0,
+                        return_counts=True)
+  num_correct_tokens = int(np.count_nonzero(counts == 2))
 
   tf.logging.info('Total num documents: %d', len(annotated_corpus))
   tf.logging.info('Total gold tokens: %d', num_gold_tokens)
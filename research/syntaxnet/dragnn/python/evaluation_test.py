@@ -53,6 +53,36 @@ class EvaluationTest(tf.test.TestCase):
     self.assertEqual(50, uas)
     self.assertEqual(25, las)
 
+  def testCalculateParseMetricsCachesGoldColumns(self):
+    evaluation._gold_cache.clear()
+    with tf.test.mock.patch.object(
+        evaluation, 'extract_columns',
+        wraps=evaluation.extract_columns) as extract_columns:
+      evaluation.calculate_parse_metrics(self._gold_corpus, self._test_corpus)
+      pos, uas, las = evaluation.calculate_parse_metrics(
+          list(self._gold_corpus), self._gold_corpus)
+
+    # The gold corpus is only extracted once, even as a different list.
+    self.assertEqual(3, extract_columns.call_count)
+    self.assertEqual(100, pos)
+    self.assertEqual(100, uas)
+    self.assertEqual(100, las)
+
+  def testCountParseMetrics(self):
+    self.assertEqual((4, 3, 2, 1),
+                     evaluation.count_parse_metrics(self._gold_corpus,
+                                                    self._test_corpus))
+    self.assertEqual((1, 1, 1, 1),
+                     evaluation.count_parse_metrics(self._gold_corpus[:1],
+                                                    self._test_corpus[:1]))
+
+  def testCalculateParseMetricsUnalignedCorpora(self):
+    self._add_sentence(['DT'], [-1], ['ROOT'], self._gold_corpus)
+    self._add_sentence(['DT', 'NN'], [1, -1], ['det', 'ROOT'],
+                       self._test_corpus)
+    with self.assertRaisesRegexp(ValueError, 'Tokens are not aligned'):
+      evaluation.calculate_parse_metrics(self._gold_corpus, self._test_corpus)
+
   def testCalculateSegmentationMetrics(self):
     self._gold_corpus = []
     self._test_corpus = []
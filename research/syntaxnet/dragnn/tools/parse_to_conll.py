@@ -13,10 +13,24 @@
 # limitations under the License.
 # ==============================================================================
 r"""Runs a both a segmentation and parsing model on a CoNLL dataset.
+
+By default the whole corpus is read, segmented and then parsed in two passes.
+With --streaming, sentences are instead read lazily and flow through a
+pipeline of threads connected by bounded queues:
+
+  reader -> [segmenter] -> parser -> writer
+
+Before each model stage, sentences are grouped into batches of similar token
+counts, which reduces the padding work done by the beams. The writer restores
+the input order and writes sentences as soon as they are ready, and the
+throughput and per-stage batch latencies are logged at the end.
 """
 
+import collections
 import re
+import threading
 import time
+from six.moves import queue
 import tensorflow as tf
 
 from tensorflow.python.client import timeline
@@ -62,6 +76,26 @@ flags.DEFINE_string('timeline_output_file', '', 'Path to save timeline to. '
                     'If specified, the final iteration of the evaluation loop '
                     'will capture and save a TensorFlow timeline.')
 
+flags.DEFINE_bool('streaming', False, 'Whether to stream sentences through '
+                  'overlapping segmenter and parser stages instead of '
+                  'processing the whole corpus in two passes.')
+flags.DEFINE_integer('read_batch_size', 256, 'Number of sentences read at a '
+                     'time in streaming mode.')
+flags.DEFINE_integer('bucket_width', 4, 'In streaming mode, sentences whose '
+                     'token counts divided by this width are equal are '
+                     'batched together.')
+flags.DEFINE_integer('max_pending_sentences', 50000, 'In streaming mode, the '
+                     'maximum number of sentences waiting in partially filled '
+                     'buckets, and the maximum number of later sentences a '
+                     'waiting sentence is held back by, before the bucket of '
+                     'the oldest waiting sentence is processed.')
+flags.DEFINE_integer('queue_size', 4, 'In streaming mode, the number of '
+                     'batches buffered between consecutive stages.')
+
+# Name of the input and output tensors of the saved models.
+_INPUT_BATCH = 'annotation/ComputeSession/InputBatch:0'
+_ANNOTATIONS = 'annotation/annotations:0'
+
 
 def get_segmenter_corpus(input_data_path, use_text_format):
   """Reads in a character corpus for segmenting."""
@@ -109,16 +143,13 @@ def run_segmenter(input_data, segmenter_model, session_config, max_batch_size,
     for start in range(0, len(input_data), max_batch_size):
       # Prepare the inputs.
       end = min(start + max_batch_size, len(input_data))
-      feed_dict = {
-          'annotation/ComputeSession/InputBatch:0': input_data[start:end]
-      }
-      output_node = 'annotation/annotations:0'
+      feed_dict = {_INPUT_BATCH: input_data[start:end]}
 
       # Process.
       tf.logging.info('Processing examples %d to %d' % (start, end))
       if timeline_output_file and end == len(input_data):
         serialized_annotations = sess.run(
-            output_node,
+            _ANNOTATIONS,
             feed_dict=feed_dict,
             options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
             run_metadata=run_metadata)
@@ -126,7 +157,7 @@ def run_segmenter(input_data, segmenter_model, session_config, max_batch_size,
         with open(timeline_output_file, 'w') as trace_file:
           trace_file.write(trace.generate_chrome_trace_format())
       else:
-        serialized_annotations = sess.run(output_node, feed_dict=feed_dict)
+        serialized_annotations = sess.run(_ANNOTATIONS, feed_dict=feed_dict)
 
       # Save the outputs.
       processed.extend(serialized_annotations)
@@ -172,20 +203,17 @@ def run_parser(input_data, parser_model, session_config, beam_sizes,
     for start in range(0, len(input_data), max_batch_size):
       # Set up the input and output.
       end = min(start + max_batch_size, len(input_data))
-      feed_dict = {
-          'annotation/ComputeSession/InputBatch:0': input_data[start:end]
-      }
+      feed_dict = {_INPUT_BATCH: input_data[start:end]}
       for comp, beam_size in beam_sizes:
         feed_dict['%s/InferenceBeamSize:0' % comp] = beam_size
       for comp in locally_normalized_components:
         feed_dict['%s/LocallyNormalize:0' % comp] = True
-      output_node = 'annotation/annotations:0'
 
       # Process.
       tf.logging.info('Processing examples %d to %d' % (start, end))
       if timeline_output_file and end == len(input_data):
         serialized_annotations = sess.run(
-            output_node,
+            _ANNOTATIONS,
             feed_dict=feed_dict,
             options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
             run_metadata=run_metadata)
@@ -193,7 +221,7 @@ def run_parser(input_data, parser_model, session_config, beam_sizes,
         with open(timeline_output_file, 'w') as trace_file:
           trace_file.write(trace.generate_chrome_trace_format())
       else:
-        serialized_annotations = sess.run(output_node, feed_dict=feed_dict)
+        serialized_annotations = sess.run(_ANNOTATIONS, feed_dict=feed_dict)
 
       processed.extend(serialized_annotations)
 
@@ -206,6 +234,25 @@ def run_parser(input_data, parser_model, session_config, beam_sizes,
   return processed
 
 
+def write_header(f, use_text_format, use_gold_segmentation):
+  """Writes the header of a CoNLL output file."""
+  f.write('## tf:{}\n'.format(use_text_format))
+  f.write('## gs:{}\n'.format(use_gold_segmentation))
+
+
+def write_sentence(f, serialized_sentence):
+  """Writes a serialized sentence to a CoNLL output file."""
+  sentence = sentence_pb2.Sentence()
+  sentence.ParseFromString(serialized_sentence)
+  f.write('# text = {}\n'.format(sentence.text.encode('utf-8')))
+  for i, token in enumerate(sentence.token):
+    head = token.head + 1
+    f.write('%s\t%s\t_\t_\t_\t_\t%d\t%s\t_\t_\n' %
+            (i + 1, token.word.encode('utf-8'), head,
+             token.label.encode('utf-8')))
+  f.write('\n')
+
+
 def print_output(output_file, use_text_format, use_gold_segmentation, output):
   """Writes a set of sentences in CoNLL format.
 
@@ -216,18 +263,385 @@ def print_output(output_file, use_text_format, use_gold_segmentation, output):
     output: A list of sentences to write to the output file.
   """
   with gfile.GFile(output_file, 'w') as f:
-    f.write('## tf:{}\n'.format(use_text_format))
-    f.write('## gs:{}\n'.format(use_gold_segmentation))
+    write_header(f, use_text_format, use_gold_segmentation)
     for serialized_sentence in output:
-      sentence = sentence_pb2.Sentence()
-      sentence.ParseFromString(serialized_sentence)
-      f.write('# text = {}\n'.format(sentence.text.encode('utf-8')))
-      for i, token in enumerate(sentence.token):
-        head = token.head + 1
-        f.write('%s\t%s\t_\t_\t_\t_\t%d\t%s\t_\t_\n' %
-                (i + 1, token.word.encode('utf-8'), head,
-                 token.label.encode('utf-8')))
-      f.write('\n')
+      write_sentence(f, serialized_sentence)
+
+
+def read_sentence_batches(input_data_path, use_text_format, for_segmenter,
+                          batch_size):
+  """Lazily reads batches of serialized sentences.
+
+  Args:
+    input_data_path: Path to the input corpus.
+    use_text_format: Whether the input is untokenized text. Only used if
+      for_segmenter is true; the parser always reads CoNLL input.
+    for_segmenter: Whether to produce character-tokenized sentences for the
+      segmenter.
+    batch_size: Number of sentences read at a time.
+
+  Yields:
+    Lists of serialized sentences.
+  """
+  if for_segmenter and use_text_format:
+    reader = sentence_io.FormatSentenceReader(
+        input_data_path, 'untokenized-text', batch_size=batch_size)
+  else:
+    reader = sentence_io.ConllSentenceReader(input_data_path,
+                                             batch_size=batch_size)
+
+  char_session = None
+  if for_segmenter and not use_text_format:
+    char_graph = tf.Graph()
+    with char_graph.as_default():
+      documents = tf.placeholder(tf.string, [None])
+      char_input = gen_parser_ops.char_token_generator(documents)
+    char_session = tf.Session(graph=char_graph)
+
+  while True:
+    sentences, is_last = reader.read()
+    if len(sentences) and char_session:
+      char_sentences = char_session.run(char_input,
+                                        feed_dict={documents: sentences})
+      check.Eq(len(sentences), len(char_sentences))
+      sentences = char_sentences
+    if len(sentences):
+      yield list(sentences)
+    if is_last:
+      break
+  if char_session:
+    char_session.close()
+
+
+# A batch of sentences flowing through the streaming pipeline. indices are the
+# positions of the sentences in the input, sentences the serialized sentences,
+# and lengths their numbers of tokens.
+_Batch = collections.namedtuple('_Batch', ['indices', 'sentences', 'lengths'])
+
+# Put on a queue after the last batch.
+_END_OF_INPUT = None
+
+
+class _StageError(object):
+  """Passed down the pipeline when a stage fails."""
+
+  def __init__(self, stage_name, error):
+    self.stage_name = stage_name
+    self.error = error
+
+
+class LengthBucketer(object):
+  """Groups sentences with similar numbers of tokens into batches."""
+
+  def __init__(self, max_batch_size, bucket_width, max_pending_sentences):
+    """Initializes the bucketer.
+
+    Args:
+      max_batch_size: Number of sentences in a full batch.
+      bucket_width: Sentences with the same number of tokens divided by this
+        width go into the same bucket.
+      max_pending_sentences: When more sentences than this are waiting, or
+        the oldest waiting sentence is this many indices behind the newest
+        added one, the bucket of the oldest waiting sentence is emitted before
+        it is full. This bounds how long a sentence of a rare length holds
+        back the in-order output.
+    """
+    self._max_batch_size = max_batch_size
+    self._bucket_width = bucket_width
+    self._max_pending_sentences = max_pending_sentences
+    self._buckets = collections.defaultdict(list)
+    self._oldest_index = {}  # Smallest index in each bucket.
+    self._newest_index = -1
+    self._num_pending = 0
+
+  def add(self, index, serialized_sentence):
+    """Adds a sentence, and returns a list of the batches now ready."""
+    sentence = sentence_pb2.Sentence()
+    sentence.ParseFromString(serialized_sentence)
+    length = len(sentence.token)
+    key = length // self._bucket_width
+    self._buckets[key].append((index, serialized_sentence, length))
+    self._oldest_index[key] = min(self._oldest_index.get(key, index), index)
+    self._newest_index = max(self._newest_index, index)
+    self._num_pending += 1
+    if len(self._buckets[key]) >= self._max_batch_size:
+      return [self._pop(key)]
+    oldest_key = min(self._oldest_index, key=self._oldest_index.get)
+    if (self._num_pending > self._max_pending_sentences or
+        self._newest_index - self._oldest_index[oldest_key] >=
+        self._max_pending_sentences):
+      return [self._pop(oldest_key)]
+    return []
+
+  def flush(self):
+    """Returns batches holding all the remaining sentences."""
+    return [self._pop(key) for key in sorted(self._buckets)]
+
+  def _pop(self, key):
+    bucket = self._buckets.pop(key)
+    del self._oldest_index[key]
+    self._num_pending -= len(bucket)
+    return _Batch(*zip(*bucket))
+
+
+class _InOrderBuffer(object):
+  """Restores the input order of the sentences coming out of the pipeline."""
+
+  def __init__(self):
+    self._pending = {}
+    self.num_released = 0
+    # Largest number of sentences held back at once.
+    self.max_pending = 0
+
+  def __len__(self):
+    return len(self._pending)
+
+  def add(self, batch):
+    """Adds an annotated batch, and returns the sentences now in order."""
+    self._pending.update(zip(batch.indices, batch.sentences))
+    self.max_pending = max(self.max_pending, len(self._pending))
+    ready = []
+    while self.num_released in self._pending:
+      ready.append(self._pending.pop(self.num_released))
+      self.num_released += 1
+    return ready
+
+
+class StageStats(object):
+  """Throughput and batch latency of a stage of the streaming pipeline."""
+
+  def __init__(self, name):
+    self.name = name
+    self.num_batches = 0
+    self.num_sentences = 0
+    self.num_tokens = 0
+    self.num_padded_tokens = 0
+    self.total_latency = 0.0
+    self.max_latency = 0.0
+
+  def record(self, batch, latency):
+    self.num_batches += 1
+    self.num_sentences += len(batch.sentences)
+    self.num_tokens += sum(batch.lengths)
+    self.num_padded_tokens += len(batch.lengths) * max(batch.lengths)
+    self.total_latency += latency
+    self.max_latency = max(self.max_latency, latency)
+
+  def log(self):
+    if not self.num_batches:
+      return
+    tf.logging.info(
+        '%s: %d sentences in %d batches, %.1f sentences/sec while busy, '
+        'batch latency %.1f ms mean / %.1f ms max, %.1f%% of the batch '
+        'tokens are padding.', self.name, self.num_sentences,
+        self.num_batches, self.num_sentences / max(self.total_latency, 1e-9),
+        1000 * self.total_latency / self.num_batches, 1000 * self.max_latency,
+        100.0 * (1 - self.num_tokens / float(max(self.num_padded_tokens, 1))))
+
+
+def _run_stage(name, body, out_queue):
+  """Runs body() in a daemon thread, reporting failures on out_queue."""
+
+  def _target():
+    try:
+      body()
+    except Exception as e:  # pylint: disable=broad-except
+      out_queue.put(_StageError(name, e))
+
+  thread = threading.Thread(target=_target, name=name)
+  thread.daemon = True
+  thread.start()
+  return thread
+
+
+def _feed_bucketer(bucketer, indices, sentences, out_queue):
+  for index, sentence in zip(indices, sentences):
+    for batch in bucketer.add(index, sentence):
+      out_queue.put(batch)
+
+
+def _make_model_stage(sess, feeds, in_queue, out_queue, bucketer, stats,
+                      on_annotated=None):
+  """Returns the body of a stage that annotates batches with a model.
+
+  Args:
+    sess: Session holding a loaded saved model.
+    feeds: Additional feeds of each run.
+    in_queue: Queue of input batches.
+    out_queue: Queue the annotated sentences are put on.
+    bucketer: If not None, the annotated sentences are re-bucketed by this
+      LengthBucketer before they are put on out_queue. Otherwise each batch
+      is put on out_queue as is.
+    stats: StageStats of the stage.
+    on_annotated: Optional function called with each input batch and its
+      annotations.
+  """
+
+  def _body():
+    while True:
+      batch = in_queue.get()
+      if batch is _END_OF_INPUT or isinstance(batch, _StageError):
+        break
+      start_time = time.time()
+      feed_dict = {_INPUT_BATCH: list(batch.sentences)}
+      feed_dict.update(feeds)
+      annotations = sess.run(_ANNOTATIONS, feed_dict=feed_dict)
+      stats.record(batch, time.time() - start_time)
+      if on_annotated:
+        on_annotated(batch, annotations)
+      if bucketer:
+        _feed_bucketer(bucketer, batch.indices, annotations, out_queue)
+      else:
+        out_queue.put(_Batch(batch.indices, annotations, batch.lengths))
+    if bucketer and batch is _END_OF_INPUT:
+      for remaining in bucketer.flush():
+        out_queue.put(remaining)
+    out_queue.put(batch)
+
+  return _body
+
+
+def _load_saved_model(saved_model, session_config):
+  sess = tf.Session(graph=tf.Graph(), config=session_config)
+  with sess.graph.as_default():
+    tf.saved_model.loader.load(sess, [tf.saved_model.tag_constants.SERVING],
+                               saved_model)
+  return sess
+
+
+def run_streaming(input_data_path, use_text_format, segmenter_model,
+                  parser_model, session_config, beam_sizes,
+                  locally_normalized_components, max_batch_size, output_file,
+                  read_batch_size, bucket_width, max_pending_sentences,
+                  queue_size):
+  """Segments and parses a corpus with a streaming pipeline.
+
+  Args:
+    input_data_path: Path to the input corpus.
+    use_text_format: Whether the input is untokenized text.
+    segmenter_model: Path to the segmenter SavedModel, or None to use the gold
+      segmentation of the input.
+    parser_model: Path to the parser SavedModel.
+    session_config: A session configuration object.
+    beam_sizes: A list of (component name, beam size) pairs.
+    locally_normalized_components: A list of components to normalize.
+    max_batch_size: The maximum batch size to use.
+    output_file: Path to write the annotated sentences to, or empty to only
+      report statistics.
+    read_batch_size: Number of sentences read at a time.
+    bucket_width: See LengthBucketer.
+    max_pending_sentences: See LengthBucketer.
+    queue_size: Number of batches buffered between consecutive stages.
+
+  Returns:
+    The number of annotated sentences.
+  """
+  use_segmenter = segmenter_model is not None
+  parser_queue = queue.Queue(queue_size)
+  results_queue = queue.Queue(queue_size)
+  sessions = []
+  threads = []
+  stats = []
+
+  tf.logging.info('Initializing parser model...')
+  parser_session = _load_saved_model(parser_model, session_config)
+  sessions.append(parser_session)
+  parser_feeds = {}
+  for comp, beam_size in beam_sizes:
+    parser_feeds['%s/InferenceBeamSize:0' % comp] = beam_size
+  for comp in locally_normalized_components:
+    parser_feeds['%s/LocallyNormalize:0' % comp] = True
+
+  def _new_bucketer():
+    return LengthBucketer(max_batch_size, bucket_width, max_pending_sentences)
+
+  if use_segmenter:
+    tf.logging.info('Initializing segmentation model...')
+    segmenter_session = _load_saved_model(segmenter_model, session_config)
+    sessions.append(segmenter_session)
+    segmenter_queue = queue.Queue(queue_size)
+    stats.append(StageStats('Segmenter'))
+    threads.append(_run_stage(
+        'segmenter',
+        _make_model_stage(segmenter_session, {}, segmenter_queue, parser_queue,
+                          _new_bucketer(), stats[-1]), parser_queue))
+    reader_queue = segmenter_queue
+  else:
+    reader_queue = parser_queue
+  # Accuracy of the parser against its input, as reported by run_parser().
+  batch_counts = []
+
+  def _count_correct(batch, annotations):
+    batch_counts.append(
+        evaluation.count_parse_metrics(batch.sentences, annotations))
+
+  stats.append(StageStats('Parser'))
+  threads.append(_run_stage(
+      'parser',
+      _make_model_stage(parser_session, parser_feeds, parser_queue,
+                        results_queue, None, stats[-1], _count_correct),
+      results_queue))
+
+  def _read():
+    bucketer = _new_bucketer()
+    num_read = 0
+    for sentences in read_sentence_batches(input_data_path, use_text_format,
+                                           use_segmenter, read_batch_size):
+      _feed_bucketer(bucketer, range(num_read, num_read + len(sentences)),
+                     sentences, reader_queue)
+      num_read += len(sentences)
+    for batch in bucketer.flush():
+      reader_queue.put(batch)
+    reader_queue.put(_END_OF_INPUT)
+
+  threads.append(_run_stage('reader', _read, reader_queue))
+
+  # Write the results in input order as they become available.
+  output = gfile.GFile(output_file, 'w') if output_file else None
+  if output:
+    write_header(output, use_text_format, not use_segmenter)
+  # The buckets emit their oldest sentence after at most
+  # max_pending_sentences later ones, so the sentences held back here are
+  # bounded by the pipeline parameters rather than the input size.
+  in_order = _InOrderBuffer()
+  start_time = time.time()
+  while True:
+    batch = results_queue.get()
+    if isinstance(batch, _StageError):
+      raise RuntimeError('%s stage failed: %r' % (batch.stage_name,
+                                                  batch.error))
+    if batch is _END_OF_INPUT:
+      break
+    for sentence in in_order.add(batch):
+      if output:
+        write_sentence(output, sentence)
+    tf.logging.vlog(1, 'Annotated %d sentences (%.1f sentences/sec), %d held '
+                    'back.', in_order.num_released,
+                    in_order.num_released / (time.time() - start_time),
+                    len(in_order))
+  check.Eq(len(in_order), 0, 'Sentences were lost in the pipeline')
+  num_written = in_order.num_released
+  if output:
+    output.close()
+
+  for thread in threads:
+    thread.join()
+  for sess in sessions:
+    sess.close()
+
+  tf.logging.info('Annotated %d sentences in %.2f seconds (%.1f '
+                  'sentences/sec).', num_written, time.time() - start_time,
+                  num_written / max(time.time() - start_time, 1e-9))
+  for stage_stats in stats:
+    stage_stats.log()
+  tf.logging.info('At most %d annotated sentences were held back to restore '
+                  'the input order.', in_order.max_pending)
+  num_tokens, _, num_correct_uas, num_correct_las = [
+      sum(counts) for counts in zip(*batch_counts)] or [0] * 4
+  if num_tokens:
+    tf.logging.info('UAS: %.2f', num_correct_uas * 100.0 / num_tokens)
+    tf.logging.info('LAS: %.2f', num_correct_las * 100.0 / num_tokens)
+  return num_written
 
 
 def main(unused_argv):
@@ -254,6 +668,18 @@ def main(unused_argv):
       intra_op_parallelism_threads=FLAGS.threads,
       inter_op_parallelism_threads=FLAGS.threads)
 
+  if FLAGS.streaming:
+    if FLAGS.timeline_output_file:
+      tf.logging.warning('--timeline_output_file is ignored with --streaming.')
+    run_streaming(FLAGS.input_file, FLAGS.text_format,
+                  FLAGS.segmenter_saved_model, FLAGS.parser_saved_model,
+                  session_config, component_beam_sizes,
+                  components_to_locally_normalize, FLAGS.max_batch_size,
+                  FLAGS.output_file, FLAGS.read_batch_size,
+                  FLAGS.bucket_width, FLAGS.max_pending_sentences,
+                  FLAGS.queue_size)
+    return
+
   # Get the segmented input data for the parser, either by running the
   # segmenter ourselves or by simply reading it from the CoNLL file.
   if FLAGS.segmenter_saved_model is None:
@@ -0,0 +1,128 @@
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for the streaming pipeline of parse_to_conll."""
+
+import tensorflow as tf
+
+from dragnn.tools import parse_to_conll
+from syntaxnet import sentence_pb2
+
+
+def _sentence(num_tokens):
+  """Returns a serialized sentence with num_tokens tokens."""
+  sentence = sentence_pb2.Sentence()
+  for _ in range(num_tokens):
+    sentence.token.add(word='x', start=0, end=0)
+  return sentence.SerializeToString()
+
+
+class LengthBucketerTest(tf.test.TestCase):
+
+  def testFullBucketsAreEmitted(self):
+    bucketer = parse_to_conll.LengthBucketer(
+        max_batch_size=2, bucket_width=4, max_pending_sentences=10)
+    self.assertEqual([], bucketer.add(0, _sentence(1)))
+    self.assertEqual([], bucketer.add(1, _sentence(5)))
+    batches = bucketer.add(2, _sentence(3))
+
+    # Sentences 0 and 2 both have fewer than 4 tokens.
+    self.assertEqual(1, len(batches))
+    self.assertEqual((0, 2), batches[0].indices)
+    self.assertEqual((_sentence(1), _sentence(3)), batches[0].sentences)
+    self.assertEqual((1, 3), batches[0].lengths)
+
+  def testOldestBucketIsEmittedWhenTooManyArePending(self):
+    bucketer = parse_to_conll.LengthBucketer(
+        max_batch_size=10, bucket_width=2, max_pending_sentences=3)
+    self.assertEqual([], bucketer.add(0, _sentence(1)))
+    self.assertEqual([], bucketer.add(1, _sentence(4)))
+    self.assertEqual([], bucketer.add(2, _sentence(5)))
+    batches = bucketer.add(3, _sentence(4))
+
+    # Sentence 0 is alone in its bucket, but the oldest.
+    self.assertEqual(1, len(batches))
+    self.assertEqual((0,), batches[0].indices)
+    self.assertEqual((1,), batches[0].lengths)
+
+    # Only the emitted sentences stop counting as pending.
+    batches = bucketer.add(4, _sentence(8))
+    self.assertEqual(1, len(batches))
+    self.assertEqual((1, 2, 3), batches[0].indices)
+
+  def testOldBucketIsEmittedWhenFewArePending(self):
+    bucketer = parse_to_conll.LengthBucketer(
+        max_batch_size=3, bucket_width=2, max_pending_sentences=4)
+    self.assertEqual([], bucketer.add(0, _sentence(9)))
+    self.assertEqual([], bucketer.add(1, _sentence(1)))
+    self.assertEqual([], bucketer.add(2, _sentence(1)))
+    self.assertEqual([(1, 2, 3)],
+                     [b.indices for b in bucketer.add(3, _sentence(1))])
+
+    # Only two sentences are pending, but sentence 0 is now 4 indices behind
+    # the newest one.
+    self.assertEqual([(0,)],
+                     [b.indices for b in bucketer.add(4, _sentence(1))])
+    self.assertEqual([(4,)], [b.indices for b in bucketer.flush()])
+
+  def testOutputOrderIsRestoredWithBoundedDelay(self):
+    max_batch_size = 8
+    max_pending_sentences = 32
+    stages = [
+        parse_to_conll.LengthBucketer(max_batch_size, 4,
+                                      max_pending_sentences)
+        for _ in range(2)
+    ]
+    in_order = parse_to_conll._InOrderBuffer()
+    output = []
+
+    def _run(stage, batches):
+      if stage == len(stages):
+        for batch in batches:
+          output.extend(in_order.add(batch))
+        return
+      for batch in batches:
+        # Later stages see the sentences in the order they were emitted.
+        for index, sentence in zip(batch.indices, batch.sentences):
+          _run(stage + 1, stages[stage].add(index, sentence))
+
+    # Rare long sentences interleaved with common short ones.
+    sentences = [_sentence(40 + i % 3 if i % 50 == 7 else 1 + i % 6)
+                 for i in range(2000)]
+    _run(0, [parse_to_conll._Batch(range(len(sentences)), sentences,
+                                   [0] * len(sentences))])
+    for stage in range(len(stages)):
+      _run(stage + 1, stages[stage].flush())
+
+    self.assertEqual(sentences, output)
+    self.assertEqual(0, len(in_order))
+    self.assertLessEqual(in_order.max_pending,
+                         len(stages) * (max_pending_sentences + max_batch_size))
+
+  def testFlushEmitsRemainingBucketsByLength(self):
+    bucketer = parse_to_conll.LengthBucketer(
+        max_batch_size=10, bucket_width=2, max_pending_sentences=10)
+    for index, num_tokens in enumerate([7, 0, 3, 1, 6]):
+      self.assertEqual([], bucketer.add(index, _sentence(num_tokens)))
+
+    batches = bucketer.flush()
+    self.assertEqual([(1, 3), (2,), (0, 4)],
+                     [batch.indices for batch in batches])
+    self.assertEqual([(0, 1), (3,), (7, 6)],
+                     [batch.lengths for batch in batches])
+    self.assertEqual([], bucketer.flush())
+
+
+if __name__ == '__main__':
+  tf.test.main()
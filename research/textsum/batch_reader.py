@@ -34,6 +34,7 @@ ModelInput = namedtuple('ModelInput',
 
 BUCKET_CACHE_BATCH = 100
 QUEUE_NUM_BATCH = 100
+BUCKET_WIDTH = 10
 
 
 class Batcher(object):
@@ -263,3 +264,189 @@ class Batcher(object):
       feature: a feature text extracted.
     """
     return ex.features.feature[key].bytes_list.value[0]
+
+
+class DatasetBatcher(object):
+  """Batch reader built on tf.data, with bucketing support.
+
+  Produces the same batches as Batcher, but parses examples, splits
+  sentences, looks up word ids in a precomputed table and pads inside a
+  tf.data pipeline, so that the work runs in parallel across cores instead of
+  in Python threads contending for the GIL. The pipeline runs in its own graph
+  and session, and NextBatch() has the same interface as Batcher.NextBatch().
+  """
+
+  def __init__(self, data_path, vocab, hps,
+               article_key, abstract_key, max_article_sentences,
+               max_abstract_sentences, bucketing=True, truncate_input=False,
+               num_parallel_calls=16):
+    """DatasetBatcher constructor.
+
+    Args:
+      data_path: tf.Example filepattern.
+      vocab: Vocabulary.
+      hps: Seq2SeqAttention model hyperparameters.
+      article_key: article feature key in tf.Example.
+      abstract_key: abstract feature key in tf.Example.
+      max_article_sentences: Max number of sentences used from article.
+      max_abstract_sentences: Max number of sentences used from abstract.
+      bucketing: Whether bucket articles of similar length into the same batch.
+      truncate_input: Whether to truncate input that is too long. Alternative is
+        to discard such examples.
+      num_parallel_calls: Number of examples to process in parallel.
+    """
+    self._data_path = data_path
+    self._vocab = vocab
+    self._hps = hps
+    self._article_key = article_key
+    self._abstract_key = abstract_key
+    self._max_article_sentences = max_article_sentences
+    self._max_abstract_sentences = max_abstract_sentences
+    self._bucketing = bucketing
+    self._truncate_input = truncate_input
+    self._num_parallel_calls = num_parallel_calls
+
+    self._graph = tf.Graph()
+    with self._graph.as_default():
+      self._next_batch = self._BuildDataset().make_initializable_iterator()
+      init_ops = [self._next_batch.initializer, tf.tables_initializer()]
+      self._next_batch = self._next_batch.get_next()
+    self._sess = tf.Session(graph=self._graph)
+    self._sess.run(init_ops)
+
+  def NextBatch(self):
+    """Returns a batch of inputs for seq2seq attention model.
+
+    Returns:
+      See Batcher.NextBatch().
+    """
+    (enc_batch, dec_batch, target_batch, enc_input_lens, dec_output_lens,
+     loss_weights, origin_articles, origin_abstracts) = self._sess.run(
+         self._next_batch)
+    return (enc_batch, dec_batch, target_batch, enc_input_lens,
+            dec_output_lens, loss_weights, origin_articles.tolist(),
+            origin_abstracts.tolist())
+
+  def _SentenceWords(self, text, max_sentences):
+    """Returns the words of the sentences of text.
+
+    Equivalent to data.ToSentences(text, include_token=False), followed by
+    taking the words of the first max_sentences sentences, and of all the
+    sentences.
+
+    Args:
+      text: Scalar string Tensor.
+      max_sentences: Maximum number of sentences to take the first words from.
+
+    Returns:
+      first_words: 1-D string Tensor of the words of the first max_sentences
+        sentences.
+      all_words: 1-D string Tensor of the words of all the sentences, which
+        joined with spaces are the original text of Batcher.
+    """
+    words = tf.string_split(tf.expand_dims(text, 0)).values
+    is_start = tf.equal(words, data.SENTENCE_START)
+    is_end = tf.equal(words, data.SENTENCE_END)
+    # Index (starting at 1) of the sentence that each word is in.
+    sentence = tf.cumsum(tf.to_int32(is_start))
+    num_ended = tf.cumsum(tf.to_int32(is_end), exclusive=True)
+    num_complete = tf.reduce_sum(tf.to_int32(is_end))
+    in_sentence = tf.logical_and(
+        tf.logical_and(tf.greater(sentence, num_ended),
+                       tf.logical_not(tf.logical_or(is_start, is_end))),
+        tf.less_equal(sentence, num_complete))
+    first = tf.logical_and(in_sentence,
+                           tf.less_equal(sentence, max_sentences))
+    return (tf.boolean_mask(words, first),
+            tf.boolean_mask(words, in_sentence))
+
+  def _BuildDataset(self):
+    """Builds the tf.data pipeline of padded, bucketed batches."""
+    hps = self._hps
+    start_id = self._vocab.WordToId(data.SENTENCE_START)
+    end_id = self._vocab.WordToId(data.SENTENCE_END)
+    pad_id = self._vocab.WordToId(data.PAD_TOKEN)
+    # Precomputed table from words to ids, with unknown words mapped to the id
+    # of the unknown token as in data.GetWordIds.
+    table = tf.contrib.lookup.index_table_from_tensor(
+        mapping=[self._vocab.IdToWord(i)
+                 for i in xrange(self._vocab.NumIds())],
+        default_value=self._vocab.WordToId(data.UNKNOWN_TOKEN))
+
+    def _Parse(serialized):
+      """Converts a serialized tf.Example to unpadded ids and texts."""
+      features = tf.parse_single_example(serialized, {
+          self._article_key: tf.FixedLenFeature([], tf.string, ''),
+          self._abstract_key: tf.FixedLenFeature([], tf.string, ''),
+      })
+      article_words, all_article_words = self._SentenceWords(
+          features[self._article_key], self._max_article_sentences)
+      abstract_words, all_abstract_words = self._SentenceWords(
+          features[self._abstract_key], self._max_abstract_sentences)
+      enc_inputs = tf.to_int32(table.lookup(article_words))
+      # Use the <s> as the <GO> symbol for decoder inputs.
+      dec_inputs = tf.concat(
+          [[start_id], tf.to_int32(table.lookup(abstract_words))], 0)
+      return (enc_inputs, dec_inputs,
+              tf.reduce_join(all_article_words, separator=' '),
+              tf.reduce_join(all_abstract_words, separator=' '))
+
+    def _KeepExample(enc_inputs, dec_inputs, unused_article,
+                     unused_abstract):
+      """Filters out too-short, and unless truncating too-long, input."""
+      enc_len = tf.size(enc_inputs)
+      dec_len = tf.size(dec_inputs)
+      keep = tf.logical_and(tf.greater_equal(enc_len, hps.min_input_len),
+                            tf.greater_equal(dec_len, hps.min_input_len))
+      if not self._truncate_input:
+        keep = tf.logical_and(keep, tf.logical_and(
+            tf.less_equal(enc_len, hps.enc_timesteps),
+            tf.less_equal(dec_len, hps.dec_timesteps)))
+      return keep
+
+    def _Pad(enc_inputs, dec_inputs, article, abstract):
+      """Truncates and pads the ids to the model's number of timesteps."""
+      enc_inputs = enc_inputs[:hps.enc_timesteps]
+      dec_inputs = dec_inputs[:hps.dec_timesteps]
+      # targets is dec_inputs without <s> at beginning, plus </s> at end
+      targets = tf.concat([dec_inputs[1:], [end_id]], 0)
+      enc_input_len = tf.size(enc_inputs)
+      dec_output_len = tf.size(targets)
+      enc_inputs = tf.pad(enc_inputs,
+                          [[0, hps.enc_timesteps - enc_input_len]],
+                          constant_values=pad_id)
+      dec_inputs = tf.pad(dec_inputs,
+                          [[0, hps.dec_timesteps - tf.size(dec_inputs)]],
+                          constant_values=end_id)
+      targets = tf.pad(targets, [[0, hps.dec_timesteps - dec_output_len]],
+                       constant_values=end_id)
+      loss_weights = tf.sequence_mask(dec_output_len, hps.dec_timesteps,
+                                      dtype=tf.float32)
+      enc_inputs.set_shape([hps.enc_timesteps])
+      dec_inputs.set_shape([hps.dec_timesteps])
+      targets.set_shape([hps.dec_timesteps])
+      return (enc_inputs, dec_inputs, targets, enc_input_len, dec_output_len,
+              loss_weights, article, abstract)
+
+    def _Batch(dataset):
+      """Batches a dataset into full batches of hps.batch_size."""
+      dataset = dataset.batch(hps.batch_size)
+      return dataset.filter(
+          lambda *batch: tf.equal(tf.shape(batch[0])[0], hps.batch_size))
+
+    dataset = tf.data.Dataset.from_generator(
+        lambda: data.SerializedExampleGen(self._data_path), tf.string,
+        tf.TensorShape([]))
+    dataset = dataset.map(_Parse, num_parallel_calls=self._num_parallel_calls)
+    dataset = dataset.filter(_KeepExample)
+    dataset = dataset.map(_Pad, num_parallel_calls=self._num_parallel_calls)
+    if self._bucketing:
+      # Group articles of similar length into the same batch.
+      dataset = dataset.apply(tf.contrib.data.group_by_window(
+          key_func=lambda *ex: tf.to_int64(ex[3] // BUCKET_WIDTH),
+          reduce_func=lambda unused_key, window: _Batch(window),
+          window_size=hps.batch_size))
+    else:
+      dataset = _Batch(dataset)
+    dataset = dataset.shuffle(QUEUE_NUM_BATCH)
+    return dataset.prefetch(QUEUE_NUM_BATCH)
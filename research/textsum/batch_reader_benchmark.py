@@ -0,0 +1,91 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Measures the throughput of the Batcher and DatasetBatcher input pipelines."""
+import time
+
+from six.moves import xrange
+import tensorflow as tf
+import batch_reader
+import data
+import seq2seq_attention_model
+
+FLAGS = tf.app.flags.FLAGS
+tf.app.flags.DEFINE_string('data_path',
+                           '', 'Path expression to tf.Example.')
+tf.app.flags.DEFINE_string('vocab_path',
+                           '', 'Path expression to text vocabulary file.')
+tf.app.flags.DEFINE_string('article_key', 'article',
+                           'tf.Example feature key for article.')
+tf.app.flags.DEFINE_string('abstract_key', 'headline',
+                           'tf.Example feature key for abstract.')
+tf.app.flags.DEFINE_integer('max_article_sentences', 2,
+                            'Max number of first sentences to use from the '
+                            'article')
+tf.app.flags.DEFINE_integer('max_abstract_sentences', 100,
+                            'Max number of first sentences to use from the '
+                            'abstract')
+tf.app.flags.DEFINE_integer('batch_size', 64, 'Examples per batch.')
+tf.app.flags.DEFINE_integer('warmup_batches', 20,
+                            'Batches read before timing starts.')
+tf.app.flags.DEFINE_integer('num_batches', 500, 'Batches to time.')
+tf.app.flags.DEFINE_bool('use_bucketing', True,
+                         'Whether bucket articles of similar length.')
+tf.app.flags.DEFINE_bool('truncate_input', True,
+                         'Truncate inputs that are too long. If False, '
+                         'examples that are too long are discarded.')
+
+
+def _Benchmark(name, batcher, batch_size):
+  """Times NextBatch() calls and logs examples/sec."""
+  for _ in xrange(FLAGS.warmup_batches):
+    batcher.NextBatch()
+  start = time.time()
+  for _ in xrange(FLAGS.num_batches):
+    batcher.NextBatch()
+  elapsed = time.time() - start
+  tf.logging.info('%s: %d batches in %.2f secs, %.1f examples/sec', name,
+                  FLAGS.num_batches, elapsed,
+                  FLAGS.num_batches * batch_size / elapsed)
+
+
+def main(unused_argv):
+  vocab = data.Vocab(FLAGS.vocab_path, 1000000)
+  hps = seq2seq_attention_model.HParams(
+      mode='train',
+      min_lr=0.01,
+      lr=0.15,
+      batch_size=FLAGS.batch_size,
+      enc_layers=4,
+      enc_timesteps=120,
+      dec_timesteps=30,
+      min_input_len=2,
+      num_hidden=256,
+      emb_dim=128,
+      max_grad_norm=2,
+      num_softmax_samples=4096)
+  for name, batcher_cls in [('Batcher', batch_reader.Batcher),
+                            ('DatasetBatcher', batch_reader.DatasetBatcher)]:
+    batcher = batcher_cls(
+        FLAGS.data_path, vocab, hps, FLAGS.article_key,
+        FLAGS.abstract_key, FLAGS.max_article_sentences,
+        FLAGS.max_abstract_sentences, bucketing=FLAGS.use_bucketing,
+        truncate_input=FLAGS.truncate_input)
+    _Benchmark(name, batcher, hps.batch_size)
+
+
+if __name__ == '__main__':
+  tf.logging.set_verbosity(tf.logging.INFO)
+  tf.app.run()
@@ -0,0 +1,82 @@
+# Copyright 2016 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+
+"""Tests for batch_reader."""
+
+import os
+import struct
+
+import tensorflow as tf
+from tensorflow.core.example import example_pb2
+
+import batch_reader
+import data
+import seq2seq_attention_model
+
+_ARTICLE = ('<d> <p> <s> the cat sat on the mat . </s> '
+            '<s> it was a sunny day . </s> <s> the dog barked . </s> </p> </d>')
+_ABSTRACT = '<d> <p> <s> cat on mat . </s> <s> sunny . </s> </p> </d>'
+
+
+class BatchReaderTest(tf.test.TestCase):
+
+  def setUp(self):
+    super(BatchReaderTest, self).setUp()
+    words = [data.PAD_TOKEN, data.UNKNOWN_TOKEN, data.SENTENCE_START,
+             data.SENTENCE_END, 'the', 'cat', 'sat', 'on', 'mat', '.', 'it',
+             'was', 'a', 'day']
+    vocab_file = os.path.join(self.get_temp_dir(), 'vocab')
+    with open(vocab_file, 'w') as f:
+      for word in words:
+        f.write('%s 1\n' % word)
+    self._vocab = data.Vocab(vocab_file, 100)
+
+    example = example_pb2.Example()
+    example.features.feature['article'].bytes_list.value.append(
+        tf.compat.as_bytes(_ARTICLE))
+    example.features.feature['abstract'].bytes_list.value.append(
+        tf.compat.as_bytes(_ABSTRACT))
+    example_str = example.SerializeToString()
+    self._data_path = os.path.join(self.get_temp_dir(), 'data')
+    with open(self._data_path, 'wb') as f:
+      f.write(struct.pack('q', len(example_str)))
+      f.write(struct.pack('%ds' % len(example_str), example_str))
+
+    self._hps = seq2seq_attention_model.HParams(
+        mode='train', min_lr=0.01, lr=0.15, batch_size=2, enc_layers=1,
+        enc_timesteps=20, dec_timesteps=10, min_input_len=2, num_hidden=8,
+        emb_dim=8, max_grad_norm=2, num_softmax_samples=0)
+
+  def testDatasetBatcherMatchesBatcher(self):
+    args = (self._data_path, self._vocab, self._hps, 'article', 'abstract', 2,
+            1)
+    expected = batch_reader.Batcher(*args, bucketing=False).NextBatch()
+    batch = batch_reader.DatasetBatcher(*args, bucketing=False).NextBatch()
+
+    self.assertEqual(len(expected), len(batch))
+    for expected_array, array in zip(expected[:6], batch[:6]):
+      self.assertAllEqual(expected_array, array)
+    # The original texts hold all the sentences, not only the ones fed to the
+    # model.
+    for expected_texts, texts in zip(expected[6:], batch[6:]):
+      self.assertEqual([tf.compat.as_bytes(t) for t in expected_texts],
+                       [tf.compat.as_bytes(t) for t in texts])
+    self.assertEqual(tf.compat.as_bytes(
+        'the cat sat on the mat . it was a sunny day . the dog barked .'),
+                     tf.compat.as_bytes(batch[6][0]))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -91,6 +91,22 @@ def ExampleGen(data_path, num_epochs=None):
 
   If there are multiple files specified, they accessed in a random order.
   """
+  for example_str in SerializedExampleGen(data_path, num_epochs):
+    yield example_pb2.Example.FromString(example_str)
+
+
+def SerializedExampleGen(data_path, num_epochs=None):
+  """Generates serialized tf.Examples from path of data files.
+
+  Same as ExampleGen, but does not deserialize the tf.Example protos.
+
+  Args:
+    data_path: path to tf.Example data files.
+    num_epochs: Number of times to go through the data. None means infinite.
+
+  Yields:
+    Serialized tf.Example strings.
+  """
   epoch = 0
   while True:
     if num_epochs is not None and epoch >= num_epochs:
@@ -104,8 +120,7 @@ def ExampleGen(data_path, num_epochs=None):
         len_bytes = reader.read(8)
         if not len_bytes: break
         str_len = struct.unpack('q', len_bytes)[0]
-        example_str = struct.unpack('%ds' % str_len, reader.read(str_len))[0]
-        yield example_pb2.Example.FromString(example_str)
+        yield struct.unpack('%ds' % str_len, reader.read(str_len))[0]
 
     epoch += 1
 
@@ -193,8 +208,8 @@ def SnippetGen(text, start_tok, end_tok, inclusive=True):
         yield text[start_p:cur]
       else:
         yield text[start_p+len(start_tok):end_p]
-    except ValueError as e:
-      raise StopIteration('no more snippets in text: %s' % e)
+    except ValueError:
+      return
 
 
 def GetExFeatureText(ex, key):
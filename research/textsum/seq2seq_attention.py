@@ -61,6 +61,9 @@ tf.app.flags.DEFINE_bool('use_bucketing', False,
 tf.app.flags.DEFINE_bool('truncate_input', False,
                          'Truncate inputs that are too long. If False, '
                          'examples that are too long are discarded.')
+tf.app.flags.DEFINE_string('input_pipeline', 'threads',
+                           'threads: Python thread based Batcher. dataset: '
+                           'tf.data based DatasetBatcher.')
 tf.app.flags.DEFINE_integer('num_gpus', 0, 'Number of gpus used.')
 tf.app.flags.DEFINE_integer('random_seed', 111, 'A seed value for randomness.')
 
@@ -183,7 +186,11 @@ def main(unused_argv):
       max_grad_norm=2,
       num_softmax_samples=4096)  # If 0, no sampled softmax.
 
-  batcher = batch_reader.Batcher(
+  if FLAGS.input_pipeline == 'dataset':
+    batcher_cls = batch_reader.DatasetBatcher
+  else:
+    batcher_cls = batch_reader.Batcher
+  batcher = batcher_cls(
       FLAGS.data_path, vocab, hps, FLAGS.article_key,
       FLAGS.abstract_key, FLAGS.max_article_sentences,
       FLAGS.max_abstract_sentences, bucketing=FLAGS.use_bucketing,
@@ -0,0 +1,170 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Writes numpy arrays as TFRecord shards or fixed length records.
+
+The arrays are given as a dict from feature name to numpy array, whose first
+dimension indexes the examples:
+
+  arrays = {'image': images, 'label': labels}
+
+write_tfrecord_shards() stores example i as a tf.train.Example with one
+feature per array: integer arrays of rank 1 become int64 features, float
+arrays of rank 1 float features, and the rows of other arrays are stored as
+raw bytes. The examples are built by worker processes, one shard at a time.
+
+write_fixed_length_records() stores the raw bytes of each example back to
+back, with every array converted to uint8 first. All the records then have
+the same length, so the file can be read with
+tf.contrib.data.FixedLengthRecordDataset or memory-mapped with
+read_fixed_length_records().
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+import os
+
+import numpy as np
+import tensorflow as tf
+
+
+def shard_filenames(output_prefix, num_shards):
+  """Returns the names of the TFRecord shards written for output_prefix."""
+  if num_shards == 1:
+    return [output_prefix + '.tfrecords']
+  return ['%s-%.5d-of-%.5d.tfrecords' % (output_prefix, shard, num_shards)
+          for shard in range(num_shards)]
+
+
+def _feature(value):
+  if value.ndim == 0 and np.issubdtype(value.dtype, np.integer):
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
+  if value.ndim == 0 and np.issubdtype(value.dtype, np.floating):
+    return tf.train.Feature(float_list=tf.train.FloatList(value=[value]))
+  return tf.train.Feature(
+      bytes_list=tf.train.BytesList(value=[value.tobytes()]))
+
+
+def _write_tfrecord_shard(args):
+  """Builds the examples of one shard and writes them, in a worker process."""
+  output_file, arrays = args
+  names = sorted(arrays)
+  num_examples = len(arrays[names[0]])
+  with tf.python_io.TFRecordWriter(output_file + '.tmp') as record_writer:
+    for i in range(num_examples):
+      example = tf.train.Example(features=tf.train.Features(feature={
+          name: _feature(arrays[name][i]) for name in names}))
+      record_writer.write(example.SerializeToString())
+  tf.gfile.Rename(output_file + '.tmp', output_file, overwrite=True)
+  return output_file, num_examples
+
+
+def _check_arrays(arrays):
+  lengths = set(len(array) for array in arrays.values())
+  if len(lengths) != 1:
+    raise ValueError('The arrays must have the same first dimension.')
+  return lengths.pop()
+
+
+def write_tfrecord_shards(output_prefix, arrays, num_shards=1,
+                          num_processes=None):
+  """Writes numpy arrays as shards of tf.train.Example TFRecords.
+
+  Shard s holds examples [s * n / num_shards, (s + 1) * n / num_shards), in
+  order, where n is the number of examples.
+
+  Args:
+    output_prefix: Path prefix of the shards. A single shard is named
+      output_prefix + '.tfrecords', and several shards e.g.
+      output_prefix + '-00001-of-00004.tfrecords'.
+    arrays: Dict from feature name to numpy array of examples.
+    num_shards: Number of shards to write.
+    num_processes: Number of worker processes building the examples.
+      Defaults to the number of CPUs.
+
+  Returns:
+    The list of the written files.
+
+  Raises:
+    ValueError: If the arrays have different numbers of examples.
+  """
+  num_examples = _check_arrays(arrays)
+  filenames = shard_filenames(output_prefix, num_shards)
+  bounds = np.linspace(0, num_examples, num_shards + 1).astype(int)
+  tasks = [(filename, {name: array[bounds[s]:bounds[s + 1]]
+                       for name, array in arrays.items()})
+           for s, filename in enumerate(filenames)]
+  pool = multiprocessing.Pool(min(num_processes or multiprocessing.cpu_count(),
+                                  num_shards))
+  for output_file, shard_examples in pool.imap_unordered(
+      _write_tfrecord_shard, tasks):
+    print('Wrote %d examples to %s' % (shard_examples, output_file))
+  pool.close()
+  pool.join()
+  return filenames
+
+
+def write_fixed_length_records(output_file, arrays, names):
+  """Writes numpy arrays as records of fixed length.
+
+  Each record holds the bytes of one example of each array, in the order of
+  names, after converting the values to uint8.
+
+  Args:
+    output_file: Path of the file to write.
+    arrays: Dict from feature name to numpy array of examples. The values
+      must be in [0, 255].
+    names: Order of the arrays in a record.
+
+  Raises:
+    ValueError: If the arrays have different numbers of examples, or values
+      outside [0, 255].
+  """
+  num_examples = _check_arrays(arrays)
+  columns = []
+  for name in names:
+    array = arrays[name].reshape(num_examples, -1)
+    if array.size and (array.min() < 0 or array.max() > 255):
+      raise ValueError('%s does not fit in uint8.' % name)
+    columns.append(array.astype(np.uint8))
+  records = np.concatenate(columns, axis=1)
+  with tf.gfile.Open(output_file + '.tmp', 'wb') as f:
+    f.write(records.tobytes())
+  tf.gfile.Rename(output_file + '.tmp', output_file, overwrite=True)
+  print('Wrote %d examples of %d bytes to %s' %
+        (num_examples, records.shape[1], output_file))
+
+
+def read_fixed_length_records(filename, record_bytes):
+  """Memory-maps a file of fixed length records.
+
+  Args:
+    filename: Path of a local file written by write_fixed_length_records.
+    record_bytes: Length of each record.
+
+  Returns:
+    A read-only uint8 numpy memmap of shape [num_records, record_bytes].
+
+  Raises:
+    ValueError: If the file size is not a multiple of record_bytes.
+  """
+  num_records, remainder = divmod(os.path.getsize(filename), record_bytes)
+  if remainder:
+    raise ValueError('%s is not made of %d byte records.' %
+                     (filename, record_bytes))
+  return np.memmap(filename, dtype=np.uint8, mode='r',
+                   shape=(num_records, record_bytes))
@@ -24,6 +24,14 @@ HEIGHT = 32
 WIDTH = 32
 DEPTH = 3
 
+# Length of a record of the fixed length format: a label byte followed by the
+# image bytes, as in the binary version of CIFAR-10.
+LABEL_BYTES = 1
+RECORD_BYTES = LABEL_BYTES + HEIGHT * WIDTH * DEPTH
+
+# Formats of the data files written by generate_cifar10_tfrecords.py.
+RECORD_FORMATS = ('tfrecord', 'fixed_length')
+
 
 class Cifar10DataSet(object):
   """Cifar10 data set.
@@ -31,16 +39,27 @@ class Cifar10DataSet(object):
   Described by http://www.cs.toronto.edu/~kriz/cifar.html.
   """
 
-  def __init__(self, data_dir, subset='train', use_distortion=True):
+  def __init__(self, data_dir, subset='train', use_distortion=True,
+               record_format='tfrecord'):
+    if record_format not in RECORD_FORMATS:
+      raise ValueError('Invalid record format "%s"' % record_format)
     self.data_dir = data_dir
     self.subset = subset
     self.use_distortion = use_distortion
+    self.record_format = record_format
 
   def get_filenames(self):
-    if self.subset in ['train', 'validation', 'eval']:
-      return [os.path.join(self.data_dir, self.subset + '.tfrecords')]
-    else:
+    """Returns the data files of the subset.
+
+    These are either <subset>.tfrecords or its shards, or <subset>.bin.
+    """
+    if self.subset not in ['train', 'validation', 'eval']:
       raise ValueError('Invalid data subset "%s"' % self.subset)
+    prefix = os.path.join(self.data_dir, self.subset)
+    if self.record_format == 'fixed_length':
+      return [prefix + '.bin']
+    shards = sorted(tf.gfile.Glob(prefix + '-*-of-*.tfrecords'))
+    return shards or [prefix + '.tfrecords']
 
   def parser(self, serialized_example):
     """Parses a single tf.Example into image and label tensors."""
@@ -54,13 +73,23 @@ class Cifar10DataSet(object):
             'label': tf.FixedLenFeature([], tf.int64),
         })
     image = tf.decode_raw(features['image'], tf.uint8)
+    label = tf.cast(features['label'], tf.int32)
+    return self._reshape_and_preprocess(image, label)
+
+  def fixed_length_parser(self, record):
+    """Parses a fixed length record into image and label tensors."""
+    record = tf.decode_raw(record, tf.uint8)
+    label = tf.cast(record[0], tf.int32)
+    image = record[LABEL_BYTES:]
+    return self._reshape_and_preprocess(image, label)
+
+  def _reshape_and_preprocess(self, image, label):
     image.set_shape([DEPTH * HEIGHT * WIDTH])
 
     # Reshape from [depth * height * width] to [depth, height, width].
     image = tf.cast(
         tf.transpose(tf.reshape(image, [DEPTH, HEIGHT, WIDTH]), [1, 2, 0]),
         tf.float32)
-    label = tf.cast(features['label'], tf.int32)
 
     # Custom preprocessing.
     image = self.preprocess(image)
@@ -71,11 +100,17 @@ class Cifar10DataSet(object):
     """Read the images and labels from 'filenames'."""
     filenames = self.get_filenames()
     # Repeat infinitely.
-    dataset = tf.contrib.data.TFRecordDataset(filenames).repeat()
+    if self.record_format == 'fixed_length':
+      dataset = tf.contrib.data.FixedLengthRecordDataset(
+          filenames, RECORD_BYTES).repeat()
+      parser = self.fixed_length_parser
+    else:
+      dataset = tf.contrib.data.TFRecordDataset(filenames).repeat()
+      parser = self.parser
 
     # Parse records.
     dataset = dataset.map(
-        self.parser, num_threads=batch_size, output_buffer_size=2 * batch_size)
+        parser, num_threads=batch_size, output_buffer_size=2 * batch_size)
 
     # Potentially shuffle records.
     if self.subset == 'train':
@@ -254,7 +254,8 @@ def input_fn(data_dir,
              subset,
              num_shards,
              batch_size,
-             use_distortion_for_training=True):
+             use_distortion_for_training=True,
+             record_format='tfrecord'):
   """Create input graph for model.
 
   Args:
@@ -264,12 +265,14 @@ def input_fn(data_dir,
     batch_size: total batch size for training to be divided by the number of
     shards.
     use_distortion_for_training: True to use distortions.
+    record_format: format of the data files, see cifar10.RECORD_FORMATS.
   Returns:
     two lists of tensors for features and labels, each of num_shards length.
   """
   with tf.device('/cpu:0'):
     use_distortion = subset == 'train' and use_distortion_for_training
-    dataset = cifar10.Cifar10DataSet(data_dir, subset, use_distortion)
+    dataset = cifar10.Cifar10DataSet(data_dir, subset, use_distortion,
+                                     record_format)
     image_batch, label_batch = dataset.make_batch(batch_size)
     if num_shards <= 1:
       # No GPU available or only 1 GPU.
@@ -295,7 +298,8 @@ def input_fn(data_dir,
 def get_experiment_fn(data_dir,
                       num_gpus,
                       variable_strategy,
-                      use_distortion_for_training=True):
+                      use_distortion_for_training=True,
+                      record_format='tfrecord'):
   """Returns an Experiment function.
 
   Experiments perform training on several workers in parallel,
@@ -310,6 +314,7 @@ def get_experiment_fn(data_dir,
       variable_strategy: String. CPU to use CPU as the parameter server
       and GPU to use the GPUs as the parameter server.
       use_distortion_for_training: bool. See cifar10.Cifar10DataSet.
+      record_format: String. See cifar10.Cifar10DataSet.
   Returns:
       A function (tf.estimator.RunConfig, tf.contrib.training.HParams) ->
       tf.contrib.learn.Experiment.
@@ -328,14 +333,16 @@ def get_experiment_fn(data_dir,
         subset='train',
         num_shards=num_gpus,
         batch_size=hparams.train_batch_size,
-        use_distortion_for_training=use_distortion_for_training)
+        use_distortion_for_training=use_distortion_for_training,
+        record_format=record_format)
 
     eval_input_fn = functools.partial(
         input_fn,
         data_dir,
         subset='eval',
         batch_size=hparams.eval_batch_size,
-        num_shards=num_gpus)
+        num_shards=num_gpus,
+        record_format=record_format)
 
     num_eval_examples = cifar10.Cifar10DataSet.num_examples_per_epoch('eval')
     if num_eval_examples % hparams.eval_batch_size != 0:
@@ -364,7 +371,7 @@ def get_experiment_fn(data_dir,
 
 def main(job_dir, data_dir, num_gpus, variable_strategy,
          use_distortion_for_training, log_device_placement, num_intra_threads,
-         **hparams):
+         record_format, **hparams):
   # The env variable is on deprecation path, default is set to off.
   os.environ['TF_SYNC_ON_FINISH'] = '0'
   os.environ['TF_ENABLE_WINOGRAD_NONFUSED'] = '1'
@@ -380,7 +387,7 @@ def main(job_dir, data_dir, num_gpus, variable_strategy,
       session_config=sess_config, model_dir=job_dir)
   tf.contrib.learn.learn_runner.run(
       get_experiment_fn(data_dir, num_gpus, variable_strategy,
-                        use_distortion_for_training),
+                        use_distortion_for_training, record_format),
       run_config=config,
       hparams=tf.contrib.training.HParams(
           is_chief=config.is_chief,
@@ -486,6 +493,15 @@ if __name__ == '__main__':
       If not set, the data format best for the training device is used. 
       Allowed values: channels_first (NCHW) channels_last (NHWC).\
       """)
+  parser.add_argument(
+      '--record-format',
+      choices=cifar10.RECORD_FORMATS,
+      type=str,
+      default='tfrecord',
+      help="""\
+      Format of the input data: tfrecord reads <subset>.tfrecords or its
+      shards, fixed_length reads <subset>.bin.\
+      """)
   parser.add_argument(
       '--log-device-placement',
       action='store_true',
@@ -17,6 +17,11 @@
 Generates tf.train.Example protos and writes them to TFRecord files from the
 python version of the CIFAR-10 dataset downloaded from
 https://www.cs.toronto.edu/~kriz/cifar.html.
+
+With --num-shards, each subset is split into several TFRecord files, which are
+written in parallel. With --fixed-length-records, each subset is also written
+as <subset>.bin in the CIFAR-10 binary format: one label byte followed by the
+3072 image bytes per record.
 """
 
 from __future__ import absolute_import
@@ -27,10 +32,13 @@ import argparse
 import os
 
 import tarfile
+import numpy as np
 from six.moves import cPickle as pickle
 from six.moves import xrange  # pylint: disable=redefined-builtin
 import tensorflow as tf
 
+import array_records
+
 CIFAR_FILENAME = 'cifar-10-python.tar.gz'
 CIFAR_DOWNLOAD_URL = 'https://www.cs.toronto.edu/~kriz/' + CIFAR_FILENAME
 CIFAR_LOCAL_FOLDER = 'cifar-10-batches-py'
@@ -44,14 +52,6 @@ def download_and_extract(data_dir):
                'r:gz').extractall(data_dir)
 
 
-def _int64_feature(value):
-  return tf.train.Feature(int64_list=tf.train.Int64List(value=[value]))
-
-
-def _bytes_feature(value):
-  return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
-
-
 def _get_file_names():
   """Returns the file names expected to exist in the input_dir."""
   file_names = {}
@@ -67,38 +67,37 @@ def read_pickle_from_file(filename):
   return data_dict
 
 
-def convert_to_tfrecord(input_files, output_file):
-  """Converts a file to TFRecords."""
-  print('Generating %s' % output_file)
-  with tf.python_io.TFRecordWriter(output_file) as record_writer:
-    for input_file in input_files:
-      data_dict = read_pickle_from_file(input_file)
-      data = data_dict['data']
-      labels = data_dict['labels']
-      num_entries_in_batch = len(labels)
-      for i in range(num_entries_in_batch):
-        example = tf.train.Example(features=tf.train.Features(
-            feature={
-                'image': _bytes_feature(data[i].tobytes()),
-                'label': _int64_feature(labels[i])
-            }))
-        record_writer.write(example.SerializeToString())
-
-
-def main(data_dir):
+def read_arrays(input_files):
+  """Reads the images and labels of pickled batch files into numpy arrays."""
+  data = []
+  labels = []
+  for input_file in input_files:
+    data_dict = read_pickle_from_file(input_file)
+    data.append(data_dict['data'])
+    labels.append(np.asarray(data_dict['labels'], dtype=np.int64))
+  return {'image': np.concatenate(data), 'label': np.concatenate(labels)}
+
+
+def main(data_dir, num_shards, num_processes, fixed_length_records):
   print('Download from {} and extract.'.format(CIFAR_DOWNLOAD_URL))
   download_and_extract(data_dir)
   file_names = _get_file_names()
   input_dir = os.path.join(data_dir, CIFAR_LOCAL_FOLDER)
   for mode, files in file_names.items():
     input_files = [os.path.join(input_dir, f) for f in files]
-    output_file = os.path.join(data_dir, mode + '.tfrecords')
-    try:
-      os.remove(output_file)
-    except OSError:
-      pass
+    output_prefix = os.path.join(data_dir, mode)
+    # Remove the files of a previous run, which may have other shards.
+    for output_file in (tf.gfile.Glob(output_prefix + '.tfrecords') +
+                        tf.gfile.Glob(output_prefix + '-*-of-*.tfrecords')):
+      tf.gfile.Remove(output_file)
+    arrays = read_arrays(input_files)
     # Convert to tf.train.Example and write the to TFRecords.
-    convert_to_tfrecord(input_files, output_file)
+    print('Generating %s' % output_prefix)
+    array_records.write_tfrecord_shards(output_prefix, arrays, num_shards,
+                                        num_processes)
+    if fixed_length_records:
+      array_records.write_fixed_length_records(
+          output_prefix + '.bin', arrays, names=['label', 'image'])
   print('Done!')
 
 
@@ -109,6 +108,23 @@ if __name__ == '__main__':
       type=str,
       default='',
       help='Directory to download and extract CIFAR-10 to.')
+  parser.add_argument(
+      '--num-shards',
+      type=int,
+      default=1,
+      help='Number of TFRecord files written for each subset.')
+  parser.add_argument(
+      '--num-processes',
+      type=int,
+      default=None,
+      help='Number of processes writing the shards. Defaults to the number '
+      'of CPUs.')
+  parser.add_argument(
+      '--fixed-length-records',
+      action='store_true',
+      default=False,
+      help='Also write each subset as fixed length records in <subset>.bin.')
 
   args = parser.parse_args()
-  main(args.data_dir)
+  main(args.data_dir, args.num_shards, args.num_processes,
+       args.fixed_length_records)
@@ -0,0 +1,104 @@
+# Copyright 2017 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Measures the input throughput of the CIFAR-10 data formats.
+
+Times Cifar10DataSet.make_batch() on the TFRecord and the fixed length files
+written by generate_cifar10_tfrecords.py, and the gathering of random batches
+from the memory-mapped fixed length file, e.g.
+
+  python generate_cifar10_tfrecords.py --data-dir=${PWD}/cifar-10-data \\
+      --num-shards=8 --fixed-length-records
+  python input_benchmark.py --data-dir=${PWD}/cifar-10-data
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+import time
+
+import numpy as np
+from six.moves import xrange  # pylint: disable=redefined-builtin
+import tensorflow as tf
+
+import array_records
+import cifar10
+
+
+def benchmark_dataset(data_dir, subset, record_format, batch_size,
+                      num_batches):
+  """Returns the examples/sec of Cifar10DataSet.make_batch()."""
+  with tf.Graph().as_default():
+    dataset = cifar10.Cifar10DataSet(data_dir, subset, use_distortion=True,
+                                     record_format=record_format)
+    image_batch, label_batch = dataset.make_batch(batch_size)
+    with tf.Session() as sess:
+      # Warm up the pipeline, and fill the shuffle buffer of the train subset.
+      sess.run([image_batch, label_batch])
+      start = time.time()
+      for _ in xrange(num_batches):
+        sess.run([image_batch, label_batch])
+      return num_batches * batch_size / (time.time() - start)
+
+
+def benchmark_memmap(data_dir, subset, batch_size, num_batches):
+  """Returns the examples/sec of gathering batches from the memory map."""
+  records = array_records.read_fixed_length_records(
+      os.path.join(data_dir, subset + '.bin'), cifar10.RECORD_BYTES)
+  start = time.time()
+  for _ in xrange(num_batches):
+    batch = records[np.random.randint(0, len(records), size=batch_size)]
+    batch[:, 0].astype(np.int32)
+    batch[:, cifar10.LABEL_BYTES:].reshape(
+        [batch_size, cifar10.DEPTH, cifar10.HEIGHT, cifar10.WIDTH]).transpose(
+            [0, 2, 3, 1]).astype(np.float32)
+  return num_batches * batch_size / (time.time() - start)
+
+
+def main(data_dir, subset, batch_size, num_batches):
+  for record_format in cifar10.RECORD_FORMATS:
+    print('%-12s %10.0f examples/sec' % (
+        record_format, benchmark_dataset(data_dir, subset, record_format,
+                                         batch_size, num_batches)))
+  print('%-12s %10.0f examples/sec (numpy only, no distortion)' % (
+      'memmap', benchmark_memmap(data_dir, subset, batch_size, num_batches)))
+
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+      '--data-dir',
+      type=str,
+      required=True,
+      help='The directory where the CIFAR-10 input data is stored.')
+  parser.add_argument(
+      '--subset',
+      type=str,
+      default='train',
+      help='The subset to read.')
+  parser.add_argument(
+      '--batch-size',
+      type=int,
+      default=128,
+      help='Batch size.')
+  parser.add_argument(
+      '--num-batches',
+      type=int,
+      default=500,
+      help='Number of batches timed for each format.')
+  args = parser.parse_args()
+  main(**vars(args))
@@ -77,6 +77,10 @@ flags.DEFINE_string(
     "A type of model. Possible options are: small, medium, large.")
 flags.DEFINE_string("data_path", None,
                     "Where the training/test data is stored.")
+flags.DEFINE_string("cache_path", None,
+                    "Optional local directory where the vocabulary and word "
+                    "ids of the data are cached, to skip parsing the text "
+                    "files on later runs.")
 flags.DEFINE_string("save_path", None,
                     "Model output directory.")
 flags.DEFINE_bool("use_fp16", False,
@@ -453,7 +457,7 @@ def main(_):
         "which is less than the requested --num_gpus=%d."
         % (len(gpus), FLAGS.num_gpus))
 
-  raw_data = reader.ptb_raw_data(FLAGS.data_path)
+  raw_data = reader.ptb_raw_data(FLAGS.data_path, FLAGS.cache_path)
   train_data, valid_data, test_data, _ = raw_data
 
   config = get_config()
@@ -14,7 +14,12 @@
 # ==============================================================================
 
 
-"""Utilities for parsing PTB text files."""
+"""Utilities for parsing PTB text files.
+
+ptb_raw_data() can cache the vocabulary and the word ids of a corpus, so that
+later runs do not parse the text files again. The word ids are stored as raw
+int32 files, which are memory-mapped rather than loaded in memory.
+"""
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
@@ -23,10 +28,19 @@ import collections
 import os
 import sys
 
+import numpy as np
 import tensorflow as tf
 
 Py3 = sys.version_info[0] == 3
 
+# Names of the files written in the cache directory.
+_VOCAB_FILENAME = "vocab.txt"
+_IDS_FILENAME = "ptb.%s.ids"
+
+# Number of word ids buffered before being written to an ids file.
+_WRITE_CHUNK_SIZE = 1 << 20
+
+
 def _read_words(filename):
   with tf.gfile.GFile(filename, "r") as f:
     if Py3:
@@ -35,10 +49,27 @@ def _read_words(filename):
       return f.read().decode("utf-8").replace("\n", "<eos>").split()
 
 
-def _build_vocab(filename):
-  data = _read_words(filename)
+def _iter_words(filename):
+  """Yields the words of _read_words(filename), reading one line at a time."""
+  with tf.gfile.GFile(filename, "r") as f:
+    partial_word = ""
+    for line in f:
+      if not Py3:
+        line = line.decode("utf-8")
+      line = line.replace("\n", "<eos>")
+      words = (partial_word + line).split()
+      # The last word continues on the next line unless whitespace ends it.
+      partial_word = ""
+      if words and not line[-1:].isspace():
+        partial_word = words.pop()
+      for word in words:
+        yield word
+    if partial_word:
+      yield partial_word
 
-  counter = collections.Counter(data)
+
+def _build_vocab(filename):
+  counter = collections.Counter(_iter_words(filename))
   count_pairs = sorted(counter.items(), key=lambda x: (-x[1], x[0]))
 
   words, _ = list(zip(*count_pairs))
@@ -52,7 +83,62 @@ def _file_to_word_ids(filename, word_to_id):
   return [word_to_id[word] for word in data if word in word_to_id]
 
 
-def ptb_raw_data(data_path=None):
+def _write_vocab(word_to_id, filename):
+  words = sorted(word_to_id, key=word_to_id.get)
+  with tf.gfile.GFile(filename, "w") as f:
+    f.write("".join(word + "\n" for word in words))
+
+
+def _read_vocab(filename):
+  with tf.gfile.GFile(filename, "r") as f:
+    words = f.read().split("\n")[:-1]
+  if not Py3:
+    words = [word.decode("utf-8") for word in words]
+  return dict(zip(words, range(len(words))))
+
+
+def _write_word_ids(text_filename, word_to_id, ids_filename):
+  """Writes the word ids of a text file as raw int32 values."""
+  with tf.gfile.GFile(ids_filename, "wb") as f:
+    ids = []
+    for word in _iter_words(text_filename):
+      if word in word_to_id:
+        ids.append(word_to_id[word])
+        if len(ids) == _WRITE_CHUNK_SIZE:
+          f.write(np.array(ids, dtype=np.int32).tobytes())
+          ids = []
+    f.write(np.array(ids, dtype=np.int32).tobytes())
+
+
+def _cached_raw_data(data_path, cache_path):
+  """Returns the memory-mapped word ids of the corpus, caching them first."""
+  vocab_path = os.path.join(cache_path, _VOCAB_FILENAME)
+  splits = ("train", "valid", "test")
+  # The vocabulary is written last, so its presence means the cache is done.
+  if not tf.gfile.Exists(vocab_path):
+    tf.gfile.MakeDirs(cache_path)
+    word_to_id = _build_vocab(os.path.join(data_path, "ptb.train.txt"))
+    for split in splits:
+      _write_word_ids(os.path.join(data_path, "ptb.%s.txt" % split),
+                      word_to_id,
+                      os.path.join(cache_path, _IDS_FILENAME % split))
+    _write_vocab(word_to_id, vocab_path + ".tmp")
+    tf.gfile.Rename(vocab_path + ".tmp", vocab_path, overwrite=True)
+  else:
+    word_to_id = _read_vocab(vocab_path)
+
+  data = []
+  for split in splits:
+    ids_path = os.path.join(cache_path, _IDS_FILENAME % split)
+    if os.path.getsize(ids_path):
+      data.append(np.memmap(ids_path, dtype=np.int32, mode="r"))
+    else:
+      # np.memmap cannot map empty files.
+      data.append(np.zeros(0, dtype=np.int32))
+  return tuple(data) + (len(word_to_id),)
+
+
+def ptb_raw_data(data_path=None, cache_path=None):
   """Load PTB raw data from data directory "data_path".
 
   Reads PTB text files, converts strings to integer ids,
@@ -65,11 +151,19 @@ def ptb_raw_data(data_path=None):
   Args:
     data_path: string path to the directory where simple-examples.tgz has
       been extracted.
+    cache_path: optional string path to a local directory where the
+      vocabulary and the word ids are cached. If it does not contain a cache
+      yet, one is built from the files in data_path. Delete the directory to
+      rebuild the cache after the data changes.
 
   Returns:
     tuple (train_data, valid_data, test_data, vocabulary)
-    where each of the data objects can be passed to PTBIterator.
+    where each of the data objects can be passed to PTBIterator. With
+    cache_path, the data objects are read-only int32 numpy memmaps instead of
+    lists.
   """
+  if cache_path:
+    return _cached_raw_data(data_path, cache_path)
 
   train_path = os.path.join(data_path, "ptb.train.txt")
   valid_path = os.path.join(data_path, "ptb.valid.txt")
@@ -125,3 +219,40 @@ def ptb_producer(raw_data, batch_size, num_steps, name=None):
                          [batch_size, (i + 1) * num_steps + 1])
     y.set_shape([batch_size, num_steps])
     return x, y
+
+
+def ptb_dataset(raw_data, batch_size, num_steps):
+  """Iterate on the raw PTB data with a tf.data pipeline.
+
+  Produces the same batches as one epoch of ptb_producer, but reads them from
+  raw_data as they are needed instead of copying raw_data into the graph, so
+  that memory-mapped data is never fully loaded.
+
+  Args:
+    raw_data: one of the raw data outputs from ptb_raw_data.
+    batch_size: int, the batch size.
+    num_steps: int, the number of unrolls.
+
+  Returns:
+    A tf.data.Dataset of pairs of int32 Tensors, each shaped
+    [batch_size, num_steps]. The second element of the pair is the same data
+    time-shifted to the right by one.
+
+  Raises:
+    ValueError: if batch_size or num_steps are too high.
+  """
+  raw_data = np.asarray(raw_data, dtype=np.int32)
+  batch_len = len(raw_data) // batch_size
+  epoch_size = (batch_len - 1) // num_steps
+  if epoch_size <= 0:
+    raise ValueError("epoch_size == 0, decrease batch_size or num_steps")
+  data = raw_data[0 : batch_size * batch_len].reshape([batch_size, batch_len])
+
+  def generator():
+    for i in range(epoch_size):
+      yield (np.array(data[:, i * num_steps:(i + 1) * num_steps]),
+             np.array(data[:, i * num_steps + 1:(i + 1) * num_steps + 1]))
+
+  shape = tf.TensorShape([batch_size, num_steps])
+  return tf.data.Dataset.from_generator(
+      generator, (tf.int32, tf.int32), (shape, shape))
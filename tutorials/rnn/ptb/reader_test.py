@@ -44,6 +44,22 @@ class PtbReaderTest(tf.test.TestCase):
     output = reader.ptb_raw_data(tmpdir)
     self.assertEqual(len(output), 4)
 
+  def testPtbRawDataCached(self):
+    tmpdir = tf.test.get_temp_dir()
+    for suffix in "train", "valid", "test":
+      filename = os.path.join(tmpdir, "ptb.%s.txt" % suffix)
+      with tf.gfile.GFile(filename, "w") as fh:
+        fh.write(self._string_data)
+    cache_path = os.path.join(tmpdir, "cache")
+    expected = reader.ptb_raw_data(tmpdir)
+    # The first call builds the cache, the second one reads it.
+    for _ in range(2):
+      output = reader.ptb_raw_data(tmpdir, cache_path=cache_path)
+      self.assertEqual(len(output), 4)
+      for data, expected_data in zip(output[:3], expected[:3]):
+        self.assertAllEqual(data, expected_data)
+      self.assertEqual(output[3], expected[3])
+
   def testPtbProducer(self):
     raw_data = [4, 3, 2, 1, 0, 5, 6, 1, 1, 1, 1, 0, 3, 4, 1]
     batch_size = 3
@@ -63,6 +79,22 @@ class PtbReaderTest(tf.test.TestCase):
         coord.request_stop()
         coord.join()
 
+  def testPtbDataset(self):
+    raw_data = [4, 3, 2, 1, 0, 5, 6, 1, 1, 1, 1, 0, 3, 4, 1]
+    batch_size = 3
+    num_steps = 2
+    dataset = reader.ptb_dataset(raw_data, batch_size, num_steps)
+    x, y = dataset.make_one_shot_iterator().get_next()
+    with self.test_session() as session:
+      xval, yval = session.run([x, y])
+      self.assertAllEqual(xval, [[4, 3], [5, 6], [1, 0]])
+      self.assertAllEqual(yval, [[3, 2], [6, 1], [0, 3]])
+      xval, yval = session.run([x, y])
+      self.assertAllEqual(xval, [[2, 1], [1, 1], [3, 4]])
+      self.assertAllEqual(yval, [[1, 0], [1, 1], [4, 1]])
+      with self.assertRaises(tf.errors.OutOfRangeError):
+        session.run(x)
+
 
 if __name__ == "__main__":
   tf.test.main()